@@ -1,17 +1,10 @@
 import streamlit as st
-from data_loder import load_all_data 
 
-# 各ビューのインポート
-from views.sales_views import show_sales_view
-from views.invenory_view import show_inventory_view
-from views.suply_chain_view import show_supply_chain_view
+import perf
 
 st.set_page_config(page_title="統合分析ダッシュボード", layout="wide")
 
-# データの読み込み
-df_sales, df_inventory, supply_chain_data = load_all_data()
-
-# サイドバー
+# サイドバー（データやグラフ描画ライブラリを読み込む前に表示する）
 st.sidebar.title("MENU")
 page = st.sidebar.radio(
     "機能を選択",
@@ -23,13 +16,51 @@ page = st.sidebar.radio(
 )
 st.sidebar.markdown("---")
 
-# 画面切り替え
-if page == "1. 売上分析 (Sales)":
-    show_sales_view(df_sales)
+# 処理時間の計測（DASHBOARD_PERF=1 のときだけ。無効時は run が None）
+run = perf.start_run(page)
+
+# データはバックグラウンドで版ごとに作り直され、各セッションは公開済みの版を読む
+# （新しい版の準備中も前の版をそのまま表示し、再実行を待たせない）
+try:
+    from data_loder import get_refresh_worker
+    from views.data_status import show_data_status
+    from views.invenory_view import INVENTORY_COLUMNS
+    from views.sales_views import SALES_COLUMNS
+    worker = get_refresh_worker((
+        ("sales", tuple(SALES_COLUMNS)), ("inventory", tuple(INVENTORY_COLUMNS)), ("demand_history", None),
+    ))
+    with perf.span("load.snapshot"):
+        snapshot = worker.current()
+    show_data_status(worker, snapshot)
+
+    # 画面切り替え（集計・インデックスのキャッシュは、このセッションが読んでいる snapshot の版をキーにする）
+    if page == "1. 売上分析 (Sales)":
+        from data_loder import SALES_INDEX_COLUMNS, frame_index
+        from views.filters import show_sidebar_filters
+        from views.sales_views import show_sales_view
+        df_sales = snapshot.data["sales"]
+        filters = show_sidebar_filters(
+            frame_index(df_sales, SALES_INDEX_COLUMNS, snapshot.version),
+            range_columns=["Date"], value_columns=["Channel", "Category"],
+        )
+        show_sales_view(df_sales, snapshot.version, filters, snapshot.data.get("sales_partitions"))
+
+    elif page == "2. 在庫分析 (Inventory)":
+        from data_loder import INVENTORY_INDEX_COLUMNS, frame_index
+        from views.filters import show_sidebar_filters
+        from views.invenory_view import show_inventory_view
+        df_inventory = snapshot.data["inventory"]
+        filters = show_sidebar_filters(
+            frame_index(df_inventory, INVENTORY_INDEX_COLUMNS, snapshot.version), value_columns=["Warehouse"]
+        )
+        show_inventory_view(df_inventory, snapshot.version, filters, snapshot.data["demand_history"])
 
-elif page == "2. 在庫分析 (Inventory)":
-    show_inventory_view(df_inventory)
+    elif page == "3. サプライチェーン (SCM)":
+        from views.suply_chain_view import show_supply_chain_view
+        show_supply_chain_view(*snapshot.data["supply_chain"], snapshot.version, df_inventory=snapshot.data["inventory"])
+finally:
+    perf.finish_run(run)
 
-elif page == "3. サプライチェーン (SCM)":
-    # ★ここを変更：新しい関数を呼び出し
-    show_supply_chain_view(*supply_chain_data)
\ No newline at end of file
+if run is not None:
+    from views.perf_panel import show_perf_panel
+    show_perf_panel(run)
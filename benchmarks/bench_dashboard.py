@@ -0,0 +1,263 @@
+"""
+ダッシュボードのヘッドレス・ベンチマーク
+
+データ読み込みと各ビューの処理を、ブラウザなしで規模別に計測する。
+段階（load / aggregate / figure / serialize / render）ごとに処理時間とピークメモリ
+（常駐メモリ RSS の増分の最大値）を記録し、JSON に保存する。--compare で前回の結果と比較できる。
+読み込んだ売上・在庫データのメモリ使用量（データセット全体と列ごと）も記録する。
+
+    python benchmarks/bench_dashboard.py --tiers demo,1m --lanes 1k --output bench_results.json
+    python benchmarks/bench_dashboard.py --compare bench_results_prev.json
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# ------------------------------------------------------------------
+# 規模の定義
+# ------------------------------------------------------------------
+SALES_TIERS = {
+    "demo": {},
+    "1m": {"years": 2, "n_channels": 100, "n_categories": 10, "n_skus": 42},     # 約 100 万行
+    "10m": {"years": 5, "n_channels": 200, "n_categories": 10, "n_skus": 84},    # 約 1000 万行
+}
+INVENTORY_TIERS = {
+    "demo": {},
+    "1m": {"n_warehouses": 200, "n_products": 5000},
+    "10m": {"n_warehouses": 500, "n_products": 20000},
+}
+LANE_TIERS = {
+    "demo": None,   # load_supply_chain_data の固定データ
+    "1k": {"n_ports": 10, "n_warehouses": 50, "n_stores": 900, "ports_per_warehouse": 2},
+    "100k": {"n_ports": 50, "n_warehouses": 500, "n_stores": 99000, "ports_per_warehouse": 2},
+}
+
+
+def rss_bytes():
+    """現在の常駐メモリ（Linux の /proc から。取得できない環境では 0）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return 0
+
+
+class PeakSampler(threading.Thread):
+    """計測中の RSS を一定間隔で読み、最大値を記録する（tracemalloc と違い処理を遅くしない）"""
+
+    def __init__(self, interval=0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = rss_bytes()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.peak = max(self.peak, rss_bytes())
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, rss_bytes())
+        return self.peak
+
+
+class Recorder:
+    """段階ごとの処理時間とピークメモリ増分を記録する"""
+
+    def __init__(self):
+        self.results = []
+        self.memory = []
+        self.columns = {}
+
+    def record_memory(self, dataset, tier, df):
+        """読み込んだ DataFrame のメモリ使用量（データセット全体と列ごと）を記録する"""
+        import data_loder as dl
+
+        row = dl.memory_report({dataset: df}).iloc[0].to_dict()
+        self.memory.append({"dataset": dataset, "tier": tier, "rows": int(row["Rows"]),
+                            "mb": round(float(row["MB"]), 3), "bytes_per_row": round(float(row["BytesPerRow"]), 1)})
+        self.columns[f"{dataset}/{tier}"] = dl.column_memory(df).round({"MB": 3}).to_dict("records")
+        print(f"{dataset:<12} {tier:<6} {'memory':<10} {row['MB']:>10.1f} MB {row['BytesPerRow']:>7.1f} B/row")
+
+    def measure(self, dataset, tier, stage, fn, rows=None):
+        gc.collect()
+        base = rss_bytes()
+        sampler = PeakSampler()
+        sampler.start()
+        start = time.perf_counter()
+        out = fn()
+        seconds = time.perf_counter() - start
+        peak_mb = (sampler.stop() - base) / 1024 ** 2
+        self.results.append({
+            "dataset": dataset, "tier": tier, "stage": stage, "rows": rows,
+            "seconds": round(seconds, 6), "peak_mb": round(peak_mb, 3),
+        })
+        print(f"{dataset:<12} {tier:<6} {stage:<10} {seconds * 1000:>10.1f} ms {peak_mb:>10.1f} MB")
+        return out
+
+
+# ------------------------------------------------------------------
+# データセットごとの計測
+# ------------------------------------------------------------------
+def bench_sales(rec, tier):
+    import data_loder as dl
+    from views.sales_views import build_stacked_bar, show_sales_view
+
+    dl.load_sales_data.clear()
+    dl.build_sales_cube.clear()
+    df = rec.measure("sales", tier, "load", lambda: dl.load_sales_data(**SALES_TIERS[tier]))
+    rec.record_memory("sales", tier, df)
+    rows = len(df)
+    cube = rec.measure("sales", tier, "aggregate", lambda: dl.build_sales_cube(df, ("bench", tier)), rows)
+    months = cube["Month"].unique().tolist()
+    df_channel = cube.groupby(["Month", "Channel"], observed=True)["Sales"].sum().reset_index()
+    fig = rec.measure("sales", tier, "figure",
+                      lambda: build_stacked_bar(df_channel, "Channel", "bench", months), rows)
+    rec.measure("sales", tier, "serialize", fig.to_json, rows)
+    rec.measure("sales", tier, "render", lambda: show_sales_view(df, ("bench", tier)), rows)
+
+
+def bench_inventory(rec, tier):
+    import data_loder as dl
+    from inventory_engine import InventoryState
+    from views.invenory_view import build_asset_treemap, build_risk_scatter, show_inventory_view
+
+    dl.load_inventory_data.clear()
+    dl.load_demand_history.clear()
+    dl.build_demand_forecast.clear()
+    df = rec.measure("inventory", tier, "load", lambda: dl.load_inventory_data(**INVENTORY_TIERS[tier]))
+    rec.record_memory("inventory", tier, df)
+    rows = len(df)
+    history = rec.measure("inventory", tier, "history", lambda: dl.load_demand_history(**INVENTORY_TIERS[tier]), rows)
+    df = rec.measure("inventory", tier, "forecast", lambda: dl.with_demand_forecast(df, ("bench", tier), history), rows)
+    state = rec.measure("inventory", tier, "aggregate", lambda: InventoryState(df), rows)
+    rec.measure("inventory", tier, "alerts", lambda: state.alert_page(), rows)
+    treemap = rec.measure("inventory", tier, "figure", lambda: build_asset_treemap(df), rows)
+    scatter = rec.measure("inventory", tier, "figure2", lambda: build_risk_scatter(df), rows)
+    rec.measure("inventory", tier, "serialize", lambda: (treemap.to_json(), scatter.to_json()), rows)
+    rec.measure("inventory", tier, "render", lambda: show_inventory_view(df, ("bench", tier), df_history=history), rows)
+
+
+def bench_supply_chain(rec, tier):
+    import plotly.graph_objects as go
+
+    import data_loder as dl
+    from supply_graph import SupplyGraph
+    from disruption import DisruptionEngine
+    from geo import NetworkGeo, SiteTable
+    from views.suply_chain_view import show_supply_chain_view
+
+    scale = LANE_TIERS[tier]
+    if scale is None:
+        data = rec.measure("supply", tier, "load", dl.load_supply_chain_data)
+    else:
+        dl.generate_supply_chain_data.clear()
+        data = rec.measure("supply", tier, "load", lambda: dl.generate_supply_chain_data(**scale))
+    lanes = len(data[3]) + len(data[4])
+    graph = rec.measure("supply", tier, "aggregate", lambda: SupplyGraph.from_flows(*data), lanes)
+    sankey = rec.measure("supply", tier, "sankey", lambda: graph.sankey(["blue", "orange", "green"]), lanes)
+    rec.measure("supply", tier, "whatif", lambda: DisruptionEngine(graph).impact_ranking(), lanes)
+    sites = SiteTable.from_dict(dl.SITE_LOCATIONS) if scale is None else dl.generate_site_table(*data[:3])
+    rec.measure("supply", tier, "geo", lambda: NetworkGeo(graph, sites).reassignments(), lanes)
+    fig = rec.measure("supply", tier, "figure", lambda: go.Figure(go.Sankey(
+        node=dict(label=sankey["labels"], color=sankey["colors"]),
+        link=dict(source=sankey["source"], target=sankey["target"], value=sankey["value"]),
+    )), lanes)
+    rec.measure("supply", tier, "serialize", fig.to_json, lanes)
+    df_inventory = dl.load_inventory_data()   # 着地原価タブの部品マスタ（デモ規模）
+    rec.measure("supply", tier, "render",
+                lambda: show_supply_chain_view(*data, ("bench", tier), df_inventory=df_inventory), lanes)
+
+
+# ------------------------------------------------------------------
+# 比較・出力
+# ------------------------------------------------------------------
+def compare(current, previous_path, threshold=1.2):
+    """前回の結果と比較し、threshold 倍以上遅くなった段階を表示する"""
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {(r["dataset"], r["tier"], r["stage"]): r for r in json.load(f)["results"]}
+    print(f"\n--- {previous_path} との比較（{threshold:.1f} 倍以上の悪化を表示）---")
+    regressions = 0
+    for r in current:
+        old = previous.get((r["dataset"], r["tier"], r["stage"]))
+        if old is None or old["seconds"] <= 0:
+            continue
+        ratio = r["seconds"] / old["seconds"]
+        if ratio >= threshold:
+            regressions += 1
+            print(f"{r['dataset']:<12} {r['tier']:<6} {r['stage']:<10} {old['seconds']:.3f}s -> {r['seconds']:.3f}s (x{ratio:.2f})")
+    if regressions == 0:
+        print("悪化した段階はありません")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tiers", default="demo,1m", help="売上・在庫の規模（demo,1m,10m）")
+    parser.add_argument("--lanes", default="demo,1k", help="サプライチェーンのレーン数（demo,1k,100k）")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="比較する前回の結果 JSON")
+    args = parser.parse_args(argv)
+
+    # st.* をランタイムなし（bare mode）で呼ぶときの警告を抑える（streamlit は設定読込時にログレベルを戻すため一括で止める）
+    # data_loder の import 時に作られるキャッシュの警告も出さないよう、import より先に止める
+    logging.disable(logging.WARNING)
+
+    # ライブラリの import 時間を計測に含めないよう、先に読み込んでおく
+    import plotly.express  # noqa: F401
+    import data_loder  # noqa: F401
+
+    rec = Recorder()
+    for tier in filter(None, args.tiers.split(",")):
+        bench_sales(rec, tier)
+        bench_inventory(rec, tier)
+    for tier in filter(None, args.lanes.split(",")):
+        bench_supply_chain(rec, tier)
+
+    import numpy as np
+    import pandas as pd
+    import plotly
+    import streamlit as st
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "versions": {"pandas": pd.__version__, "numpy": np.__version__,
+                         "plotly": plotly.__version__, "streamlit": st.__version__},
+        },
+        "results": rec.results,
+        "memory": rec.memory,
+        "columns": rec.columns,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n結果を保存しました: {args.output}")
+
+    if args.compare:
+        compare(rec.results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
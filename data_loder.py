@@ -1,95 +1,350 @@
+import logging
+import os
+import threading
+
 import pandas as pd
 import numpy as np
 import streamlit as st
 
+from data_sources import (
+    ParquetSource, SyntheticSource, flows_to_frames, frames_to_flows, strings_to_periods,
+)
+from supply_graph import SupplyGraph
+from geo import NetworkGeo, SiteTable
+from lead_time import LeadTimeStore
+from inventory_engine import InventoryState
+from frame_index import FrameIndex, filters_key
+from refresh import LazyData, RefreshWorker
+from shared_store import SharedFrameStore
+from partitioned_store import concat_partitions, locate_partitions
+from perf import cache_miss, span
+
+DATA_DIR_ENV = "DASHBOARD_DATA_DIR"   # 設定時は Parquet / Arrow ファイルから読み込む
+REFRESH_INTERVAL_ENV = "DASHBOARD_REFRESH_SECONDS"   # データの版を確認する間隔（秒）
+DEFAULT_REFRESH_SECONDS = 60
+REFRESH_THREAD_NAME = "dashboard-refresh"
+
+# 版付きキャッシュの上限件数（リフレッシュのたびに古い版のエントリが溜まらないようにする）
+VERSION_CACHE_ENTRIES = 2      # 公開中の版と、切り替え直前の版
+INDEX_CACHE_ENTRIES = 4        # 行位置インデックス（売上・在庫）× 2 版
+TABLE_CACHE_ENTRIES = 16       # 読み込んだテーブル（テーブル × 列 × 版）
+FILTER_CACHE_ENTRIES = 64      # 絞り込み条件ごとの売上集計
+PARTITION_CACHE_ENTRIES = 128  # 月パーティションごとの売上集計（変わらない月は版をまたいで再利用する）
+
 # ------------------------------------------------------------------
 # 1. 売上データ：アパレル業界
 # ------------------------------------------------------------------
+SALES_CHANNELS = ["渋谷旗艦店", "新宿店", "銀座店", "ECサイト", "梅田店", "博多店"]
+SALES_CATEGORIES = ["トップス", "ボトムス", "アウター", "アクセサリー"]
+UPLIFT_CHANNELS = ["渋谷旗艦店", "ECサイト"]   # 旗艦店・EC は売上 1.2 倍
+WINTER_MONTHS = [1, 2, 12]                       # アウターの繁忙期（1.5 倍）
+
+
+DATETIME_CATEGORY_MAX = 4096   # 値の種類がこれ以下の日時列はカテゴリ型にする（日付・月初日など）
+
+
+def compact_frame(df):
+    """
+    DataFrame をメモリの小さい型に揃える
+    - 文字列列 → カテゴリ型（辞書符号化）
+    - 値の種類が少ない日時列 → 順序付きのカテゴリ型（ダミーデータの Date と同じ形）
+    - 整数列 → 値が収まれば int32
+    - 浮動小数列 → float32 に戻しても値が変わらない場合だけ float32（金額などの精度は落とさない）
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+        if pd.api.types.is_object_dtype(s.dtype) or pd.api.types.is_string_dtype(s.dtype):
+            if not isinstance(s.dtype, pd.CategoricalDtype):
+                s = s.astype("category")
+        elif pd.api.types.is_datetime64_any_dtype(s.dtype):
+            values = pd.unique(s.to_numpy())
+            if len(values) <= DATETIME_CATEGORY_MAX:
+                s = s.astype(pd.CategoricalDtype(pd.DatetimeIndex(values).dropna().sort_values(), ordered=True))
+        elif pd.api.types.is_integer_dtype(s.dtype) and s.dtype.itemsize > 4:
+            if len(s) == 0 or (s.min() >= np.iinfo(np.int32).min and s.max() <= np.iinfo(np.int32).max):
+                s = s.astype(np.int32)
+        elif pd.api.types.is_float_dtype(s.dtype) and s.dtype.itemsize > 4:
+            values = s.to_numpy()
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow.astype(values.dtype), values, equal_nan=True):
+                s = pd.Series(narrow, index=s.index, name=s.name)
+        out[col] = s
+    return pd.DataFrame(out, index=df.index)
+
+
+def memory_report(datasets):
+    """
+    データセットごとのメモリ使用量
+    datasets: {名前: DataFrame}
+    戻り値: Dataset / Rows / Columns / MB / BytesPerRow の DataFrame
+    """
+    rows = []
+    for name, df in datasets.items():
+        nbytes = int(df.memory_usage(index=True, deep=True).sum())
+        rows.append({
+            "Dataset": name, "Rows": len(df), "Columns": df.shape[1],
+            "MB": nbytes / 1024 ** 2, "BytesPerRow": nbytes / max(len(df), 1),
+        })
+    return pd.DataFrame(rows)
+
+
+def column_memory(df):
+    """列ごとの型とメモリ使用量（大きい順）"""
+    usage = df.memory_usage(index=False, deep=True)
+    return pd.DataFrame({
+        "Column": usage.index, "Dtype": [str(df[c].dtype) for c in usage.index], "MB": usage.to_numpy() / 1024 ** 2,
+    }).sort_values("MB", ascending=False, ignore_index=True)
+
+
+def _expand_names(base, n, prefix):
+    """既定の名称リストを n 件まで連番名で拡張する（負荷試験用）"""
+    if n is None or n <= len(base):
+        return list(base[: n or len(base)])
+    return list(base) + [f"{prefix}{i:04d}" for i in range(len(base) + 1, n + 1)]
+
+
 @st.cache_data
-def load_sales_data():
-    dates = pd.date_range(start="2024-01-01", end="2024-12-31", freq="M")
-    channels = ["渋谷旗艦店", "新宿店", "銀座店", "ECサイト", "梅田店", "博多店"]
-    categories = ["トップス", "ボトムス", "アウター", "アクセサリー"]
-    
-    sales_data = []
-    rng = np.random.default_rng(42)
-    
-    for date in dates:
-        for channel in channels:
-            for category in categories:
-                base_sales = rng.integers(300000, 1000000)
-                month = date.month
-                if month in [1, 2, 12] and category == "アウター":
-                    base_sales = int(base_sales * 1.5)
-                if channel in ["渋谷旗艦店", "ECサイト"]:
-                    base_sales = int(base_sales * 1.2)
-                
-                sales = int(base_sales)
-                target = int(sales * rng.uniform(0.9, 1.15))
-                cost = int(sales * rng.uniform(0.35, 0.45))
-                
-                sales_data.append({
-                    "Date": date,
-                    "Month": date.strftime("%Y-%m"),
-                    "Channel": channel,
-                    "Category": category,
-                    "Sales": sales,
-                    "Target": target,
-                    "Cost": cost,
-                    "Profit": sales - cost
-                })
-                
-    return pd.DataFrame(sales_data)
+@cache_miss("load_sales_data")
+def load_sales_data(years=1, n_channels=None, n_categories=None, n_skus=0,
+                    start="2024-01", seed=42):
+    """
+    売上データを NumPy のベクトル演算で一括生成する
+    - years / n_channels / n_categories / n_skus で規模を指定（既定値はデモ用の 288 行）
+    - n_skus > 0 のときはカテゴリ配下に SKU 列を追加する
+    - 行の並びは 月 × チャネル × カテゴリ (× SKU)、同じ seed なら同じ結果になる
+    - キーはカテゴリ型（Month は Period 型のカテゴリ）、金額は int32
+    """
+    months = pd.period_range(start=start, periods=12 * years, freq="M")
+    dates = months.to_timestamp(how="end").normalize()
+    channels = _expand_names(SALES_CHANNELS, n_channels, "店舗")
+    categories = _expand_names(SALES_CATEGORIES, n_categories, "カテゴリ")
+    n_sku = max(int(n_skus), 1)
+
+    n_month, n_channel, n_category = len(months), len(channels), len(categories)
+    n_rows = n_month * n_channel * n_category * n_sku
+
+    # 各行のキー位置（外側から 月 → チャネル → カテゴリ → SKU）
+    month_idx = np.repeat(np.arange(n_month), n_channel * n_category * n_sku)
+    channel_idx = np.tile(np.repeat(np.arange(n_channel), n_category * n_sku), n_month)
+    category_idx = np.tile(np.repeat(np.arange(n_category), n_sku), n_month * n_channel)
+
+    rng = np.random.default_rng(seed)
+    base_sales = rng.integers(300000, 1000000, size=n_rows).astype(np.float64)
+
+    # 季節性（冬のアウター）と旗艦店・EC の上振れを係数で一括適用
+    winter = np.isin(months.month, WINTER_MONTHS)[month_idx]
+    outer = (np.asarray(categories) == "アウター")[category_idx]
+    uplift = np.isin(channels, UPLIFT_CHANNELS)[channel_idx]
+    base_sales = np.where(winter & outer, np.floor(base_sales * 1.5), base_sales)
+    base_sales = np.where(uplift, np.floor(base_sales * 1.2), base_sales)
+
+    # 金額は最大でも数百万円なので int32 で保持する
+    sales = base_sales.astype(np.int32)
+    target = (sales * rng.uniform(0.9, 1.15, size=n_rows)).astype(np.int32)
+    cost = (sales * rng.uniform(0.35, 0.45, size=n_rows)).astype(np.int32)
+
+    # 日付・月は辞書符号化（月は Period 型）。行ごとの文字列は持たない
+    data = {
+        "Date": pd.Categorical.from_codes(month_idx, dates, ordered=True),
+        "Month": pd.Categorical.from_codes(month_idx, months, ordered=True),
+        "Channel": pd.Categorical.from_codes(channel_idx, channels),
+        "Category": pd.Categorical.from_codes(category_idx, categories),
+    }
+    if n_skus:
+        sku_idx = np.tile(np.arange(n_sku), n_month * n_channel * n_category)
+        sku_codes = category_idx * n_sku + sku_idx
+        sku_names = [f"{c}-SKU{j:05d}" for c in categories for j in range(1, n_sku + 1)]
+        data["SKU"] = pd.Categorical.from_codes(sku_codes, sku_names)
+    data.update({"Sales": sales, "Target": target, "Cost": cost, "Profit": sales - cost})
+
+    return pd.DataFrame(data)
 
 # ------------------------------------------------------------------
 # 2. 在庫データ：工業部品
 # ------------------------------------------------------------------
+INVENTORY_WAREHOUSES = ["関東パーツセンター", "中部物流センター", "関西ハブ倉庫", "九州デポ"]
+WAREHOUSE_STOCK_MULTIPLIER = {"中部物流センター": 1.5}   # 記載のない倉庫は 1.0
+
+# 部品クラス: (単価下限, 単価上限, 月間需要下限, 月間需要上限)
+PRODUCT_CLASSES = {
+    "制御機器": (150000, 300000, 10, 100),
+    "駆動機器": (50000, 120000, 10, 100),
+    "機構部品": (10000, 30000, 10, 100),
+    "軸受": (2000, 8000, 10, 100),
+    "締結部品": (50, 500, 5000, 20000),
+}
+INVENTORY_PRODUCTS = {
+    "ACサーボモーター": "駆動機器",
+    "プログラマブルコントローラ(PLC)": "制御機器",
+    "電磁弁(ソレノイドバルブ)": "機構部品",
+    "精密ボールねじ": "機構部品",
+    "産業用ベアリング": "軸受",
+    "高強度六角ボルト": "締結部品",
+}
+STOCK_SCENARIO_P = [0.75, 0.1, 0.15]   # normal / shortage / excess
+DEMAND_HISTORY_MONTHS = 24
+DEMAND_HISTORY_END = "2024-12"         # 需要履歴の最終月
+DEMAND_HISTORY_SEED = 43               # 需要履歴の乱数（在庫データの生成とは別の系列）
+INTERMITTENT_DEMAND_MAX = 30           # 月間需要がこれ未満の部品は需要が間欠的に発生する
+DEMAND_SIZE_SHAPE = 16.0               # 1 回の需要量のばらつき（ガンマ分布の形状。変動係数 = 1/√16）
+
+
+def product_classes(products):
+    """部品名 → 部品クラス名（表にない追加分の部品はクラスを順番に割り当てる）"""
+    class_names = list(PRODUCT_CLASSES)
+    return [INVENTORY_PRODUCTS.get(p, class_names[i % len(class_names)]) for i, p in enumerate(products)]
+
+
+def default_safety_stock(monthly_demand):
+    """需要予測がないときの安全在庫（月間需要の半月分）"""
+    return np.asarray(monthly_demand) // 2
+
+
+def generate_demand_history(monthly_demand, months=DEMAND_HISTORY_MONTHS, seed=42, batch_size=250_000):
+    """
+    倉庫 × 部品ごとの月次需要の履歴 (系列数, months) を生成する（平均は monthly_demand）
+    - 月間需要の少ない部品は、需要のある月の割合を 50〜100% でばらつかせる（間欠需要）
+    - メモリを抑えるため batch_size 系列ずつ生成し、int32 で保持する
+    """
+    monthly_demand = np.asarray(monthly_demand, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    history = np.empty((len(monthly_demand), months), dtype=np.int32)
+    for start in range(0, len(monthly_demand), batch_size):
+        mean = monthly_demand[start:start + batch_size]
+        occur = np.where(mean < INTERMITTENT_DEMAND_MAX, rng.uniform(0.5, 1.0, len(mean)), 1.0)
+        size = rng.gamma(DEMAND_SIZE_SHAPE, (mean / occur / DEMAND_SIZE_SHAPE)[:, None], (len(mean), months))
+        history[start:start + batch_size] = np.where(rng.random((len(mean), months)) < occur[:, None], np.round(size), 0)
+    return history
+
+
 @st.cache_data
-def load_inventory_data():
-    warehouses = ["関東パーツセンター", "中部物流センター", "関西ハブ倉庫", "九州デポ"]
-    products = [
-        "ACサーボモーター", "プログラマブルコントローラ(PLC)", "電磁弁(ソレノイドバルブ)", 
-        "精密ボールねじ", "産業用ベアリング", "高強度六角ボルト"
-    ]
-    
-    inventory_data = []
-    rng = np.random.default_rng(42)
-
-    for w in warehouses:
-        for p in products:
-            if "PLC" in p: cost = rng.integers(150000, 300000)
-            elif "モーター" in p: cost = rng.integers(50000, 120000)
-            elif "ボールねじ" in p or "電磁弁" in p: cost = rng.integers(10000, 30000)
-            elif "ベアリング" in p: cost = rng.integers(2000, 8000)
-            else: cost = rng.integers(50, 500)
-
-            if "ボルト" in p: monthly_demand = rng.integers(5000, 20000)
-            else: monthly_demand = rng.integers(10, 100)
-            
-            safety_stock = int(monthly_demand * 0.5)
-            stock_multiplier = 1.5 if "中部" in w else 1.0
-            stock_scenario = rng.choice(["normal", "shortage", "excess"], p=[0.75, 0.1, 0.15])
-            
-            if stock_scenario == "shortage": stock = rng.integers(0, safety_stock + 1)
-            elif stock_scenario == "excess": stock = rng.integers(monthly_demand * 3, monthly_demand * 5)
-            else: stock = int(rng.integers(safety_stock, monthly_demand * 2) * stock_multiplier)
-
-            inventory_data.append({
-                "Warehouse": w, "Product": p, "Stock": stock, "UnitCost": cost,
-                "TotalValue": stock * cost, "SafetyStock": safety_stock,
-                "MonthlyDemand": monthly_demand,
-                "InventoryMonths": round(stock / monthly_demand, 1) if monthly_demand > 0 else 0
-            })
-    
-    df_inventory = pd.DataFrame(inventory_data)
+@cache_miss("load_inventory_data")
+def load_inventory_data(n_warehouses=None, n_products=None, seed=42):
+    """
+    在庫データを部品クラス表からベクトル演算で一括生成する
+    - n_warehouses / n_products で規模を指定（既定値はデモ用の 4 倉庫 × 6 部品）
+    - 追加分の部品はクラスを順番に割り当てる
+    - キーはカテゴリ型、数量は int32 / 金額は int64 で保持する
+    - 安全在庫は月間需要の半月分（需要予測による見直しは読み込み後に with_demand_forecast で行う）
+    """
+    warehouses = _expand_names(INVENTORY_WAREHOUSES, n_warehouses, "倉庫")
+    products = _expand_names(list(INVENTORY_PRODUCTS), n_products, "部品")
+    class_names = list(PRODUCT_CLASSES)
+    class_table = np.array([PRODUCT_CLASSES[c] for c in class_names], dtype=np.int64)
+    product_class = np.array([class_names.index(c) for c in product_classes(products)])
+
+    n_wh, n_prod = len(warehouses), len(products)
+    n_rows = n_wh * n_prod
+    wh_idx = np.repeat(np.arange(n_wh), n_prod)
+    prod_idx = np.tile(np.arange(n_prod), n_wh)
+    bands = class_table[product_class[prod_idx]]
+
+    rng = np.random.default_rng(seed)
+    cost = rng.integers(bands[:, 0], bands[:, 1])
+    monthly_demand = rng.integers(bands[:, 2], bands[:, 3])
+    safety_stock = default_safety_stock(monthly_demand)
+    stock_multiplier = np.array([WAREHOUSE_STOCK_MULTIPLIER.get(w, 1.0) for w in warehouses])[wh_idx]
+
+    # 0: normal / 1: shortage / 2: excess
+    scenario = rng.choice(3, size=n_rows, p=STOCK_SCENARIO_P)
+    stock = np.select(
+        [scenario == 1, scenario == 2],
+        [
+            rng.integers(0, safety_stock + 1),
+            rng.integers(monthly_demand * 3, monthly_demand * 5),
+        ],
+        default=(rng.integers(safety_stock, monthly_demand * 2) * stock_multiplier).astype(np.int64),
+    )
+
+
+    df_inventory = pd.DataFrame({
+        "Warehouse": pd.Categorical.from_codes(wh_idx, warehouses),
+        "Product": pd.Categorical.from_codes(prod_idx, products),
+        "Stock": stock.astype(np.int32),
+        "UnitCost": cost.astype(np.int32),
+        "TotalValue": stock * cost,
+        "SafetyStock": safety_stock.astype(np.int32),
+        "MonthlyDemand": monthly_demand.astype(np.int32),
+        "InventoryMonths": np.round(stock / monthly_demand, 1).astype(np.float32),
+    })
     df_inventory["IsAlert"] = df_inventory["Stock"] < df_inventory["SafetyStock"]
-    
+
     return df_inventory
 
+
+@st.cache_data
+@cache_miss("load_demand_history")
+def load_demand_history(n_warehouses=None, n_products=None, seed=DEMAND_HISTORY_SEED):
+    """
+    需要履歴テーブル（Warehouse / Product と月ごとの列 "YYYY-MM"。1 行 = 倉庫 × 部品の 1 系列）
+    ダミーの在庫データ（同じ規模）の MonthlyDemand を平均として生成する。本番では出荷実績から作る
+    """
+    df_inventory = load_inventory_data(n_warehouses, n_products)
+    months = pd.period_range(end=DEMAND_HISTORY_END, periods=DEMAND_HISTORY_MONTHS, freq="M").strftime("%Y-%m")
+    history = generate_demand_history(df_inventory["MonthlyDemand"].to_numpy(), seed=seed)
+    df = pd.DataFrame(history, columns=list(months))
+    df.insert(0, "Product", df_inventory["Product"].to_numpy())
+    df.insert(0, "Warehouse", df_inventory["Warehouse"].to_numpy())
+    return df
+
+
+@st.cache_data(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("build_demand_forecast")
+def build_demand_forecast(_df_inventory, _df_history, version):
+    """
+    全系列（倉庫 × 部品）の需要予測と安全在庫（ForecastDemand / SafetyStock。行は _df_inventory と同じ順）
+    需要履歴（load_demand_history と同じ形のテーブル）は倉庫・部品で在庫の行に突き合わせる
+    履歴のない行は MonthlyDemand と既定の安全在庫のままにする（倉庫単位で並列化）
+    """
+    from forecast import forecast_demand   # 使うときにだけ読み込む（起動を軽くする）
+
+    keys = ["Warehouse", "Product"]
+    rows = pd.MultiIndex.from_arrays([_df_history[k] for k in keys]).get_indexer(
+        pd.MultiIndex.from_arrays([_df_inventory[k] for k in keys]))
+    matched = np.flatnonzero(rows >= 0)
+    month_columns = sorted(c for c in _df_history.columns if c not in keys)
+    history = _df_history[month_columns].to_numpy(dtype=np.int32)[rows[matched]]
+    groups = pd.Categorical(_df_inventory["Warehouse"]).codes[matched]
+
+    monthly_demand = _df_inventory["MonthlyDemand"].to_numpy()
+    forecast_qty = monthly_demand.astype(np.float32)
+    safety_stock = default_safety_stock(monthly_demand).astype(np.int64)
+    if len(matched):
+        forecast = forecast_demand(history, groups=groups)
+        forecast_qty[matched] = forecast["ForecastDemand"].to_numpy()
+        safety_stock[matched] = forecast["SafetyStock"].to_numpy()
+    return pd.DataFrame({"ForecastDemand": forecast_qty, "SafetyStock": safety_stock})
+
+
+def with_demand_forecast(df_inventory, version, df_history=None):
+    """
+    在庫データの安全在庫・在庫月数・アラートを需要予測で求め、ForecastDemand 列を加える
+    version: データの版（セッションが読んでいるスナップショットの版）
+    df_history: 需要履歴テーブル。None（データソースに履歴がない）なら予測せず、
+    MonthlyDemand と既定の安全在庫で求める（ForecastDemand 列は加えない）
+    """
+    stock = df_inventory["Stock"].to_numpy(dtype=np.float64)
+    if df_history is None:
+        demand = df_inventory["MonthlyDemand"].to_numpy(dtype=np.float64)
+        safety_stock = default_safety_stock(df_inventory["MonthlyDemand"].to_numpy()).astype(np.int32)
+        columns = {}
+    else:
+        forecast = build_demand_forecast(df_inventory, df_history, (version, len(df_inventory)))
+        demand = forecast["ForecastDemand"].to_numpy(dtype=np.float64)
+        safety_stock = forecast["SafetyStock"].to_numpy(dtype=np.int32)
+        columns = {"ForecastDemand": forecast["ForecastDemand"].to_numpy()}
+    months = np.divide(stock, demand, out=np.zeros(len(stock)), where=demand > 0)
+    return df_inventory.assign(
+        SafetyStock=safety_stock, **columns,
+        InventoryMonths=np.round(months, 1).astype(np.float32), IsAlert=stock < safety_stock,
+    )
+
 # ------------------------------------------------------------------
 # 3. サプライチェーンデータ（港→倉庫→店舗）
 # ------------------------------------------------------------------
 @st.cache_data
+@cache_miss("load_supply_chain_data")
 def load_supply_chain_data():
     ports = ["東京港", "横浜港", "神戸港", "博多港"]
     warehouses = ["関東DC", "中部ハブ", "関西物流センター", "九州デポ"]
@@ -115,10 +370,484 @@ def load_supply_chain_data():
 
     return ports, warehouses, stores, inbound_flows, outbound_flows
 
+# 拠点の座標マスタ（実務ではDBから取得）。ここにない拠点を含むフローは地図・距離の集計から外れる
+SITE_LOCATIONS = {
+    "東京港": {"lat": 35.6267, "lon": 139.7758, "type": "Port"},
+    "横浜港": {"lat": 35.4468, "lon": 139.6489, "type": "Port"},
+    "神戸港": {"lat": 34.6850, "lon": 135.2656, "type": "Port"},
+    "博多港": {"lat": 33.6101, "lon": 130.3970, "type": "Port"},
+    "関東DC": {"lat": 35.8000, "lon": 139.7000, "type": "Warehouse"},
+    "中部ハブ": {"lat": 35.0500, "lon": 136.8500, "type": "Warehouse"},
+    "関西物流センター": {"lat": 34.7500, "lon": 135.4500, "type": "Warehouse"},
+    "九州デポ": {"lat": 33.5500, "lon": 130.4500, "type": "Warehouse"},
+    "新宿旗艦店": {"lat": 35.6909, "lon": 139.7002, "type": "Store"},
+    "梅田店": {"lat": 34.7025, "lon": 135.4959, "type": "Store"},
+    "博多駅前店": {"lat": 33.5902, "lon": 130.4207, "type": "Store"},
+    "渋谷店": {"lat": 35.6580, "lon": 139.7016, "type": "Store"},
+    "横浜店": {"lat": 35.4657, "lon": 139.6223, "type": "Store"},
+    "名古屋駅前店": {"lat": 35.1709, "lon": 136.8815, "type": "Store"},
+    "心斎橋店": {"lat": 34.6714, "lon": 135.5014, "type": "Store"},
+    "天神店": {"lat": 33.5916, "lon": 130.3989, "type": "Store"},
+}
+
+# 負荷試験用の拠点を置く範囲（緯度・経度。おおむね本州〜九州）
+SITE_LAT_RANGE = (31.5, 41.5)
+SITE_LON_RANGE = (130.0, 141.5)
+
+
+def generate_site_table(ports, warehouses, stores, seed=42):
+    """負荷試験用の座標マスタ（generate_supply_chain_data の拠点に一様乱数で座標を振る）"""
+    rng = np.random.default_rng(seed)
+    names = list(ports) + list(warehouses) + list(stores)
+    kind = ["Port"] * len(ports) + ["Warehouse"] * len(warehouses) + ["Store"] * len(stores)
+    return SiteTable(names, rng.uniform(*SITE_LAT_RANGE, size=len(names)),
+                     rng.uniform(*SITE_LON_RANGE, size=len(names)), kind)
+
 @st.cache_data
-def load_all_data():
+@cache_miss("generate_supply_chain_data")
+def generate_supply_chain_data(n_ports=4, n_warehouses=4, n_stores=8, lanes_per_store=1,
+                               ports_per_warehouse=2, seed=42):
+    """
+    負荷試験用のサプライチェーンを生成する（戻り値は load_supply_chain_data と同じ形式）
+    レーン数 = n_warehouses × ports_per_warehouse + n_stores × lanes_per_store
+    """
+    rng = np.random.default_rng(seed)
+    ports = [f"港{i:03d}" for i in range(1, n_ports + 1)]
+    warehouses = [f"倉庫{i:04d}" for i in range(1, n_warehouses + 1)]
+    stores = [f"店舗{i:06d}" for i in range(1, n_stores + 1)]
+
+    in_dst = np.repeat(np.arange(n_warehouses), ports_per_warehouse)
+    in_src = rng.integers(0, n_ports, size=len(in_dst))
+    in_val = rng.integers(1000, 10000, size=len(in_dst))
+    out_dst = np.repeat(np.arange(n_stores), lanes_per_store)
+    out_src = rng.integers(0, n_warehouses, size=len(out_dst))
+    out_val = rng.integers(100, 5000, size=len(out_dst))
+
+    inbound_flows = [(ports[s], warehouses[t], int(v)) for s, t, v in zip(in_src, in_dst, in_val)]
+    outbound_flows = [(warehouses[s], stores[t], int(v)) for s, t, v in zip(out_src, out_dst, out_val)]
+    return ports, warehouses, stores, inbound_flows, outbound_flows
+
+
+# ------------------------------------------------------------------
+# 3-2. 配送リードタイム（ルート別の集計ストア）
+# ------------------------------------------------------------------
+LEAD_TIME_ROUTES = ["東京港→関東DC", "横浜港→中部ハブ", "神戸港→関西物流", "関東DC→新宿店", "中部ハブ→名古屋店"]
+
+
+def generate_lead_times(n_per_route=50, seed=42):
+    """ダミーの配送実績 (routes, days) を配列で生成する"""
+    rng = np.random.default_rng(seed)
+    routes = np.repeat(np.array(LEAD_TIME_ROUTES, dtype=object), n_per_route)
+    # 港発はばらつき大(scale=3)、国内は安定(scale=0.5)
+    from_port = np.array(["港" in r for r in LEAD_TIME_ROUTES]).repeat(n_per_route)
+    days = rng.normal(np.where(from_port, 14.0, 2.0), np.where(from_port, 3.0, 0.5))
+    return routes, np.maximum(0.5, days)
+
+
+@st.cache_resource
+@cache_miss("load_lead_time_store")
+def load_lead_time_store(n_per_route=50, batch_size=1_000_000):
+    """
+    配送実績を batch_size 件ずつ LeadTimeStore に取り込む
+    （本番では出荷実績の追加分を append する。ストアは全セッションで共有する）
+    """
+    store = LeadTimeStore()
+    routes, days = generate_lead_times(n_per_route)
+    for start in range(0, len(days), batch_size):
+        store.append(routes[start:start + batch_size], days[start:start + batch_size])
+    return store
+
+
+# ------------------------------------------------------------------
+# 4. データソース経由の読み込み（列の射影・フィルタのプッシュダウン）
+# ------------------------------------------------------------------
+def _synthetic_supply_frames(part):
+    nodes, flows = flows_to_frames(*load_supply_chain_data())
+    return compact_frame(nodes if part == "nodes" else flows)
+
+
+def get_data_source():
+    """環境変数 DASHBOARD_DATA_DIR があれば ParquetSource、なければダミーデータ"""
+    root = os.environ.get(DATA_DIR_ENV)
+    if root:
+        return ParquetSource(root)
+    return SyntheticSource({
+        "sales": load_sales_data,
+        "inventory": load_inventory_data,
+        "demand_history": load_demand_history,
+        "supply_nodes": lambda: _synthetic_supply_frames("nodes"),
+        "supply_flows": lambda: _synthetic_supply_frames("flows"),
+    })
+
+
+def _read_compact(name, columns=None, filters=None):
+    df = compact_frame(get_data_source().read(name, columns, filters))
+    # 保存時は "YYYY-MM" 文字列なので Period 型のカテゴリに戻す
+    return strings_to_periods(df, ["Month"])
+
+
+def _read_partition(name, key, columns=None):
+    df = compact_frame(get_data_source().read_partition(name, key, columns))
+    return strings_to_periods(df, ["Month"])
+
+
+@st.cache_data(max_entries=TABLE_CACHE_ENTRIES)
+@cache_miss("_read_table")
+def _read_table(table_version, name, columns, filters):
+    return _read_compact(name, columns, filters)
+
+
+def load_table(name, columns=None, filters=None):
+    """
+    テーブルを必要な列・行だけ読み込む
+    columns: 読み込む列のリスト（None で全列）
+    filters: [(列名, 演算子, 値), ...]（Parquet では行グループ単位でスキップされる）
+    """
+    source = get_data_source()
+    columns = tuple(columns) if columns else None
+    filters = tuple(tuple(f) for f in filters) if filters else None
+    with span(f"load.{name}", cached=True) as s:
+        if isinstance(source, SyntheticSource):
+            # 生成関数側でキャッシュ済みなので二重に保持しない
+            df = source.read(name, columns, filters)
+        else:
+            df = _read_table(source.table_version(name), name, columns, filters)
+        s.set(rows=len(df))
+    return df
+
+
+def load_supply_chain():
+    """サプライチェーンデータをソースから読み込み、(ports, warehouses, stores, inbound, outbound) で返す"""
+    with span("load.supply_chain", cached=True):
+        if isinstance(get_data_source(), SyntheticSource):
+            return load_supply_chain_data()
+        return frames_to_flows(load_table("supply_nodes"), load_table("supply_flows"))
+
+
+def export_to_parquet(root, **scale):
+    """
+    ダミーデータを Parquet に書き出す（本番データの置き場と同じ構成）
+    売上は月別パーティション（sales/month=YYYY-MM.parquet）。翌月分は sink.append("sales", df) で追記する
+    """
+    sink = ParquetSource(root)
+    sales_scale = {k: v for k, v in scale.items() if k in ("years", "n_channels", "n_categories", "n_skus")}
+    inventory_scale = {k: v for k, v in scale.items() if k in ("n_warehouses", "n_products")}
+    sink.append("sales", load_sales_data(**sales_scale), sort_by=["Date"])
+    sink.write("inventory", load_inventory_data(**inventory_scale), sort_by=["Warehouse"])
+    sink.write("demand_history", load_demand_history(**inventory_scale), sort_by=["Warehouse"])
+    nodes, flows = flows_to_frames(*load_supply_chain_data())
+    sink.write("supply_nodes", nodes)
+    sink.write("supply_flows", flows)
+    return sink
+
+
+_active_worker = None   # 公開中のスナップショットを持つワーカー（直前の版の再利用・古いファイルの掃除に使う）
+
+
+# ------------------------------------------------------------------
+# 5. 集計キューブ（売上: 月 × チャネル × カテゴリ）
+# ------------------------------------------------------------------
+SALES_MEASURES = ["Sales", "Target", "Cost", "Profit"]
+
+
+def _cube(df):
+    month = df["Month"] if "Month" in df.columns else pd.to_datetime(df["Date"]).dt.strftime("%Y-%m")
+    measures = [m for m in SALES_MEASURES if m in df.columns]
+    return (
+        df[measures]
+        .groupby([month.astype(str).rename("Month"), df["Channel"], df["Category"]], observed=True)
+        .sum()
+        .reset_index()
+        .sort_values("Month", kind="stable", ignore_index=True)
+    )
+
+
+@st.cache_data(max_entries=FILTER_CACHE_ENTRIES)
+@cache_miss("build_sales_cube")
+def build_sales_cube(_df_sales, version, _rows=None):
+    """
+    売上を 月 × チャネル × カテゴリ で合計したキューブを作る
+    version（データの版）ごとに 1 回だけ計算され、再実行時はキャッシュを返す
+    _rows を渡すとその行だけで集計する（絞り込み時。version に絞り込み条件を含めること）
+    """
+    return _cube(_df_sales if _rows is None else _df_sales.take(_rows))
+
+
+@st.cache_data(max_entries=PARTITION_CACHE_ENTRIES)
+@cache_miss("build_partition_cube")
+def build_partition_cube(_df_sales, _rows, key, version, columns):
+    """
+    1 パーティション（1 か月）分のキューブ。キャッシュのキーはパーティションの版なので、
+    月を追記しても既存の月のキューブはそのまま使い回す
+    """
+    return _cube(_df_sales.iloc[_rows])
+
+
+def partition_cube(df_sales, partition):
+    return build_partition_cube(df_sales, partition.rows, partition.key, partition.version, tuple(df_sales.columns))
+
+
+def sales_cube(df_sales, version, filters=None, rows=None, partitions=None):
+    """
+    データの版 version・絞り込み条件をキーにしたキューブ（rows は filters から求めた行番号）
+    絞り込みがなく partitions（月別パーティションの位置）があれば、月ごとのキューブをつなぐ
+    """
+    if partitions and not filters:
+        return pd.concat([partition_cube(df_sales, p) for p in partitions], ignore_index=True)
+    return build_sales_cube(df_sales, (version, len(df_sales), tuple(df_sales.columns), filters_key(filters)), rows)
+
+
+@st.cache_resource(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("load_inventory_state")
+def load_inventory_state(_df_inventory, _df_history, version, n_rows, has_history):
+    """
+    在庫状態エンジン（入出庫イベントを差分で反映する）。データの版ごとに 1 つ作り、全セッションで共有する
+    安全在庫・在庫月数は需要予測（with_demand_forecast）を当てはめてから求める
+    イベントは load_inventory_state(...).apply_events(倉庫, 部品, 増減数) で取り込む
+    需要予測のキャッシュは with_demand_forecast(df, version, ...) を直接呼んだ場合と同じキーになる
+    """
+    return InventoryState(with_demand_forecast(_df_inventory, version, _df_history))
+
+
+def inventory_state(df_inventory, version, df_history=None):
+    """df_history: 需要履歴テーブル（データソースにない場合は None）"""
+    return load_inventory_state(df_inventory, df_history, version, len(df_inventory), df_history is not None)
+
+
+# ------------------------------------------------------------------
+# 6. サプライチェーングラフ（整数インデックス化）
+# ------------------------------------------------------------------
+@st.cache_resource(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("build_supply_graph")
+def build_supply_graph(_supply_chain_data, version):
+    """
+    (ports, warehouses, stores, inbound, outbound) から SupplyGraph を作る
+    データの版ごとに 1 回だけ作り、全セッションで共有する（読み取り専用）
+    """
+    return SupplyGraph.from_flows(*_supply_chain_data)
+
+
+def supply_graph_version(supply_chain_data, version):
+    return (version, tuple(len(part) for part in supply_chain_data))
+
+
+def supply_graph(supply_chain_data, version):
+    return build_supply_graph(supply_chain_data, supply_graph_version(supply_chain_data, version))
+
+
+@st.cache_resource(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("build_disruption_engine")
+def build_disruption_engine(_graph, version):
+    """停止シミュレーションの基準エンジン（平常時）。セッションごとに copy() して使う"""
+    from disruption import DisruptionEngine   # scipy.sparse は使うときにだけ読み込む
+
+    return DisruptionEngine(_graph)
+
+
+@st.cache_resource(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("build_landed_cost_engine")
+def build_landed_cost_engine(_graph, version):
+    """着地原価エンジン（経路とレーン単価）。データの版ごとに 1 回だけ作り、全セッションで共有する"""
+    from landed_cost import LandedCostEngine   # scipy.sparse は使うときにだけ読み込む
+
+    return LandedCostEngine(_graph)
+
+
+@st.cache_data(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("load_product_catalog")
+def load_product_catalog(_df_inventory, version):
+    """
+    着地原価用の部品マスタ（Product / Class / UnitCost）
+    製造原価は倉庫ごとの UnitCost の平均とする（在庫が 0 の部品も含める）
+    """
+    products = _df_inventory["Product"].astype("category").cat.categories
+    df = _df_inventory.groupby("Product", observed=True, sort=False)["UnitCost"].mean().reset_index()
+    df.insert(1, "Class", df["Product"].map(dict(zip(products, product_classes(products)))).astype(str))
+    return df.sort_values("Product", kind="stable").reset_index(drop=True)
+
+
+def product_catalog(df_inventory, version):
+    return load_product_catalog(df_inventory, (version, len(df_inventory)))
+
+
+@st.cache_resource(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("build_store_landed_costs")
+def build_store_landed_costs(_engine, _catalog, version):
+    """全 SKU × 全店舗 の着地原価（全経路をバッチ計算して店舗ごとに加重平均）。読み取り専用"""
+    return _engine.store_costs(_catalog)
+
+
+def store_landed_costs(supply_chain_data, catalog, version):
+    """(着地原価エンジン, SKU × 店舗 の着地原価) を返す"""
+    graph_version = supply_graph_version(supply_chain_data, version)
+    engine = build_landed_cost_engine(supply_graph(supply_chain_data, version), graph_version)
+    return engine, build_store_landed_costs(engine, catalog, (graph_version, len(catalog)))
+
+
+@st.cache_resource
+def load_site_table():
+    """拠点の座標マスタ（SiteTable）。全セッションで共有する"""
+    return SiteTable.from_dict(SITE_LOCATIONS)
+
+
+@st.cache_resource(max_entries=VERSION_CACHE_ENTRIES)
+@cache_miss("build_network_geo")
+def build_network_geo(_graph, version):
+    """各レーンの距離・量×距離と最寄り拠点の索引（NetworkGeo）。データの版ごとに 1 回だけ作る"""
+    return NetworkGeo(_graph, load_site_table())
+
+
+def network_geo(supply_chain_data, version):
+    return build_network_geo(supply_graph(supply_chain_data, version), supply_graph_version(supply_chain_data, version))
+
+
+# ------------------------------------------------------------------
+# 7. 絞り込みインデックス（サイドバーのフィルタ用）
+# ------------------------------------------------------------------
+SALES_INDEX_COLUMNS = ["Date", "Channel", "Category"]
+INVENTORY_INDEX_COLUMNS = ["Warehouse"]
+
+
+@st.cache_resource(max_entries=INDEX_CACHE_ENTRIES)
+@cache_miss("build_frame_index")
+def build_frame_index(_df, version, columns):
+    """行位置インデックス。データの版ごとに 1 回だけ作り、全セッションで共有する（読み取り専用）"""
+    return FrameIndex(_df, columns)
+
+
+def frame_index(df, columns, version):
+    return build_frame_index(df, (version, len(df), tuple(df.columns)), tuple(columns))
+
+
+# ------------------------------------------------------------------
+# 8. バックグラウンド更新（stale-while-revalidate）
+# ------------------------------------------------------------------
+@st.cache_resource
+def get_shared_store():
+    """版ごとのデータを置く共有ストア（DASHBOARD_SHARED_DIR、既定は /dev/shm/dashboard_store）"""
+    return SharedFrameStore()
+
+
+def _partitioned_loader(store, scope, name, columns, parts, previous=None):
+    """
+    月別パーティションのテーブルの (共有ストアのキー, 読み込む関数)。関数は月順につないだ DataFrame を返す
+    共有ストアには月順につないだ 1 ファイルだけを置き、各月はその中の行の範囲で指す
+    previous: 直前のスナップショットの (DataFrame, Partition のリスト)。版が変わらなかった月はその行を使い、
+    追記で変わった月だけをデータソースから読む
+    """
+    reuse = {}
+    if previous is not None:
+        previous_df, previous_parts = previous
+        reuse = {(p.key, p.version): p for p in previous_parts}
+
+    def combine():
+        return concat_partitions([
+            previous_df.iloc[reuse[key, part_version].rows] if (key, part_version) in reuse
+            else _read_partition(name, key, columns)
+            for key, part_version, _ in parts
+        ])
+
+    key = store.key((scope, tuple((key, part_version) for key, part_version, _ in parts)), name, columns)
+    return key, lambda: store.get_or_put(key, combine)
+
+
+def _previous_partitions(previous, name, columns):
+    """
+    直前のスナップショットで読み込み済みの (DataFrame, Partition のリスト)
+    読み込まれていない・列が違う・パーティションがない場合は None
+    """
+    if previous is None or not previous.data.loaded(name) or previous.data.get(f"{name}_partitions") is None:
+        return None
+    df = previous.data[name]
+    if columns is not None and list(df.columns) != list(columns):
+        return None
+    return df, previous.data[f"{name}_partitions"]
+
+
+def _table_loader(store, key, name, columns):
+    return lambda: store.get_or_put(key, lambda: _read_compact(name, columns))
+
+
+def _warm_snapshot(data, version, names):
+    """names のテーブルを読み込み、売上キューブと絞り込みインデックスも作っておく"""
+    for name in names:
+        data[name]
+    if "sales" in names:
+        sales_cube(data["sales"], version, partitions=data.get("sales_partitions"))
+        frame_index(data["sales"], SALES_INDEX_COLUMNS, version)
+    if "inventory" in names:
+        frame_index(data["inventory"], INVENTORY_INDEX_COLUMNS, version)
+
+
+def build_snapshot_data(version, tables):
+    """
+    版 version のデータ一式（LazyData）を作る（RefreshWorker のスレッドで実行する）
+    tables: ((テーブル名, 列のタプル), ...)
+    テーブルは最初に参照されたときに共有ストアに置き、memory-map した読み取り専用の DataFrame を使い回す
+    （他のプロセスが同じ版を置いていれば読み込み自体を省く）。開かれていないページのテーブルは読まない
+    直前の版で読み込まれていたテーブルだけはここで読み、売上キューブと絞り込みインデックスも作って、
+    切替後の再実行を待たせない（在庫状態・需要予測・グラフ・着地原価・地理などのエンジンは、使うページを開いたときに作る）
+    共有ストアのキーはテーブルごとの版（table_version）なので、他のテーブルが更新されても作り直さない
+    月別パーティションのテーブルは data["<テーブル名>_partitions"] に各月の行の範囲を入れる
+    データソースにないテーブルは data[テーブル名] を None にする
+    """
+    store = get_shared_store()
+    source = get_data_source()
+    previous = _active_worker.snapshot if _active_worker is not None else None
+    scope = None
+    if isinstance(source, SyntheticSource):
+        # ダミーデータは生成コードで中身が変わるので、このファイルの更新時刻もキーに含める
+        scope = os.path.getmtime(__file__)
+
+    loaders, values, keys = {}, {}, set()
+    for name, columns in tables:
+        if not source.has_table(name):
+            values[name] = None   # 任意のテーブル（需要履歴など）がないソース
+            continue
+        parts = source.partitions(name)
+        if parts is None:
+            key = store.key((scope, source.table_version(name)), name, columns)
+            loaders[name] = _table_loader(store, key, name, columns)
+        else:
+            key, loaders[name] = _partitioned_loader(
+                store, scope, name, columns, parts, _previous_partitions(previous, name, columns),
+            )
+            values[f"{name}_partitions"] = locate_partitions(parts)
+        keys.add(key)
+    loaders["supply_chain"] = load_supply_chain
+    values["store_keys"] = keys
+    data = LazyData(loaders, values)
+
+    if previous is not None:
+        _warm_snapshot(data, version, [name for name in loaders if previous.data.loaded(name)])
+
+    # 今の版と、切替直前まで表示していた版のファイルだけを残す
+    store.prune(keys | (previous.data["store_keys"] if previous is not None else set()))
+    return data
+
+
+class _RefreshThreadFilter(logging.Filter):
+    """更新スレッドはセッションの外で st.cache_* を呼ぶので、「ScriptRunContext がない」警告を出さない"""
+
+    def filter(self, record):
+        return threading.current_thread().name != REFRESH_THREAD_NAME
+
+
+@st.cache_resource
+def get_refresh_worker(tables, interval=None):
     """
-    全てのデータを一度に読み込む関数
-    戻り値: (売上DF, 在庫DF, サプライチェーンデータタプル)
+    データ一式をバックグラウンドで作り直すワーカー（プロセスで 1 つ）
+    各セッションは get_refresh_worker(...).current().data から読む
     """
-    return load_sales_data(), load_inventory_data(), load_supply_chain_data()
\ No newline at end of file
+    global _active_worker
+    logging.getLogger("streamlit.runtime.scriptrunner_utils.script_run_context").addFilter(_RefreshThreadFilter())
+    if interval is None:
+        interval = float(os.environ.get(REFRESH_INTERVAL_ENV, DEFAULT_REFRESH_SECONDS))
+    worker = RefreshWorker(
+        probe=lambda: get_data_source().cache_key,
+        build=lambda version: build_snapshot_data(version, tables),
+        interval=interval,
+        name=REFRESH_THREAD_NAME,
+    )
+    _active_worker = worker
+    return worker
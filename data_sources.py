@@ -0,0 +1,235 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from partitioned_store import PartitionedTable
+
+# ------------------------------------------------------------------
+# データソース層
+#   - SyntheticSource : data_loder のダミーデータ生成関数を利用
+#   - ParquetSource   : ローカルの Parquet / Arrow ファイルを memory-map で読込
+# どちらも read(name, columns, filters) で列の射影と行フィルタを受け付ける。
+# filters は [(列名, 演算子, 値), ...] の AND 条件（演算子: == != < <= > >= in not in）
+# 月別パーティションのテーブル（PARTITION_COLUMNS）は partitions(name) / read_partition(name, key, ...) で
+# 月単位にも読める（パーティションがないテーブル・レイアウトでは partitions は None）
+# 任意のテーブル（OPTIONAL_TABLES）は has_table(name) で有無を確かめてから読む
+# table_version(name) はテーブルごとの版（他のテーブルの更新では変わらない）。cache_key はソース全体の版
+# ------------------------------------------------------------------
+TABLES = ["sales", "inventory", "supply_nodes", "supply_flows", "demand_history"]
+OPTIONAL_TABLES = ["demand_history"]   # 需要履歴（倉庫 × 部品 × 月。ない場合は需要予測を行わない）
+FILE_EXTENSIONS = [".parquet", ".arrow", ".feather"]
+PARTITION_COLUMNS = {"sales": "Month"}
+
+
+def apply_filters(df, filters):
+    """pandas の DataFrame に filters を適用する（Synthetic 用のフォールバック）"""
+    if not filters:
+        return df
+    mask = pd.Series(True, index=df.index)
+    for col, op, value in filters:
+        s = df[col]
+        if op in ("==", "="): mask &= s == value
+        elif op == "!=": mask &= s != value
+        elif op == "<": mask &= s < value
+        elif op == "<=": mask &= s <= value
+        elif op == ">": mask &= s > value
+        elif op == ">=": mask &= s >= value
+        elif op == "in": mask &= s.isin(list(value))
+        elif op == "not in": mask &= ~s.isin(list(value))
+        else:
+            raise ValueError(f"未対応のフィルタ演算子です: {op}")
+    return df[mask.to_numpy()]
+
+
+def periods_to_strings(df):
+    """
+    Period 型のカテゴリ列（Month）は Arrow / Parquet に書けないので "YYYY-MM" 文字列のカテゴリにする
+    戻り値: (変換後の DataFrame, 変換した列名のリスト)
+    """
+    columns = []
+    for col in df.columns:
+        dtype = df[col].dtype
+        if isinstance(dtype, pd.CategoricalDtype) and isinstance(dtype.categories, pd.PeriodIndex):
+            df = df.assign(**{col: df[col].cat.rename_categories(dtype.categories.strftime("%Y-%m"))})
+            columns.append(col)
+    return df, columns
+
+
+def strings_to_periods(df, columns):
+    """periods_to_strings の逆変換（"YYYY-MM" 文字列のカテゴリを月順の Period カテゴリに戻す）"""
+    for col in columns:
+        if col not in df.columns or isinstance(df[col].cat.categories, pd.PeriodIndex):
+            continue
+        months = pd.PeriodIndex(df[col].cat.categories, freq="M")
+        df[col] = pd.Categorical.from_codes(df[col].cat.codes, months).reorder_categories(months.sort_values(), ordered=True)
+    return df
+
+
+def partition_key(value):
+    """パーティションのキー（月は "YYYY-MM"）"""
+    return value.strftime("%Y-%m") if isinstance(value, pd.Period) else str(value)
+
+
+def _project(df, columns):
+    return df[list(columns)] if columns else df
+
+
+def flows_to_frames(ports, warehouses, stores, inbound_flows, outbound_flows):
+    """サプライチェーンのタプル形式を nodes / flows の 2 テーブルに変換する"""
+    nodes = pd.DataFrame({
+        "Name": ports + warehouses + stores,
+        "Type": ["Port"] * len(ports) + ["Warehouse"] * len(warehouses) + ["Store"] * len(stores),
+    })
+    flows = pd.DataFrame(
+        [(s, t, v, "inbound") for s, t, v in inbound_flows]
+        + [(s, t, v, "outbound") for s, t, v in outbound_flows],
+        columns=["Source", "Target", "Volume", "Tier"],
+    )
+    return nodes, flows
+
+
+def frames_to_flows(nodes, flows):
+    """nodes / flows テーブルを load_supply_chain_data と同じタプル形式に戻す"""
+    names = {t: nodes.loc[nodes["Type"] == t, "Name"].astype(str).tolist() for t in ["Port", "Warehouse", "Store"]}
+    tiers = {}
+    for tier in ["inbound", "outbound"]:
+        f = flows[flows["Tier"] == tier]
+        tiers[tier] = list(zip(f["Source"].astype(str), f["Target"].astype(str), f["Volume"].astype(int)))
+    return names["Port"], names["Warehouse"], names["Store"], tiers["inbound"], tiers["outbound"]
+
+
+class SyntheticSource:
+    """ダミーデータ生成関数をテーブルとして公開するソース"""
+
+    def __init__(self, loaders):
+        self.loaders = loaders
+        self.cache_key = "synthetic"
+
+    def has_table(self, name):
+        return name in self.loaders
+
+    def table_version(self, name):
+        """生成データの版。生成関数は固定の引数で呼ぶので、テーブルごとに固定で扱う"""
+        return (self.cache_key, name)
+
+    def read(self, name, columns=None, filters=None):
+        return _project(apply_filters(self.loaders[name](), filters), columns)
+
+    def _partition_codes(self, name):
+        """パーティション列の (キーの一覧, 行ごとのコード)"""
+        column = PARTITION_COLUMNS.get(name)
+        if column is None:
+            return None, None
+        cat = pd.Categorical(self.loaders[name]()[column])
+        return [partition_key(k) for k in cat.categories], cat.codes
+
+    def partitions(self, name):
+        """[(キー, 版, 行数), ...]。生成データの版は生成関数のキャッシュと同じく固定で扱う"""
+        keys, codes = self._partition_codes(name)
+        if keys is None:
+            return None
+        counts = np.bincount(codes[codes >= 0], minlength=len(keys))
+        return [(key, self.table_version(name), int(n)) for key, n in zip(keys, counts) if n]
+
+    def read_partition(self, name, key, columns=None, filters=None):
+        keys, codes = self._partition_codes(name)
+        df = self.loaders[name]().iloc[np.flatnonzero(codes == keys.index(key))]
+        return _project(apply_filters(df, filters), columns)
+
+
+class ParquetSource:
+    """
+    ディレクトリ内の <テーブル名>.parquet / .arrow / .feather を読むソース
+    - Parquet: 列の射影と filters を行グループ単位でプッシュダウン
+    - Arrow IPC: memory-map したバッファから必要な列だけをゼロコピーで切り出す
+    - <テーブル名>/_manifest.json があれば月別パーティション（PartitionedTable）として読む
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def partitioned(self, name):
+        """<テーブル名>/_manifest.json があれば月別パーティションのテーブル（なければ None）"""
+        if name not in PARTITION_COLUMNS:
+            return None
+        table = PartitionedTable(self.root, name, PARTITION_COLUMNS[name])
+        return table if table.exists() else None
+
+    def path(self, name):
+        for ext in FILE_EXTENSIONS:
+            p = os.path.join(self.root, name + ext)
+            if os.path.exists(p):
+                return p
+        raise FileNotFoundError(f"{self.root} に {name} のデータファイルがありません")
+
+    def has_table(self, name):
+        if self.partitioned(name) is not None:
+            return True
+        try:
+            self.path(name)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def table_version(self, name):
+        """テーブルの版（ファイルの更新時刻・サイズ、月別パーティションなら全月の版。ファイルがなければ None）"""
+        table = self.partitioned(name)
+        if table is not None:
+            return (os.path.abspath(table.dir), table.cache_key)
+        try:
+            p = self.path(name)
+        except FileNotFoundError:
+            return None
+        return (os.path.abspath(p), os.path.getmtime(p), os.path.getsize(p))
+
+    @property
+    def cache_key(self):
+        """全テーブルの版をまとめたキー（どれかのファイルが差し替わればキャッシュを無効化する）"""
+        return (os.path.abspath(self.root), tuple((name, self.table_version(name)) for name in TABLES))
+
+    def read_arrow(self, name, columns=None, filters=None):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        p = self.path(name)
+        expr = pq.filters_to_expression([list(filters)]) if filters else None
+        if p.endswith(".parquet"):
+            return pq.read_table(p, columns=list(columns) if columns else None,
+                                 filters=expr, memory_map=True)
+        table = pa.ipc.open_file(pa.memory_map(p, "r")).read_all()
+        if expr is not None:
+            table = table.filter(expr)
+        return table.select(list(columns)) if columns else table
+
+    def read(self, name, columns=None, filters=None):
+        table = self.partitioned(name)
+        if table is not None:
+            return table.read(columns, filters)
+        return self.read_arrow(name, columns, filters).to_pandas()
+
+    def partitions(self, name):
+        table = self.partitioned(name)
+        return table.partitions() if table is not None else None
+
+    def read_partition(self, name, key, columns=None, filters=None):
+        return self.partitioned(name).read_partition(key, columns, filters)
+
+    def append(self, name, df, sort_by=None):
+        """月別パーティションのテーブルに追記する（df に含まれる月のファイルだけを書く）"""
+        return PartitionedTable(self.root, name, PARTITION_COLUMNS[name]).append(df, sort_by=sort_by)
+
+    def write(self, name, df, sort_by=None, row_group_size=1_000_000):
+        """
+        DataFrame を Parquet として保存する
+        sort_by を指定すると行グループの min/max が揃い、フィルタのプッシュダウンが効きやすくなる
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        os.makedirs(self.root, exist_ok=True)
+        if sort_by:
+            df = df.sort_values(sort_by, kind="stable")
+        df, _ = periods_to_strings(df)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, os.path.join(self.root, name + ".parquet"), row_group_size=row_group_size)
@@ -0,0 +1,199 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from supply_graph import NODE_TYPE_NAMES, PORT, STORE
+
+# ------------------------------------------------------------------
+# 停止シミュレーション（What-if）エンジン
+#   「拠点 X が止まったら、どの店舗がどれだけ供給を失うか」を疎行列演算で求める
+#   前提: 各拠点は、受け取れた入荷の割合と同じ割合で出荷できる（比例配分）
+# ------------------------------------------------------------------
+
+
+class DisruptionEngine:
+    """
+    SupplyGraph 上の停止状態を保持し、拠点・レーンの ON/OFF を差分で再計算する
+    avail[v]     : 拠点 v が平常時に対して出荷できる割合 (0〜1)
+    delivered[v] : 拠点 v が受け取れている入荷量
+    重い行列（入荷行列・依存度行列）は copy() したエンジン間で共有する
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        n, n_edges = graph.n_nodes, graph.n_edges
+        edge_ids = np.arange(n_edges)
+        # incoming[v, e] = レーン e の量（e の行き先が v のとき）
+        self.incoming = sparse.csr_matrix((graph.value, (graph.dst, edge_ids)), shape=(n, n_edges))
+        self.adjacency = sparse.csr_matrix((np.ones(n_edges), (graph.src, graph.dst)), shape=(n, n))
+        self.inflow = graph.in_volume()
+        self._dependency = None
+        self.node_on = np.ones(n, dtype=bool)
+        self.edge_on = np.ones(n_edges, dtype=bool)
+        self.avail = np.ones(n)
+        self.delivered = self.inflow.copy()
+        self._recompute(np.arange(n))
+
+    def copy(self):
+        """行列を共有したまま、停止状態だけを独立させたエンジンを返す"""
+        other = object.__new__(DisruptionEngine)
+        other.__dict__.update(self.__dict__)
+        for name in ["node_on", "edge_on", "avail", "delivered"]:
+            setattr(other, name, getattr(self, name).copy())
+        return other
+
+    # --------------------------------------------------------------
+    # 停止状態の更新（影響が及ぶ下流ノードだけを再計算）
+    # --------------------------------------------------------------
+    def _downstream(self, nodes):
+        reached = np.zeros(self.graph.n_nodes, dtype=bool)
+        for node in np.unique(nodes):
+            if not reached[node]:
+                reached[csgraph.breadth_first_order(self.adjacency, node, return_predecessors=False)] = True
+        return np.flatnonzero(reached)
+
+    def _recompute(self, nodes):
+        """nodes（ID 昇順＝層の順）について入荷量と出荷可能割合を更新する"""
+        g = self.graph
+        node_type = g.node_type[nodes]
+        for t in np.unique(node_type):
+            layer = nodes[node_type == t]
+            edge_factor = self.edge_on * self.avail[g.src]
+            self.delivered[layer] = self.incoming[layer] @ edge_factor
+            with np.errstate(divide="ignore", invalid="ignore"):
+                ratio = np.where(self.inflow[layer] > 0, self.delivered[layer] / self.inflow[layer], 1.0)
+            self.avail[layer] = self.node_on[layer] * ratio
+
+    def set_node(self, node, on):
+        node = self._node_id(node)
+        if self.node_on[node] != on:
+            self.node_on[node] = on
+            self._recompute(self._downstream([node]))
+
+    def set_edge(self, edge, on):
+        if self.edge_on[edge] != on:
+            self.edge_on[edge] = on
+            self._recompute(self._downstream([self.graph.dst[edge]]))
+
+    def apply(self, stopped_nodes=(), stopped_edges=()):
+        """停止する拠点・レーンの集合を指定し、前回との差分だけを再計算する"""
+        node_on = np.ones(self.graph.n_nodes, dtype=bool)
+        node_on[[self._node_id(v) for v in stopped_nodes]] = False
+        edge_on = np.ones(self.graph.n_edges, dtype=bool)
+        edge_on[list(stopped_edges)] = False
+
+        changed_nodes = np.flatnonzero(node_on != self.node_on)
+        changed_edges = np.flatnonzero(edge_on != self.edge_on)
+        if len(changed_nodes) == 0 and len(changed_edges) == 0:
+            return self
+        self.node_on, self.edge_on = node_on, edge_on
+        self._recompute(self._downstream(np.concatenate([changed_nodes, self.graph.dst[changed_edges]])))
+        return self
+
+    def _node_id(self, node):
+        return self.graph.index[node] if isinstance(node, str) else int(node)
+
+    # --------------------------------------------------------------
+    # 結果
+    # --------------------------------------------------------------
+    def store_loss(self):
+        """店舗ごとの欠品量（供給が減った店舗のみ、欠品量の多い順）"""
+        g = self.graph
+        stores = g.tier(STORE)
+        lost = self.inflow[stores] - self.delivered[stores]
+        df = pd.DataFrame({
+            "Store": g.labels[stores],
+            "Demand": self.inflow[stores],
+            "Delivered": self.delivered[stores],
+            "Lost": lost,
+            "LostRate": np.divide(lost, self.inflow[stores], out=np.zeros_like(lost), where=self.inflow[stores] > 0),
+        })
+        return df[df["Lost"] > 1e-9].sort_values("Lost", ascending=False, ignore_index=True)
+
+    @property
+    def dependency(self):
+        """
+        依存度行列 D（疎行列）: D[v, u] = 拠点 v の入荷のうち、上流の拠点 u を経由した割合
+        W[v, u] = u→v の量 / v の入荷量 として D = W + W² + ...（層の数まで）
+        """
+        if self._dependency is None:
+            g = self.graph
+            share = g.value / np.where(self.inflow[g.dst] > 0, self.inflow[g.dst], 1.0)
+            w = sparse.csr_matrix((share, (g.dst, g.src)), shape=(g.n_nodes, g.n_nodes))
+            d, power = w.copy(), w
+            for _ in range(len(NODE_TYPE_NAMES)):
+                power = power @ w
+                if power.nnz == 0:
+                    break
+                d = d + power
+            self._dependency = d.tocsr()
+        return self._dependency
+
+    def upstream_shares(self, node):
+        """拠点 node の入荷が各上流拠点にどれだけ依存しているか（割合の高い順）"""
+        g = self.graph
+        row = self.dependency[self._node_id(node)]
+        df = pd.DataFrame({
+            "Node": g.labels[row.indices],
+            "Type": np.array(NODE_TYPE_NAMES)[g.node_type[row.indices]],
+            "Share": row.data,
+        })
+        return df.sort_values("Share", ascending=False, ignore_index=True)
+
+    def impact_ranking(self):
+        """
+        平常時に各拠点が単独で止まった場合の店舗欠品量（全拠点を疎行列積 1 回で計算）
+        """
+        g = self.graph
+        store_demand = np.where(g.node_type == STORE, self.inflow, 0.0)
+        d = self.dependency
+        lost = d.T @ store_demand
+        affected = (d[g.tier(STORE)] > 0).sum(axis=0).A1
+        df = pd.DataFrame({
+            "Node": g.labels,
+            "Type": np.array(NODE_TYPE_NAMES)[g.node_type],
+            "LostVolume": lost,
+            "AffectedStores": affected,
+            "LostShare": lost / max(store_demand.sum(), 1.0),
+        })
+        df = df[df["Type"] != NODE_TYPE_NAMES[STORE]]
+        return df.sort_values("LostVolume", ascending=False, ignore_index=True)
+
+    def bottlenecks(self, capacity=None):
+        """
+        港 → 店舗 の最大流と最小カット（現在の停止状態を反映）
+        capacity: レーンごとの容量（省略時はレーンの量）。整数に丸めて計算する
+        戻り値: (最大流量, 最小カットの辺 DataFrame)
+        """
+        g = self.graph
+        n = g.n_nodes
+        source, sink = n, n + 1
+        cap = np.asarray(g.value if capacity is None else capacity, dtype=np.float64)
+        cap = np.where(self.edge_on & self.node_on[g.src] & self.node_on[g.dst], cap, 0.0)
+
+        ports = g.tier(PORT)
+        stores = g.tier(STORE)
+        out_cap = np.bincount(g.src, weights=cap, minlength=n)
+        rows = np.concatenate([g.src, np.full(len(ports), source), stores])
+        cols = np.concatenate([g.dst, ports, np.full(len(stores), sink)])
+        caps = np.concatenate([cap, out_cap[ports] * self.node_on[ports], self.inflow[stores]])
+        caps = np.rint(caps).astype(np.int32)
+        network = sparse.csr_matrix((caps, (rows, cols)), shape=(n + 2, n + 2))
+        result = csgraph.maximum_flow(network, source, sink)
+
+        # 残余グラフで source から到達できる側と、できない側の境界が最小カット
+        residual = network - result.flow
+        residual.data = np.where(residual.data > 0, 1, 0)
+        residual.eliminate_zeros()
+        reached = np.zeros(n + 2, dtype=bool)
+        reached[csgraph.breadth_first_order(residual, source, return_predecessors=False)] = True
+        # source→港 のカットは港の供給量、店舗→sink のカットは店舗の需要量が制約になっていることを表す
+        labels = np.concatenate([g.labels, np.array(["（港の供給量）", "（店舗の需要量）"], dtype=object)])
+        cut = reached[rows] & ~reached[cols] & (caps > 0)
+        df_cut = pd.DataFrame({
+            "Source": labels[rows[cut]],
+            "Target": labels[cols[cut]],
+            "Capacity": caps[cut],
+        }).sort_values("Capacity", ascending=False, ignore_index=True)
+        return result.flow_value, df_cut
@@ -0,0 +1,157 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------
+# 需要予測と安全在庫（倉庫 × 部品の全系列を一括で計算する）
+#   history は (系列数, 月数) の配列。系列の方向にベクトル化し、ループは月数 × 平滑化係数の候補だけ回す
+#   - 毎月需要がある系列      : 単純指数平滑（SES）
+#   - 需要が間欠的な系列      : Croston 法（SBA 補正）。需要量と需要間隔を別々に平滑化する
+#   平滑化係数は候補の中から 1 期先予測の二乗誤差が最小のものを系列ごとに選ぶ
+#   安全在庫 = z(サービス率) × 予測誤差の標準偏差 × √(調達リードタイム[月])
+#   系列数が多いときは倉庫単位に分けてプロセスプールで並列に計算する
+# ------------------------------------------------------------------
+SERVICE_LEVEL = 0.95          # 欠品させない確率（サイクルサービス率）
+LEAD_TIME_MONTHS = 1.0        # 発注から入荷までの月数
+ALPHAS = (0.05, 0.1, 0.2, 0.3, 0.5)
+INTERMITTENT_ADI = 1.32       # 平均需要間隔（月）がこれを超える系列は間欠需要として Croston 法を使う
+METHODS = ["SES", "Croston"]
+
+FORECAST_WORKERS_ENV = "DASHBOARD_FORECAST_WORKERS"   # 並列計算のプロセス数（既定は CPU 数）
+PARALLEL_MIN_SERIES = 200_000                          # これ未満の系列数ならプロセスを起動せずに計算する
+CHUNKS_PER_WORKER = 4
+
+
+def _select(best_sse, best, sse, values):
+    """二乗誤差が小さくなった系列だけ values で置き換える"""
+    better = sse < best_sse
+    for key, value in values.items():
+        best[key] = np.where(better, value, best[key])
+    return np.where(better, sse, best_sse)
+
+
+def _by_month(history):
+    """(系列数, 月数) → 月ごとに連続した (月数, 系列数) の float64 配列（月のループで列を連続アクセスする）"""
+    return np.ascontiguousarray(np.asarray(history).T, dtype=np.float64)
+
+
+def fit_ses(history, alphas=ALPHAS):
+    """単純指数平滑。戻り値: (翌月の予測, 1 期先予測誤差の RMSE, 選んだ係数)"""
+    y = _by_month(history)
+    n_months, n = y.shape
+    best_sse = np.full(n, np.inf)
+    best = {"forecast": np.zeros(n), "sse": np.zeros(n), "alpha": np.zeros(n)}
+    err = np.empty(n)
+    for alpha in alphas:
+        level = y[0].copy()
+        sse = np.zeros(n)
+        for t in range(1, n_months):
+            np.subtract(y[t], level, out=err)
+            level += alpha * err
+            err *= err
+            sse += err
+        best_sse = _select(best_sse, best, sse, {"forecast": level, "sse": sse, "alpha": alpha})
+    rmse = np.sqrt(best["sse"] / max(n_months - 1, 1))
+    return best["forecast"], rmse, best["alpha"]
+
+
+def fit_croston(history, alphas=ALPHAS):
+    """
+    Croston 法（SBA 補正）。戻り値: (翌月の予測, 1 期先予測誤差の RMSE, 選んだ係数)
+    需要量 z と需要間隔 p を需要のあった月だけ更新し、予測は (1 - α/2) × z / p
+    """
+    y = _by_month(history)
+    n_months, n = y.shape
+    hits = (y > 0).astype(np.float64)   # 需要のあった月 = 1（マスクの代わりに掛け算で更新する）
+    # 初期値は全期間の平均需要量と平均間隔（需要が一度もない系列は予測 0）
+    n_demands = hits.sum(axis=0)
+    z0 = np.divide(y.sum(axis=0), n_demands, out=np.zeros(n), where=n_demands > 0)
+    p0 = np.divide(n_months, n_demands, out=np.ones(n), where=n_demands > 0)
+
+    best_sse = np.full(n, np.inf)
+    best = {"forecast": np.zeros(n), "sse": np.zeros(n), "alpha": np.zeros(n)}
+    for alpha in alphas:
+        z, p = z0.copy(), p0.copy()
+        since = np.ones(n)   # 前回の需要からの月数
+        sse = np.zeros(n)
+        for t in range(n_months):
+            err = y[t] - (1 - alpha / 2) * z / p
+            sse += err * err
+            step = alpha * hits[t]
+            z += step * (y[t] - z)
+            p += step * (since - p)
+            since *= 1 - hits[t]
+            since += 1
+        forecast = np.where(n_demands > 0, (1 - alpha / 2) * z / p, 0.0)
+        best_sse = _select(best_sse, best, sse, {"forecast": forecast, "sse": sse, "alpha": alpha})
+    rmse = np.sqrt(best["sse"] / n_months)
+    return best["forecast"], rmse, best["alpha"]
+
+
+def fit_series(history):
+    """
+    系列ごとに SES / Croston を選んで当てはめる（プロセスプールのワーカーでも実行する）
+    戻り値: (予測, 予測誤差の標準偏差, 手法 0=SES / 1=Croston)
+    """
+    n, n_months = history.shape
+    n_demands = np.count_nonzero(history, axis=1)
+    intermittent = n_months > INTERMITTENT_ADI * np.maximum(n_demands, 1)
+    forecast, sigma = np.zeros(n), np.zeros(n)
+    for method, rows in enumerate([np.flatnonzero(~intermittent), np.flatnonzero(intermittent)]):
+        if len(rows):
+            fit = fit_croston if method else fit_ses
+            forecast[rows], sigma[rows], _ = fit(history[rows])
+    return forecast, sigma, intermittent.astype(np.int8)
+
+
+def safety_stock(sigma, service_level=SERVICE_LEVEL, lead_time_months=LEAD_TIME_MONTHS):
+    """サービス率を満たす安全在庫（切り上げた整数）"""
+    return np.ceil(NormalDist().inv_cdf(service_level) * np.asarray(sigma) * np.sqrt(lead_time_months)).astype(np.int64)
+
+
+def _chunks(groups, n_chunks):
+    """groups（倉庫コード）が同じ行を分けずに、行数がおおよそ均等な n_chunks 個の行番号の配列に分ける"""
+    order = np.argsort(groups, kind="stable")
+    sorted_groups = groups[order]
+    starts = np.flatnonzero(np.r_[True, sorted_groups[1:] != sorted_groups[:-1]])
+    targets = np.arange(1, n_chunks) * len(order) // n_chunks
+    cuts = np.unique(starts[np.clip(np.searchsorted(starts, targets), 0, len(starts) - 1)])
+    return [rows for rows in np.split(order, cuts[cuts > 0]) if len(rows)]
+
+
+def forecast_workers():
+    value = os.environ.get(FORECAST_WORKERS_ENV)
+    return max(int(value), 1) if value else (os.cpu_count() or 1)
+
+
+def forecast_demand(history, groups=None, workers=None,
+                    service_level=SERVICE_LEVEL, lead_time_months=LEAD_TIME_MONTHS):
+    """
+    全系列の需要予測と安全在庫を DataFrame（ForecastDemand / DemandSigma / SafetyStock / Method）で返す
+    history: (系列数, 月数) の月次需要 / groups: 系列の倉庫コード（並列計算の分割単位）
+    """
+    history = np.asarray(history)
+    n = len(history)
+    workers = forecast_workers() if workers is None else workers
+    if workers <= 1 or n < PARALLEL_MIN_SERIES:
+        forecast, sigma, method = fit_series(history)
+    else:
+        groups = np.zeros(n, dtype=np.int64) if groups is None else np.asarray(groups)
+        parts = _chunks(groups, workers * CHUNKS_PER_WORKER)
+        forecast, sigma, method = np.zeros(n), np.zeros(n), np.zeros(n, dtype=np.int8)
+        # スレッドの多いプロセス（Streamlit のサーバなど）からの fork はロックを抱えたまま複製されうるので spawn で起動する
+        with ProcessPoolExecutor(min(workers, len(parts)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            for rows, result in zip(parts, pool.map(fit_series, (history[rows] for rows in parts))):
+                forecast[rows], sigma[rows], method[rows] = result
+
+    return pd.DataFrame({
+        "ForecastDemand": np.round(forecast, 1).astype(np.float32),
+        "DemandSigma": np.round(sigma, 1).astype(np.float32),
+        "SafetyStock": safety_stock(sigma, service_level, lead_time_months),
+        "Method": pd.Categorical.from_codes(method, METHODS),
+    })
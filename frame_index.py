@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------
+# 行位置インデックス（サイドバーの絞り込み用）
+#   列ごとに、行番号をカテゴリコード順に並べた配列（positions）と、コードごとの開始位置（bounds）を持つ
+#   - 値の集合・範囲の条件はカテゴリ（数十〜数千件）の上で評価し、該当コードの区間をつなげて行番号にする
+#   - 複数の条件は、件数が最も少ない条件の行だけを取り出し、残りの条件はコードの参照表で確かめる
+#   filters は data_sources と同じ [(列名, 演算子, 値), ...] の AND 条件
+# ------------------------------------------------------------------
+
+
+def _category_mask(categories, op, value):
+    """カテゴリ（値の一覧）のうち条件を満たすものの bool 配列"""
+    if op in ("==", "="): return np.asarray(categories == value)
+    if op == "!=": return np.asarray(categories != value)
+    if op == "<": return np.asarray(categories < value)
+    if op == "<=": return np.asarray(categories <= value)
+    if op == ">": return np.asarray(categories > value)
+    if op == ">=": return np.asarray(categories >= value)
+    if op == "in": return np.asarray(categories.isin(list(value)))
+    if op == "not in": return ~np.asarray(categories.isin(list(value)))
+    raise ValueError(f"未対応のフィルタ演算子です: {op}")
+
+
+class ColumnIndex:
+    """1 列分のインデックス（codes は -1 = 欠損を 0 番に寄せて 1 ずらして持つ）"""
+
+    def __init__(self, column):
+        cat = pd.Categorical(column)
+        self.categories = cat.categories
+        # コードの型を小さくすると安定ソートが基数ソートになり速い
+        self.codes = cat.codes.astype(np.int16 if len(self.categories) < 2 ** 15 - 1 else np.int32) + 1
+        dtype = np.int32 if len(column) < 2 ** 31 else np.int64
+        self.positions = np.argsort(self.codes, kind="stable").astype(dtype)
+        counts = np.bincount(self.codes, minlength=len(self.categories) + 1)
+        self.bounds = np.concatenate([[0], np.cumsum(counts)])
+
+    def allowed(self, filters):
+        """filters をすべて満たすコード（1 ずらし済み）の bool 配列。欠損の行は含めない"""
+        mask = np.ones(len(self.categories), dtype=bool)
+        for op, value in filters:
+            mask &= _category_mask(self.categories, op, value)
+        return np.concatenate([[False], mask])
+
+    def count(self, allowed):
+        return int(np.diff(self.bounds)[allowed].sum())
+
+    def rows(self, allowed):
+        """allowed のコードに該当する行番号（連続したコードなら positions の 1 区間で済む）"""
+        codes = np.flatnonzero(allowed)
+        if len(codes) == 0:
+            return self.positions[:0]
+        if codes[-1] - codes[0] + 1 == len(codes):
+            return self.positions[self.bounds[codes[0]]: self.bounds[codes[-1] + 1]]
+        return np.concatenate([self.positions[self.bounds[c]: self.bounds[c + 1]] for c in codes])
+
+
+class FrameIndex:
+    """
+    DataFrame の絞り込み用インデックス（データの版ごとに 1 回だけ作る）
+    select(filters) で条件に合う行番号（昇順）を返す。条件がなければ None（= 全行）
+    """
+
+    def __init__(self, df, columns):
+        self.n_rows = len(df)
+        self.columns = {col: ColumnIndex(df[col]) for col in columns}
+
+    def categories(self, column):
+        return self.columns[column].categories
+
+    def select(self, filters=None):
+        by_column = {}
+        for col, op, value in filters or []:
+            if col not in self.columns:
+                raise KeyError(f"インデックスのない列です: {col}")
+            by_column.setdefault(col, []).append((op, value))
+
+        # 各条件を「許可するコード」にし、全コードを許可する条件は捨てる
+        criteria = []
+        for col, col_filters in by_column.items():
+            index = self.columns[col]
+            allowed = index.allowed(col_filters)
+            count = index.count(allowed)
+            if count < self.n_rows:
+                criteria.append((count, index, allowed))
+        if not criteria:
+            return None
+
+        criteria.sort(key=lambda c: c[0])
+        _, driver, allowed = criteria[0]
+        rows = driver.rows(allowed)
+        for _, index, allowed in criteria[1:]:
+            rows = rows[allowed[index.codes[rows]]]
+        # 行番号を元の順に戻す（件数が多いときは並べ替えより bool 配列の方が速い）
+        if len(rows) > self.n_rows // 16:
+            mask = np.zeros(self.n_rows, dtype=bool)
+            mask[rows] = True
+            return np.flatnonzero(mask)
+        return np.sort(rows)
+
+
+def filters_key(filters):
+    """filters をキャッシュのキーに使える形（タプル）にする"""
+    return tuple(
+        (col, op, tuple(value) if isinstance(value, (list, tuple, set)) else value)
+        for col, op, value in filters or []
+    )
@@ -0,0 +1,268 @@
+import numpy as np
+import pandas as pd
+
+from supply_graph import NODE_TYPE_NAMES, PORT, STORE, WAREHOUSE
+
+# ------------------------------------------------------------------
+# 拠点の座標と距離計算
+#   - SiteTable   : 拠点名・緯度・経度・種別を配列で持つマスタ
+#   - haversine / haversine_matrix : 大円距離（km）。行列は単位ベクトルの内積で一括計算する
+#   - GridIndex   : 緯度経度の格子で点を分けた最近傍探索用のインデックス
+#   - NetworkGeo  : SupplyGraph の各レーンの距離・量×距離と、最寄り拠点への付け替え案
+# ------------------------------------------------------------------
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = np.pi * EARTH_RADIUS_KM / 180
+GRID_POINTS_PER_CELL = 4           # 格子 1 つ当たりの点数の目安
+MATRIX_BATCH_ELEMENTS = 1 << 22    # 距離行列を一度に計算する要素数の上限
+
+# 付け替え案に出す条件（今の距離との差と、短くなる割合の両方を満たすレーン）
+REASSIGN_MIN_SAVING_KM = 50.0
+REASSIGN_MIN_SAVING_RATIO = 0.3
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """大円距離（km）。引数は度単位の配列（ブロードキャスト可）"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float32):
+    """
+    (len(lat1), len(lat2)) の距離行列（km）
+    球面上の 2 点の単位ベクトルの内積 d から、haversine と同じ値を 2R·asin(√((1 - d) / 2)) で求める
+    （内積は行列積で一括計算でき、三角関数は点の数だけで済む）。行はバッチに分けて計算する
+    """
+    a, b = _unit_vectors(lat1, lon1), _unit_vectors(lat2, lon2)
+    out = np.empty((len(a), len(b)), dtype=dtype)
+    batch = max(MATRIX_BATCH_ELEMENTS // max(len(b), 1), 1)
+    for start in range(0, len(a), batch):
+        dot = a[start:start + batch] @ b.T
+        np.clip((1 - dot) / 2, 0.0, 1.0, out=dot)
+        out[start:start + batch] = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(dot))
+    return out
+
+
+def _concat_ranges(starts, lengths):
+    """[starts[i], starts[i] + lengths[i]) の区間をつないだ配列（ループなし）"""
+    total = int(lengths.sum())
+    first = np.cumsum(lengths) - lengths
+    return np.arange(total) - np.repeat(first - starts, lengths)
+
+
+class SiteTable:
+    """拠点のマスタ（names / lat / lon / kind の配列）"""
+
+    def __init__(self, names, lat, lon, kind):
+        self.names = np.asarray(names, dtype=object)
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.kind = np.asarray(kind, dtype=object)
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    @classmethod
+    def from_dict(cls, locations):
+        """{拠点名: {"lat", "lon", "type"}} から作る"""
+        names = list(locations)
+        return cls(names, [locations[n]["lat"] for n in names], [locations[n]["lon"] for n in names],
+                   [locations[n]["type"] for n in names])
+
+    def __len__(self):
+        return len(self.names)
+
+    def lookup(self, names):
+        """拠点名の配列 → 行番号（座標のない拠点は -1）"""
+        return np.array([self.index.get(name, -1) for name in names], dtype=np.int64)
+
+    def frame(self, rows=None):
+        rows = slice(None) if rows is None else rows
+        return pd.DataFrame({"Name": self.names[rows], "lat": self.lat[rows], "lon": self.lon[rows],
+                             "type": self.kind[rows]})
+
+
+class GridIndex:
+    """
+    点を緯度経度の格子に分け、格子ごとの点を CSR 形式（order / bounds）で持つ
+    nearest() は問い合わせ点の周囲 3×3 格子の候補だけと距離を比べ、
+    その範囲で確実に最近傍と言えない点（周囲に点がない・格子の外側の方が近いかもしれない）だけを全点と比べる
+    """
+
+    def __init__(self, lat, lon, cell_deg=None):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        n = len(self.lat)
+        if n == 0:
+            raise ValueError("点が 1 つもありません")
+        self.lat0, self.lon0 = self.lat.min(), self.lon.min()
+        lat_span, lon_span = np.ptp(self.lat), np.ptp(self.lon)
+        if cell_deg is None:
+            # 範囲の面積を点数で割り、格子 1 つに GRID_POINTS_PER_CELL 個ほど入る大きさにする
+            area = max(lat_span, 1e-3) * max(lon_span, 1e-3)
+            cell_deg = np.sqrt(area * GRID_POINTS_PER_CELL / n)
+        self.cell = float(cell_deg)
+        self.n_rows = int(lat_span // self.cell) + 1
+        self.n_cols = int(lon_span // self.cell) + 1
+        cell_ids = self._rows(self.lat) * self.n_cols + self._cols(self.lon)
+        self.order = np.argsort(cell_ids, kind="stable")
+        self.bounds = np.concatenate([[0], np.cumsum(np.bincount(cell_ids, minlength=self.n_rows * self.n_cols))])
+
+    def _rows(self, lat):
+        return np.clip(((lat - self.lat0) // self.cell).astype(np.int64), 0, self.n_rows - 1)
+
+    def _cols(self, lon):
+        return np.clip(((lon - self.lon0) // self.cell).astype(np.int64), 0, self.n_cols - 1)
+
+    def _guaranteed_km(self, lat, lon, rows, cols):
+        """周囲 3×3 格子の外にある点までの距離の下限（格子の外側に点がない方向は無限大）"""
+        lo_lat = np.where(rows > 0, self.lat0 + (rows - 1) * self.cell, -np.inf)
+        hi_lat = np.where(rows < self.n_rows - 1, self.lat0 + (rows + 2) * self.cell, np.inf)
+        lo_lon = np.where(cols > 0, self.lon0 + (cols - 1) * self.cell, -np.inf)
+        hi_lon = np.where(cols < self.n_cols - 1, self.lon0 + (cols + 2) * self.cell, np.inf)
+        lat_margin = np.minimum(lat - lo_lat, hi_lat - lat)
+        # 経度 1 度の長さは高緯度ほど短いので、範囲内で最も極に近い緯度で換算する
+        max_abs_lat = np.minimum(np.abs(lat) + self.cell * 2, 90.0)
+        lon_margin = np.minimum(lon - lo_lon, hi_lon - lon) * np.cos(np.radians(max_abs_lat))
+        return np.minimum(lat_margin, lon_margin) * KM_PER_DEGREE
+
+    def nearest(self, lat, lon):
+        """各問い合わせ点の最近傍点の (番号, 距離 km)"""
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        n_q = len(lat)
+        rows, cols = self._rows(lat), self._cols(lon)
+
+        # 周囲 3×3 格子の候補を (問い合わせ点, 候補点) の組にして距離を一括計算する
+        d_row = np.repeat([-1, 0, 1], 3)
+        d_col = np.tile([-1, 0, 1], 3)
+        r, c = rows[:, None] + d_row, cols[:, None] + d_col
+        valid = (r >= 0) & (r < self.n_rows) & (c >= 0) & (c < self.n_cols)
+        cell = np.where(valid, r * self.n_cols + c, 0)
+        starts = self.bounds[cell]
+        lengths = np.where(valid, self.bounds[cell + 1] - starts, 0).ravel()
+        query = np.repeat(np.repeat(np.arange(n_q), 9), lengths)
+        candidate = self.order[_concat_ranges(starts.ravel(), lengths)]
+        dist = haversine(lat[query], lon[query], self.lat[candidate], self.lon[candidate])
+
+        best = np.full(n_q, -1, dtype=np.int64)
+        best_km = np.full(n_q, np.inf)
+        counts = lengths.reshape(n_q, 9).sum(axis=1)
+        found = counts > 0
+        if found.any():
+            # 候補は問い合わせ点ごとに連続しているので、区間ごとの最小値を reduceat で求める（並べ替えなし）
+            best_km[found] = np.minimum.reduceat(dist, (np.cumsum(counts) - counts)[found])
+            hit = np.flatnonzero(dist == best_km[query])
+            first = hit[np.r_[True, query[hit][1:] != query[hit][:-1]]]
+            best[query[first]] = candidate[first]
+
+        # 3×3 格子の範囲で確定できない点だけ全点と比べる
+        unsure = np.flatnonzero(best_km > self._guaranteed_km(lat, lon, rows, cols))
+        if len(unsure):
+            matrix = haversine_matrix(lat[unsure], lon[unsure], self.lat, self.lon, dtype=np.float64)
+            best[unsure] = matrix.argmin(axis=1)
+            best_km[unsure] = matrix[np.arange(len(unsure)), best[unsure]]
+        return best, best_km
+
+
+class NetworkGeo:
+    """
+    SupplyGraph のノードに座標を割り当て、レーンの距離（km）と量×距離（unit·km）を配列で持つ
+    座標のない拠点を含むレーンは距離を NaN とし、unmapped_lanes() で一覧できる
+    """
+
+    def __init__(self, graph, sites):
+        self.graph = graph
+        self.sites = sites
+        self.node_site = sites.lookup(graph.labels)
+        self.node_mapped = self.node_site >= 0
+        safe = np.where(self.node_mapped, self.node_site, 0)
+        self.node_lat = np.where(self.node_mapped, sites.lat[safe], np.nan)
+        self.node_lon = np.where(self.node_mapped, sites.lon[safe], np.nan)
+
+        g = graph
+        self.lane_mapped = self.node_mapped[g.src] & self.node_mapped[g.dst]
+        self.lane_km = haversine(self.node_lat[g.src], self.node_lon[g.src], self.node_lat[g.dst], self.node_lon[g.dst])
+        self.volume_km = g.value * self.lane_km
+        self._grids = {}
+
+    def site_frame(self):
+        """グラフに含まれ、座標のある拠点の一覧（地図のマーカー用）"""
+        return self.sites.frame(self.node_site[self.node_mapped])
+
+    def lane_frame(self):
+        """座標のあるレーンの一覧（始点・終点の座標、量、距離、量×距離）"""
+        g, lanes = self.graph, np.flatnonzero(self.lane_mapped)
+        src, dst = g.src[lanes], g.dst[lanes]
+        return pd.DataFrame({
+            "Source": g.labels[src], "Target": g.labels[dst], "Volume": g.value[lanes],
+            "DistanceKm": self.lane_km[lanes].round(1), "VolumeKm": self.volume_km[lanes].round(0),
+            "SourceLat": self.node_lat[src], "SourceLon": self.node_lon[src],
+            "TargetLat": self.node_lat[dst], "TargetLon": self.node_lon[dst],
+        })
+
+    def unmapped_lanes(self):
+        """座標のない拠点を含むレーン（地図・距離の集計から外れるもの）"""
+        g, lanes = self.graph, np.flatnonzero(~self.lane_mapped)
+        src, dst = g.src[lanes], g.dst[lanes]
+        missing = np.where(~self.node_mapped[src], g.labels[src], g.labels[dst])
+        return pd.DataFrame({"Source": g.labels[src], "Target": g.labels[dst], "Volume": g.value[lanes],
+                             "MissingSite": missing})
+
+    def nearest(self, node_type, nodes):
+        """nodes（ノード ID）ごとに、node_type の層で座標のある最寄りのノードの (ID, 距離 km)"""
+        if node_type not in self._grids:
+            tier = self.graph.tier(node_type)
+            tier = tier[self.node_mapped[tier]]
+            self._grids[node_type] = (tier, GridIndex(self.node_lat[tier], self.node_lon[tier]) if len(tier) else None)
+        tier, grid = self._grids[node_type]
+        if grid is None:
+            return np.full(len(nodes), -1), np.full(len(nodes), np.nan)
+        best, km = grid.nearest(self.node_lat[nodes], self.node_lon[nodes])
+        return tier[best], km
+
+    def reassignments(self, dst_type=STORE, min_saving_km=REASSIGN_MIN_SAVING_KM,
+                      min_saving_ratio=REASSIGN_MIN_SAVING_RATIO):
+        """
+        dst_type の層への各レーンについて、出荷元を最寄りの拠点に替えた場合の距離と量×距離の削減
+        （店舗なら最寄りの倉庫、倉庫なら最寄りの港）。削減が大きい順
+        """
+        g = self.graph
+        lanes = np.flatnonzero(self.lane_mapped & (g.node_type[g.dst] == dst_type))
+        empty = pd.DataFrame(columns=["Target", "Current", "CurrentKm", "Proposed", "ProposedKm", "Volume", "SavedVolumeKm"])
+        if len(lanes) == 0:
+            return empty
+        nearest, nearest_km = self.nearest(dst_type - 1, g.dst[lanes])
+        current_km = self.lane_km[lanes]
+        saving = current_km - nearest_km
+        hit = (nearest >= 0) & (nearest != g.src[lanes]) & (saving >= min_saving_km) \
+            & (saving >= min_saving_ratio * current_km)
+        if not hit.any():
+            return empty
+        lanes, nearest, nearest_km, saving = lanes[hit], nearest[hit], nearest_km[hit], saving[hit]
+        df = pd.DataFrame({
+            "Target": g.labels[g.dst[lanes]], "Current": g.labels[g.src[lanes]],
+            "CurrentKm": self.lane_km[lanes].round(1), "Proposed": g.labels[nearest],
+            "ProposedKm": nearest_km.round(1), "Volume": g.value[lanes],
+            "SavedVolumeKm": (g.value[lanes] * saving).round(0),
+        })
+        return df.sort_values("SavedVolumeKm", ascending=False, kind="stable", ignore_index=True)
+
+    def summary(self):
+        """層ごとのレーン数・座標なしのレーン数・総量×距離・量で加重した平均距離"""
+        g = self.graph
+        tier = g.node_type[g.src]
+        rows = []
+        for t in (PORT, WAREHOUSE):
+            lanes = tier == t
+            mapped = lanes & self.lane_mapped
+            volume = g.value[mapped].sum()
+            rows.append({
+                "Tier": f"{NODE_TYPE_NAMES[t]}→{NODE_TYPE_NAMES[t + 1]}", "Lanes": int(lanes.sum()),
+                "Unmapped": int((lanes & ~self.lane_mapped).sum()), "VolumeKm": float(self.volume_km[mapped].sum()),
+                "AvgKm": float(self.volume_km[mapped].sum() / volume) if volume else np.nan,
+            })
+        return pd.DataFrame(rows)
@@ -0,0 +1,174 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------
+# 在庫状態エンジン
+#   入出庫イベント（倉庫, 部品, 増減数）をバッチで適用し、
+#   変化した行だけ TotalValue / InventoryMonths / アラート判定を更新する
+# ------------------------------------------------------------------
+EXCESS_MONTHS = 3.0   # 在庫月数がこれ以上なら滞留・過剰在庫
+ALERT_SORTS = ["stock", "shortfall"]   # 緊急手配リストの並び順（在庫数の少ない順 / 不足数の多い順）
+
+
+class InventoryState:
+    """
+    倉庫 × 部品ごとの在庫を配列で保持する（スレッドセーフ）
+    - alert_mask / excess_mask と件数・資産総額は差分で更新する
+    - alert_page() は欠品アラート行だけを並べ替え済みのまま切り出す（全件の走査はしない）
+    """
+
+    def __init__(self, df_inventory):
+        df = df_inventory.reset_index(drop=True)
+        # キーはカテゴリのコードからそのまま作る（行ごとの文字列は作らない）
+        warehouse = pd.Categorical(df["Warehouse"])
+        product = pd.Categorical(df["Product"])
+        self.keys = pd.MultiIndex(
+            levels=[warehouse.categories.astype(str), product.categories.astype(str)],
+            codes=[warehouse.codes, product.codes], names=["Warehouse", "Product"],
+        )
+        self.stock = df["Stock"].to_numpy(dtype=np.int64).copy()
+        self.safety_stock = df["SafetyStock"].to_numpy(dtype=np.int64)
+        self.monthly_demand = df["MonthlyDemand"].to_numpy(dtype=np.int64)
+        # 在庫月数は需要予測で割る（ForecastDemand は data_loder.with_demand_forecast で加える）
+        # 需要履歴がなく予測していない場合は MonthlyDemand で割り、ForecastDemand 列は出さない
+        self.has_forecast = "ForecastDemand" in df.columns
+        self.forecast_demand = df["ForecastDemand" if self.has_forecast else "MonthlyDemand"].to_numpy(dtype=np.float64)
+        self.unit_cost = df["UnitCost"].to_numpy(dtype=np.int64)
+        self.total_value = self.stock * self.unit_cost
+        self.inventory_months = self._months(np.arange(len(df)))
+        self.alert_mask = self.stock < self.safety_stock
+        self.excess_mask = self.inventory_months >= EXCESS_MONTHS
+
+        self.total_value_sum = int(self.total_value.sum())
+        self.alert_count = int(self.alert_mask.sum())
+        self.excess_count = int(self.excess_mask.sum())
+        self.version = 0
+        self._alert_order = None
+        self._snapshot = None
+        self._lock = threading.RLock()
+
+    def _months(self, rows):
+        demand = self.forecast_demand[rows]
+        months = np.divide(self.stock[rows], demand, out=np.zeros(len(rows)), where=demand > 0)
+        return np.round(months, 1)
+
+    # --------------------------------------------------------------
+    # イベント適用
+    # --------------------------------------------------------------
+    def row_ids(self, warehouses, products):
+        """(倉庫, 部品) の配列を行番号に変換する（未登録の組み合わせは -1）"""
+        return self.keys.get_indexer(pd.MultiIndex.from_arrays([np.asarray(warehouses), np.asarray(products)]))
+
+    def apply_events(self, warehouses, products, deltas):
+        """入出庫イベントのバッチを適用する（deltas: 入庫は正、出庫は負）。未登録の組み合わせは無視"""
+        rows = self.row_ids(warehouses, products)
+        known = rows >= 0
+        return self.apply_row_events(rows[known], np.asarray(deltas)[known])
+
+    def apply_row_events(self, rows, deltas):
+        """行番号で指定したイベントのバッチを適用し、変化した行数を返す"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(rows) == 0:
+            return 0
+        changed, inverse = np.unique(rows, return_inverse=True)
+        delta = np.bincount(inverse, weights=np.asarray(deltas, dtype=np.float64)).astype(np.int64)
+
+        with self._lock:
+            new_stock = np.maximum(self.stock[changed] + delta, 0)   # 在庫はマイナスにしない
+            new_value = new_stock * self.unit_cost[changed]
+            self.total_value_sum += int((new_value - self.total_value[changed]).sum())
+            self.stock[changed] = new_stock
+            self.total_value[changed] = new_value
+            self.inventory_months[changed] = self._months(changed)
+
+            new_alert = new_stock < self.safety_stock[changed]
+            new_excess = self.inventory_months[changed] >= EXCESS_MONTHS
+            self.alert_count += int(new_alert.sum()) - int(self.alert_mask[changed].sum())
+            self.excess_count += int(new_excess.sum()) - int(self.excess_mask[changed].sum())
+            self.alert_mask[changed] = new_alert
+            self.excess_mask[changed] = new_excess
+
+            self.version += 1
+            self._alert_order = None
+            self._snapshot = None
+        return len(changed)
+
+    # --------------------------------------------------------------
+    # 読み出し
+    # --------------------------------------------------------------
+    def alert_rows(self):
+        """欠品アラート行の行番号（在庫数の少ない順）。次のイベント適用まで結果を使い回す"""
+        with self._lock:
+            if self._alert_order is None:
+                rows = np.flatnonzero(self.alert_mask)
+                self._alert_order = rows[np.argsort(self.stock[rows], kind="stable")]
+            return self._alert_order
+
+    def frame(self, rows):
+        """指定行の在庫状況を DataFrame で返す"""
+        columns = {
+            "Warehouse": pd.Categorical.from_codes(self.keys.codes[0][rows], self.keys.levels[0]),
+            "Product": pd.Categorical.from_codes(self.keys.codes[1][rows], self.keys.levels[1]),
+            "Stock": self.stock[rows],
+            "UnitCost": self.unit_cost[rows],
+            "TotalValue": self.total_value[rows],
+            "SafetyStock": self.safety_stock[rows],
+            "MonthlyDemand": self.monthly_demand[rows],
+        }
+        if self.has_forecast:
+            columns["ForecastDemand"] = self.forecast_demand[rows].astype(np.float32)
+        columns["InventoryMonths"] = self.inventory_months[rows]
+        columns["IsAlert"] = self.alert_mask[rows]
+        return pd.DataFrame(columns)
+
+    def totals(self, rows=None):
+        """(資産総額, 欠品アラート件数, 滞留件数)。rows（行番号）を渡すとその行だけで集計する"""
+        with self._lock:
+            if rows is None:
+                return self.total_value_sum, self.alert_count, self.excess_count
+            return (int(self.total_value[rows].sum()), int(self.alert_mask[rows].sum()),
+                    int(self.excess_mask[rows].sum()))
+
+    def alert_page(self, sort="stock", offset=0, limit=50, rows=None, product_query=None):
+        """
+        緊急手配リストの 1 ページ分と、絞り込み後の総件数を返す
+        sort: "stock"（在庫数の少ない順）/ "shortfall"（安全在庫に対する不足数の多い順）
+        rows: 対象の行番号（サイドバーの絞り込み結果。None で全行）/ product_query: 部品名の部分一致
+        全件は並べ替えず、offset + limit 件までを部分選択（argpartition）で取り出して並べる
+        """
+        if sort not in ALERT_SORTS:
+            raise ValueError(f"未対応の並び順です: {sort}")
+        with self._lock:
+            if sort == "stock" and rows is None and not product_query:
+                rows = self.alert_rows()     # 並べ替え済みのキャッシュをそのまま切り出す
+                total = len(rows)
+                page = rows[offset: offset + limit]
+            else:
+                rows = np.flatnonzero(self.alert_mask) if rows is None else rows[self.alert_mask[rows]]
+                if product_query:
+                    # 部品名の判定はカテゴリ単位で行う（行ごとの文字列比較はしない）
+                    hit = np.flatnonzero(self.keys.levels[1].str.contains(product_query, case=False, regex=False))
+                    rows = rows[np.isin(self.keys.codes[1][rows], hit)]
+                total = len(rows)
+                key = self.stock[rows] if sort == "stock" else self.stock[rows] - self.safety_stock[rows]
+                # 同じ値は行番号順に並ぶよう、行番号を下位に含めた整数キーにする
+                key = key * len(self.stock) + rows
+                end = min(offset + limit, total)
+                if end < total:
+                    top = np.argpartition(key, end - 1)[:end]
+                    top = top[np.argsort(key[top])]
+                else:
+                    top = np.argsort(key)
+                page = rows[top[offset:end]]
+            df = self.frame(page)
+        df["Shortfall"] = df["SafetyStock"] - df["Stock"]
+        return df, total
+
+    def snapshot(self):
+        """全行の DataFrame（グラフ用）。イベント適用までは同じものを返す"""
+        with self._lock:
+            if self._snapshot is None:
+                self._snapshot = self.frame(np.arange(len(self.stock)))
+            return self._snapshot
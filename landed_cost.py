@@ -0,0 +1,226 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from supply_graph import PORT, STORE, WAREHOUSE
+
+# ------------------------------------------------------------------
+# 着地原価（Landed Cost）エンジン
+#   港 → 倉庫 → 店舗 の全経路 × 全 SKU の着地原価を配列演算で一括計算する
+#   1 unit 当たりの原価 = 製造原価 + 海上輸送費 + 関税 + 通関・港湾費 + 国内配送費
+#   - 海上輸送費・通関・港湾費 : 港ごとの単価 × SKU の運賃係数（かさ・重さ）
+#   - 関税                     : (製造原価 + 海上輸送費) × 部品クラスの関税率（CIF 価格に課税）
+#   - 国内配送費               : (港→倉庫 + 倉庫→店舗 のレーン単価) × 運賃係数
+#     レーン単価は物量が多いほど安くなる（平均的な物量のレーンで基準単価）
+#   経路の物量は、倉庫が入荷の割合どおりに各店舗へ出荷するとして配分する（DisruptionEngine と同じ前提）
+# ------------------------------------------------------------------
+COST_COMPONENTS = ["製造原価", "海上輸送費", "関税", "通関・港湾費", "国内配送費"]
+
+# 港ごとの海上輸送費・通関・港湾費（円 / unit、運賃係数 1.0 の SKU）
+OCEAN_RATES = {"東京港": 520, "横浜港": 500, "神戸港": 480, "博多港": 450}
+PORT_FEES = {"東京港": 110, "横浜港": 100, "神戸港": 95, "博多港": 90}
+DEFAULT_OCEAN_RATE = 500
+DEFAULT_PORT_FEE = 100
+
+# 部品クラスごとの関税率と運賃係数
+DUTY_RATES = {"制御機器": 0.03, "駆動機器": 0.04, "機構部品": 0.05, "軸受": 0.06, "締結部品": 0.08}
+FREIGHT_FACTORS = {"制御機器": 1.0, "駆動機器": 2.0, "機構部品": 0.5, "軸受": 0.3, "締結部品": 0.01}
+DEFAULT_DUTY_RATE = 0.05
+DEFAULT_FREIGHT_FACTOR = 1.0
+
+# 国内レーンの基準単価（円 / unit）と、物量による逓減の指数（物量 2 倍で約 13% 安くなる）
+INBOUND_LANE_RATE = 300
+OUTBOUND_LANE_RATE = 500
+VOLUME_DISCOUNT_EXPONENT = 0.2
+
+# 一度に計算する SKU × 経路 の要素数の上限（float32 で 1 成分 16MB）
+BATCH_ELEMENTS = 1 << 22
+
+
+def lane_rates(graph):
+    """
+    レーン（エッジ）ごとの国内配送単価（円 / unit）
+    港→倉庫・倉庫→店舗それぞれ、その層の平均物量のレーンを基準単価とし、物量の -0.2 乗で逓減させる
+    """
+    rates = np.zeros(graph.n_edges)
+    src_type = graph.node_type[graph.src]
+    for node_type, base in ((PORT, INBOUND_LANE_RATE), (WAREHOUSE, OUTBOUND_LANE_RATE)):
+        lanes = np.flatnonzero((src_type == node_type) & (graph.value > 0))
+        if len(lanes):
+            volume = graph.value[lanes]
+            rates[lanes] = base * (volume / volume.mean()) ** -VOLUME_DISCOUNT_EXPONENT
+    return rates
+
+
+class LandedCostEngine:
+    """
+    SupplyGraph から経路（港→倉庫→店舗）と経路ごとの単価を作って保持する（読み取り専用）
+    path_in / path_out : 経路が通る港→倉庫・倉庫→店舗のエッジ ID
+    path_volume        : 経路の物量（倉庫の出荷を入荷の割合で配分）
+    path_ocean / path_fee / path_domestic : 運賃係数 1.0 の SKU 1 unit 当たりの各費用
+    """
+
+    def __init__(self, graph, ocean_rates=None, port_fees=None):
+        self.graph = graph
+        self.lane_rate = lane_rates(graph)
+        self._build_paths()
+
+        labels = graph.labels
+        ocean_rates = ocean_rates or OCEAN_RATES
+        port_fees = port_fees or PORT_FEES
+        ocean = np.array([ocean_rates.get(label, DEFAULT_OCEAN_RATE) for label in labels], dtype=np.float64)
+        fee = np.array([port_fees.get(label, DEFAULT_PORT_FEE) for label in labels], dtype=np.float64)
+        self.path_ocean = ocean[self.path_port]
+        self.path_fee = fee[self.path_port]
+        self.path_domestic = self.lane_rate[self.path_in] + self.lane_rate[self.path_out]
+
+        # store_weights[p, s] = 店舗 s の入荷に占める経路 p の割合（店舗ごとの加重平均に使う）
+        stores = graph.tier(STORE)
+        store_inflow = np.bincount(self.path_store - stores[0], weights=self.path_volume, minlength=len(stores))
+        weight = np.divide(self.path_volume, store_inflow[self.path_store - stores[0]],
+                           out=np.zeros(self.n_paths), where=store_inflow[self.path_store - stores[0]] > 0)
+        self.store_weights = sparse.csr_matrix(
+            (weight, (np.arange(self.n_paths), self.path_store - stores[0])), shape=(self.n_paths, len(stores))
+        )
+        self.stores = labels[stores]
+        self.store_inflow = store_inflow
+
+    def _build_paths(self):
+        """港→倉庫のエッジと、同じ倉庫から出る倉庫→店舗のエッジをすべて組み合わせる"""
+        g = self.graph
+        src_type, dst_type = g.node_type[g.src], g.node_type[g.dst]
+        inbound = np.flatnonzero((src_type == PORT) & (dst_type == WAREHOUSE))
+        outbound = np.flatnonzero((src_type == WAREHOUSE) & (dst_type == STORE))
+
+        # 倉庫ごとの出荷エッジを CSR 形式にし、入荷エッジ 1 本につき出荷エッジの数だけ経路を作る
+        outbound = outbound[np.argsort(g.src[outbound], kind="stable")]
+        counts = np.bincount(g.src[outbound], minlength=g.n_nodes)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        repeats = counts[g.dst[inbound]]
+        self.path_in = np.repeat(inbound, repeats).astype(np.int32)
+        first = np.cumsum(repeats) - repeats
+        within = np.arange(repeats.sum()) - np.repeat(first, repeats)
+        self.path_out = outbound[np.repeat(starts[g.dst[inbound]], repeats) + within].astype(np.int32)
+
+        self.path_port = g.src[self.path_in]
+        self.path_warehouse = g.dst[self.path_in]
+        self.path_store = g.dst[self.path_out]
+        inflow = g.in_volume()
+        self.path_volume = np.divide(
+            g.value[self.path_in] * g.value[self.path_out], inflow[self.path_warehouse],
+            out=np.zeros(len(self.path_in)), where=inflow[self.path_warehouse] > 0,
+        )
+
+    @property
+    def n_paths(self):
+        return len(self.path_in)
+
+    def path_labels(self, paths=None):
+        """経路の表示名（港 → 倉庫 → 店舗）"""
+        paths = np.arange(self.n_paths) if paths is None else np.asarray(paths)
+        labels = self.graph.labels
+        return [
+            f"{labels[p]} → {labels[w]} → {labels[s]}"
+            for p, w, s in zip(self.path_port[paths], self.path_warehouse[paths], self.path_store[paths])
+        ]
+
+    # --------------------------------------------------------------
+    # SKU の属性（製造原価・関税率・運賃係数）
+    # --------------------------------------------------------------
+    @staticmethod
+    def sku_arrays(catalog):
+        """catalog（Product / Class / UnitCost 列）から (製造原価, 関税率, 運賃係数) の配列を作る"""
+        classes = catalog["Class"].astype(str)
+        return (
+            catalog["UnitCost"].to_numpy(dtype=np.float64),
+            classes.map(DUTY_RATES).fillna(DEFAULT_DUTY_RATE).to_numpy(dtype=np.float64),
+            classes.map(FREIGHT_FACTORS).fillna(DEFAULT_FREIGHT_FACTOR).to_numpy(dtype=np.float64),
+        )
+
+    def cost_components(self, unit_cost, duty_rate, freight_factor, paths=None):
+        """
+        SKU × 経路 の費用内訳（COST_COMPONENTS 順の (n_sku, n_path) 配列のリスト）
+        引数は SKU ごとの 1 次元配列。paths を指定するとその経路だけを計算する
+        """
+        paths = slice(None) if paths is None else paths
+        cost = np.asarray(unit_cost, dtype=np.float64)[:, None]
+        duty = np.asarray(duty_rate, dtype=np.float64)[:, None]
+        factor = np.asarray(freight_factor, dtype=np.float64)[:, None]
+        ocean = factor * self.path_ocean[paths]
+        return [
+            np.broadcast_to(cost, ocean.shape),
+            ocean,
+            duty * (cost + ocean),
+            factor * self.path_fee[paths],
+            factor * self.path_domestic[paths],
+        ]
+
+    def total_cost(self, unit_cost, duty_rate, freight_factor):
+        """
+        SKU × 経路 の着地原価 (n_sku, n_path)。内訳を作らずに 1 回の式で求める
+        着地原価 = (製造原価 + 運賃係数 × 海上輸送費) × (1 + 関税率) + 運賃係数 × (通関・港湾費 + 国内配送費)
+        """
+        cost = np.asarray(unit_cost, dtype=np.float32)[:, None]
+        duty = np.asarray(duty_rate, dtype=np.float32)[:, None] + 1
+        factor = np.asarray(freight_factor, dtype=np.float32)[:, None]
+        total = factor * self.path_ocean.astype(np.float32)
+        total += cost
+        total *= duty
+        total += factor * (self.path_fee + self.path_domestic).astype(np.float32)
+        return total
+
+    def iter_batches(self, catalog, batch_elements=BATCH_ELEMENTS):
+        """SKU を分割して (SKU の範囲, 着地原価の行列) を順に返す（メモリを batch_elements 要素に抑える）"""
+        arrays = self.sku_arrays(catalog)
+        batch = max(batch_elements // max(self.n_paths, 1), 1)
+        for start in range(0, len(catalog), batch):
+            rows = slice(start, min(start + batch, len(catalog)))
+            yield rows, self.total_cost(*(a[rows] for a in arrays))
+
+    # --------------------------------------------------------------
+    # 集計
+    # --------------------------------------------------------------
+    def store_costs(self, catalog, batch_elements=BATCH_ELEMENTS):
+        """
+        SKU × 店舗 の着地原価 (n_sku, n_store)。店舗に届く経路の物量で加重平均する
+        全 SKU × 全経路 をバッチに分けて計算し、経路→店舗の重み（疎行列）を掛けて畳み込む
+        """
+        result = np.empty((len(catalog), len(self.stores)), dtype=np.float32)
+        weights_t = self.store_weights.T.tocsr().astype(np.float32)
+        for rows, total in self.iter_batches(catalog, batch_elements):
+            result[rows] = (weights_t @ total.T).T
+        return result
+
+    def breakdown(self, sku, catalog, store=None):
+        """
+        1 SKU の費用内訳（COST_COMPONENTS 順の Series）
+        store を指定するとその店舗に届く経路の、指定しなければ全経路の物量加重平均
+        """
+        arrays = [a[[sku]] for a in self.sku_arrays(catalog)]
+        if store is None:
+            paths = np.flatnonzero(self.path_volume > 0)
+            weight = self.path_volume[paths] / self.path_volume[paths].sum() if len(paths) else paths
+        else:
+            column = self.store_weights.getcol(int(np.flatnonzero(self.stores == store)[0])).tocoo()
+            paths, weight = column.row, column.data
+        components = self.cost_components(*arrays, paths=paths)
+        return pd.Series([float(c[0] @ weight) for c in components], index=COST_COMPONENTS)
+
+    def store_ranking(self, sku, store_costs, catalog):
+        """店舗別の着地原価ランキング（1 SKU 分、高い順）。主経路は店舗への物量が最も多い経路"""
+        main_path = np.full(len(self.stores), -1)
+        order = np.lexsort((self.path_volume, self.path_store))
+        last = np.r_[self.path_store[order][1:] != self.path_store[order][:-1], True]
+        main_path[self.path_store[order][last] - self.graph.tier_offsets[STORE]] = order[last]
+
+        unit_cost = float(catalog["UnitCost"].iloc[sku])
+        landed = store_costs[sku].astype(np.float64)
+        has_path = main_path >= 0
+        df = pd.DataFrame({
+            "Store": self.stores[has_path],
+            "LandedCost": landed[has_path].round(),
+            "Markup": (landed[has_path] / unit_cost - 1).round(3) if unit_cost else np.nan,
+            "Volume": self.store_inflow[has_path],
+            "MainPath": self.path_labels(main_path[has_path]),
+        })
+        return df.sort_values("LandedCost", ascending=False, kind="stable").reset_index(drop=True)
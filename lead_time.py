@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+
+# ------------------------------------------------------------------
+# リードタイムの集計ストア
+#   ルートごとに、件数・平均・分散と分位点スケッチ（結合可能）を保持する。
+#   生データは保持せず、散布図用に上限付きのリザーバサンプルだけを残す。
+# ------------------------------------------------------------------
+DEFAULT_RELATIVE_ACCURACY = 0.01   # 分位点の相対誤差（1%）
+DEFAULT_RESERVOIR_SIZE = 200       # ルートごとに残すサンプル点の上限
+
+
+class QuantileSketch:
+    """
+    対数ビンのヒストグラムによる分位点スケッチ（DDSketch 方式）
+    - 値 x (>0) を key = ceil(log_gamma(x)) のビンに数える。分位点の相対誤差は relative_accuracy 以内
+    - ビンの足し合わせだけで merge できるので、バッチ・ルート・期間をまたいで集約できる
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.offset = 0                          # counts[0] に対応する key
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.zero_count = 0                      # 0 以下の値の件数
+
+    @property
+    def count(self):
+        return int(self.counts.sum()) + self.zero_count
+
+    def _grow(self, key_min, key_max):
+        if len(self.counts) == 0:
+            self.offset = key_min
+            self.counts = np.zeros(key_max - key_min + 1, dtype=np.int64)
+            return
+        lo, hi = min(key_min, self.offset), max(key_max, self.offset + len(self.counts) - 1)
+        if lo == self.offset and hi == self.offset + len(self.counts) - 1:
+            return
+        counts = np.zeros(hi - lo + 1, dtype=np.int64)
+        counts[self.offset - lo: self.offset - lo + len(self.counts)] = self.counts
+        self.offset, self.counts = lo, counts
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        positive = values[values > 0]
+        self.zero_count += len(values) - len(positive)
+        if len(positive) == 0:
+            return
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        self._grow(int(keys.min()), int(keys.max()))
+        self.counts += np.bincount(keys - self.offset, minlength=len(self.counts))
+
+    def merge(self, other):
+        if len(other.counts):
+            self._grow(other.offset, other.offset + len(other.counts) - 1)
+            start = other.offset - self.offset
+            self.counts[start: start + len(other.counts)] += other.counts
+        self.zero_count += other.zero_count
+
+    def quantiles(self, qs):
+        """qs (0〜1) に対応する分位点の配列（件数 0 なら NaN）"""
+        qs = np.asarray(qs, dtype=np.float64)
+        total = self.count
+        if total == 0:
+            return np.full(qs.shape, np.nan)
+        ranks = qs * (total - 1)
+        cum = np.cumsum(self.counts) + self.zero_count
+        idx = np.searchsorted(cum, ranks, side="right")
+        keys = self.offset + np.minimum(idx, len(self.counts) - 1)
+        values = 2 * self.gamma ** keys / (self.gamma + 1)
+        return np.where(ranks < self.zero_count, 0.0, values)
+
+
+class RouteSummary:
+    """1 ルート分の集計（件数・平均・分散・最小/最大・分位点スケッチ・リザーバサンプル）"""
+
+    def __init__(self, relative_accuracy, reservoir_size):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+        self.reservoir = np.empty(0)
+        self.reservoir_size = reservoir_size
+
+    def _combine_moments(self, n, mean, m2):
+        # 平均・分散の並列結合（Chan らの方法）
+        total = self.count + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+
+    def add(self, values, rng):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        seen = self.count
+        self._combine_moments(len(values), values.mean(), ((values - values.mean()) ** 2).sum())
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self.sketch.add(values)
+
+        # リザーバサンプリング（Algorithm R をバッチでまとめて適用）
+        room = self.reservoir_size - len(self.reservoir)
+        if room > 0:
+            self.reservoir = np.concatenate([self.reservoir, values[:room]])
+            values, seen = values[room:], seen + room
+        if len(values):
+            slots = rng.integers(0, seen + np.arange(1, len(values) + 1))
+            keep = slots < self.reservoir_size
+            self.reservoir[slots[keep]] = values[keep]
+
+    def merge(self, other, rng):
+        if other.count == 0:
+            return
+        seen = self.count
+        self._combine_moments(other.count, other.mean, other.m2)
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        # サンプルは件数比で按分して残す
+        pool = np.concatenate([self.reservoir, other.reservoir])
+        weights = np.concatenate([
+            np.full(len(self.reservoir), seen / max(len(self.reservoir), 1)),
+            np.full(len(other.reservoir), other.count / max(len(other.reservoir), 1)),
+        ])
+        size = min(self.reservoir_size, len(pool))
+        self.reservoir = rng.choice(pool, size=size, replace=False, p=weights / weights.sum())
+
+    @property
+    def std(self):
+        return np.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class LeadTimeStore:
+    """
+    ルート別リードタイムの集計ストア
+    append(routes, days) でバッチ投入し、summary() で分位点・平均などを返す
+    """
+
+    def __init__(self, relative_accuracy=DEFAULT_RELATIVE_ACCURACY,
+                 reservoir_size=DEFAULT_RESERVOIR_SIZE, seed=0):
+        self.relative_accuracy = relative_accuracy
+        self.reservoir_size = reservoir_size
+        self.routes = {}
+        self.rng = np.random.default_rng(seed)
+
+    def _route(self, name):
+        if name not in self.routes:
+            self.routes[name] = RouteSummary(self.relative_accuracy, self.reservoir_size)
+        return self.routes[name]
+
+    def append(self, routes, days):
+        """routes（ルート名の配列）と days（日数の配列）を 1 バッチとして取り込む"""
+        codes, names = pd.factorize(np.asarray(routes), sort=False)
+        days = np.asarray(days, dtype=np.float64)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(names) + 1))
+        for i, name in enumerate(names):
+            self._route(name).add(days[order[bounds[i]:bounds[i + 1]]], self.rng)
+        return self
+
+    def merge(self, other):
+        for name, summary in other.routes.items():
+            self._route(name).merge(summary, self.rng)
+        return self
+
+    def summary(self, quantiles=(0.25, 0.5, 0.75, 0.9, 0.99)):
+        """ルートごとの Count / Mean / Std / Min / Max と分位点 P25, P50 ... の DataFrame"""
+        rows = []
+        for name, s in self.routes.items():
+            row = {"Route": name, "Count": s.count, "Mean": s.mean, "Std": s.std, "Min": s.min, "Max": s.max}
+            for q, v in zip(quantiles, s.sketch.quantiles(quantiles)):
+                row[f"P{q * 100:g}"] = min(max(v, s.min), s.max)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def samples(self):
+        """散布図用のリザーバサンプル（ルートごとに最大 reservoir_size 点）"""
+        if not self.routes:
+            return pd.DataFrame({"Route": [], "Days": []})
+        return pd.DataFrame({
+            "Route": np.concatenate([np.full(len(s.reservoir), name, dtype=object) for name, s in self.routes.items()]),
+            "Days": np.concatenate([s.reservoir for s in self.routes.values()]),
+        })
@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# ------------------------------------------------------------------
+# 月別パーティションのテーブル（売上など、月ごとに追記されるデータ用）
+#   <root>/<テーブル名>/
+#     _manifest.json             : パーティションの一覧（キー・ファイル・行数・版）
+#     month=2024-01.parquet ...  : 1 か月分ずつの Parquet
+#   - append() は追加・差し替える月のファイルだけを書き、既存の月のファイルには触れない
+#   - 各パーティションの版はファイル単位なので、キャッシュや集計も月単位で作り直せる
+#   ファイル・マニフェストとも一時ファイルに書いてから差し替える（読み手は常に完全な版を見る）
+# ------------------------------------------------------------------
+MANIFEST_FILE = "_manifest.json"
+
+
+class Partition:
+    """パーティション 1 つ分の情報と、結合後の DataFrame の中での行の範囲（start:stop）"""
+
+    __slots__ = ("key", "version", "start", "stop")
+
+    def __init__(self, key, version, start, stop):
+        self.key = key
+        self.version = version
+        self.start = start
+        self.stop = stop
+
+    @property
+    def rows(self):
+        return slice(self.start, self.stop)
+
+    def __repr__(self):
+        return f"Partition({self.key!r}, rows={self.start}:{self.stop})"
+
+
+def locate_partitions(parts):
+    """[(キー, 版, 行数), ...] を、つないだ順の行の範囲付きの Partition のリストにする"""
+    located, start = [], 0
+    for key, version, n_rows in parts:
+        located.append(Partition(key, version, start, start + n_rows))
+        start += n_rows
+    return located
+
+
+def concat_partitions(frames):
+    """
+    パーティションの DataFrame を縦につなぐ
+    カテゴリ列はカテゴリの和集合でカテゴリ型のまま保つ（順序付きの列は値の順に並べ直す）
+    一部のパーティションだけがカテゴリ型の列（値の種類が多い月だけ元の型のまま、など）もカテゴリ型にそろえる
+    """
+    frames = [f for f in frames if len(f)] or list(frames[:1])
+    if len(frames) == 1:
+        return frames[0]
+    columns = {}
+    for col in frames[0].columns:
+        dtypes = [f[col].dtype for f in frames]
+        if any(isinstance(d, pd.CategoricalDtype) for d in dtypes):
+            ordered = any(isinstance(d, pd.CategoricalDtype) and d.ordered for d in dtypes)
+            cat = union_categoricals([pd.Categorical(f[col]) for f in frames], ignore_order=True)
+            if ordered:
+                cat = cat.reorder_categories(cat.categories.sort_values(), ordered=True)
+            columns[col] = cat
+        else:
+            columns[col] = np.concatenate([f[col].to_numpy() for f in frames])
+    return pd.DataFrame(columns)
+
+
+def _write_json(path, obj):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=1, sort_keys=True)
+
+
+class PartitionedTable:
+    def __init__(self, root, name, partition_column="Month"):
+        self.name = name
+        self.dir = os.path.join(root, name)
+        self.partition_column = partition_column
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.dir, MANIFEST_FILE)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def manifest(self):
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def partitions(self):
+        """[(キー, 版, 行数), ...]（キー順）"""
+        entries = self.manifest()["partitions"]
+        return [(key, entries[key]["version"], entries[key]["rows"]) for key in sorted(entries)]
+
+    @property
+    def cache_key(self):
+        """全パーティションの版（どれかの月が変われば変わる）"""
+        return tuple((key, version) for key, version, _ in self.partitions())
+
+    # --------------------------------------------------------------
+    # 書き込み
+    # --------------------------------------------------------------
+    def _write_atomic(self, path, write):
+        fd, tmp = tempfile.mkstemp(dir=self.dir, suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _write_partition(self, key, df, sort_by):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if sort_by:
+            df = df.sort_values(sort_by, kind="stable")
+        # カテゴリの辞書はこの月に出てくる値だけにする（他の月の値を各ファイルに持たない）
+        df = df.assign(**{
+            col: df[col].cat.remove_unused_categories()
+            for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+        })
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        file = f"{self.partition_column.lower()}={key}.parquet"
+        path = os.path.join(self.dir, file)
+        self._write_atomic(path, lambda tmp: pq.write_table(table, tmp))
+        # 版はファイルの中身から作る（同じ内容を書き直しても版は変わらない）
+        digest = hashlib.blake2b(digest_size=8)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return {"file": file, "rows": len(df), "version": digest.hexdigest()}
+
+    def append(self, df, sort_by=None):
+        """
+        df をパーティション列（月）で分けて書き込み、マニフェストを更新する
+        df に含まれる月のファイルだけを書き（既存の月なら差し替え）、他の月には触れない
+        戻り値: 書き込んだパーティションのキーのリスト
+        """
+        from data_sources import periods_to_strings   # data_sources からも読み込まれるので関数内で読む
+
+        os.makedirs(self.dir, exist_ok=True)
+        manifest = self.manifest() if self.exists() else {
+            "name": self.name, "partition_column": self.partition_column, "partitions": {},
+        }
+        df, _ = periods_to_strings(df)
+        written = []
+        for key, part in df.groupby(df[self.partition_column].astype(str), observed=True, sort=True):
+            manifest["partitions"][key] = self._write_partition(key, part, sort_by)
+            written.append(key)
+        self._write_atomic(self.manifest_path, lambda tmp: _write_json(tmp, manifest))
+        return written
+
+    # --------------------------------------------------------------
+    # 読み込み
+    # --------------------------------------------------------------
+    def read_partition(self, key, columns=None, filters=None):
+        """1 パーティションを読む（列の射影と filters は Parquet の行グループ単位でプッシュダウン）"""
+        import pyarrow.parquet as pq
+
+        entry = self.manifest()["partitions"][key]
+        expr = pq.filters_to_expression([list(filters)]) if filters else None
+        table = pq.read_table(os.path.join(self.dir, entry["file"]), columns=list(columns) if columns else None,
+                              filters=expr, memory_map=True)
+        return table.to_pandas()
+
+    def read(self, columns=None, filters=None):
+        """全パーティションを月順につないで読む"""
+        return concat_partitions([self.read_partition(key, columns, filters) for key, _, _ in self.partitions()])
@@ -0,0 +1,178 @@
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+
+# ------------------------------------------------------------------
+# 処理時間の計測（ホットパスの区間計測）
+#   環境変数 DASHBOARD_PERF=1 のときだけ有効。無効時の span() は共有の空オブジェクトを返すだけ
+#   1 回の再実行（run）ごとに区間を記録し、終了時に JSON Lines のログへ追記する
+#   - span(name)              : with 文で囲んだ区間の時間を記録
+#   - span(name, cached=True) : 中で st.cache_* の本体が動いたかどうか（hit / miss）も記録
+#   - cache_miss(name)        : st.cache_* の内側に付け、本体が実行された（= miss）ことを知らせる
+# ------------------------------------------------------------------
+PERF_ENV = "DASHBOARD_PERF"
+PERF_LOG_ENV = "DASHBOARD_PERF_LOG"
+DEFAULT_LOG_PATH = "perf_spans.jsonl"
+
+_enabled = os.environ.get(PERF_ENV, "").lower() not in ("", "0", "false", "off")
+_local = threading.local()     # Streamlit はセッションごとに別スレッドでスクリプトを実行する
+_log_lock = threading.Lock()
+
+
+def enabled():
+    return _enabled
+
+
+def set_enabled(flag):
+    global _enabled
+    _enabled = bool(flag)
+
+
+class Run:
+    """1 回の再実行で記録した区間の一覧"""
+
+    def __init__(self, page):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.page = page
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.spans = []    # 開始順
+        self.stack = []    # 実行中の区間
+
+    def records(self):
+        """区間を dict のリストで返す（ログ・表示用）"""
+        return [
+            {
+                "run_id": self.run_id, "page": self.page, "span": s.name, "parent": s.parent,
+                "depth": s.depth, "start_ms": round((s.start - self.start) * 1000, 3),
+                "ms": round(s.seconds * 1000, 3) if s.seconds is not None else None,
+                **s.attrs,
+            }
+            for s in self.spans
+        ]
+
+
+class Span:
+    __slots__ = ("run", "name", "attrs", "cached", "missed", "parent", "depth", "start", "seconds")
+
+    def __init__(self, run, name, cached, attrs):
+        self.run = run
+        self.name = name
+        self.attrs = attrs
+        self.cached = cached
+        self.missed = False
+        self.seconds = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = self.run.stack
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.run.spans.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.start
+        self.run.stack.pop()
+        if self.cached:
+            self.attrs["cache"] = "miss" if self.missed else "hit"
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        return False
+
+
+class _NullSpan:
+    """計測無効時・run の外で返す何もしない区間"""
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def current_run():
+    return getattr(_local, "run", None) if _enabled else None
+
+
+def span(name, cached=False, **attrs):
+    """
+    区間の計測（with span("figure.treemap"): ...）
+    cached=True なら、区間内で cache_miss の付いた関数が動いたかで cache=hit/miss を記録する
+    """
+    run = current_run()
+    if run is None:
+        return _NULL_SPAN
+    return Span(run, name, cached, attrs)
+
+
+def cache_miss(name):
+    """
+    st.cache_data / st.cache_resource の内側に付けるデコレータ
+    本体はキャッシュがないときだけ実行されるので、実行されたら外側の区間すべてを miss にする
+
+        @st.cache_data
+        @cache_miss("load_sales_data")
+        def load_sales_data(...): ...
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = current_run()
+            if run is None:
+                return fn(*args, **kwargs)
+            for outer in run.stack:
+                outer.missed = True
+            with Span(run, name, False, {"cache": "miss"}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# ------------------------------------------------------------------
+# 再実行単位の開始・終了
+# ------------------------------------------------------------------
+def start_run(page):
+    """再実行の計測を始める（無効時は None）"""
+    if not _enabled:
+        return None
+    run = Run(page)
+    _local.run = run
+    return run
+
+
+def finish_run(run):
+    """再実行の計測を終え、区間をログに書き出す"""
+    if run is None:
+        return
+    run.seconds = time.perf_counter() - run.start
+    _local.run = None
+    write_log(run)
+
+
+def write_log(run, path=None):
+    """区間を 1 行 1 件の JSON（JSON Lines）でログファイルに追記する"""
+    path = path or os.environ.get(PERF_LOG_ENV, DEFAULT_LOG_PATH)
+    header = {"ts": run.started_at}
+    lines = [json.dumps({**header, **r}, ensure_ascii=False, default=str) for r in run.records()]
+    lines.append(json.dumps({**header, "run_id": run.run_id, "page": run.page, "span": "run",
+                             "ms": round(run.seconds * 1000, 3)}, ensure_ascii=False))
+    try:
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+    except OSError:
+        pass   # ログが書けなくても画面表示は止めない
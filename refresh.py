@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+
+# ------------------------------------------------------------------
+# バックグラウンド更新（stale-while-revalidate）
+#   専用スレッドが一定間隔（または trigger()）でデータの版を確認し、版が変わっていれば
+#   新しいデータ一式を作ってから参照を差し替える。差し替えまでは各セッションに前の版を返す
+#   - probe()        : 現在の版（ファイルの更新時刻など、軽い処理）
+#   - build(version) : その版のデータ一式（dict または LazyData）を作る（重い処理。リクエストの外で実行）
+# ------------------------------------------------------------------
+
+
+class LazyData:
+    """
+    版のデータ一式（名前 → 値）。loaders の値は最初に参照されたときに 1 回だけ読み込み、以後は使い回す
+    loaders: {名前: 引数なしで値を返す関数} / values: 最初から決まっている値
+    """
+
+    def __init__(self, loaders, values=None):
+        self._loaders = dict(loaders)
+        self._values = dict(values or {})
+        self._locks = {name: threading.Lock() for name in self._loaders}
+
+    def __contains__(self, name):
+        return name in self._values or name in self._loaders
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            with self._locks[name]:   # 同時に参照したセッションも 1 回の読み込みを待つ
+                if name not in self._values:
+                    self._values[name] = self._loaders[name]()
+        return self._values[name]
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def loaded(self, name):
+        """読み込み済み（または最初から決まっている）なら True"""
+        return name in self._values
+
+
+class Snapshot:
+    """ある版のデータ一式（全セッションで共有する読み取り専用のデータ）"""
+
+    def __init__(self, version, data, build_seconds):
+        self.version = version
+        self.data = data
+        self.build_seconds = build_seconds
+        self.built_at = time.time()
+        self.label = hashlib.blake2b(repr(version).encode(), digest_size=4).hexdigest()
+
+
+class RefreshWorker:
+    def __init__(self, probe, build, interval=60.0, name="dashboard-refresh"):
+        self.probe = probe
+        self.build = build
+        self.interval = interval
+        self.refreshing = False
+        self.last_checked = None
+        self.last_error = None
+        self._current = None
+        self._wake = threading.Event()
+        self._ready = threading.Event()     # 初回の構築が終わった（成功・失敗とも）
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def snapshot(self):
+        """公開済みのスナップショット（まだなければ None）"""
+        return self._current
+
+    def current(self, timeout=None):
+        """
+        公開済みのスナップショットを返す。初回だけ構築の完了を待つ
+        （同時に来たセッションも同じ 1 回の構築を待ち、個別に読み込みはしない）
+        """
+        snap = self._current
+        if snap is None:
+            self._wake.set()
+            if not self._ready.wait(timeout):
+                raise TimeoutError("データの初回読み込みが時間内に終わりませんでした")
+            snap = self._current
+            if snap is None:
+                raise RuntimeError(f"データの読み込みに失敗しました: {self.last_error}")
+        return snap
+
+    def trigger(self):
+        """次の確認を待たずに版を確認させる"""
+        self._wake.set()
+
+    def refresh_once(self):
+        """版を確認し、変わっていれば作り直して差し替える。差し替えたら True"""
+        try:
+            version = self.probe()
+            self.last_checked = time.time()
+            current = self._current
+            if current is not None and current.version == version:
+                return False
+            self.refreshing = True
+            start = time.perf_counter()
+            data = self.build(version)
+            # 参照の代入は原子的なので、読み手は前の版か新しい版の一式のどちらかだけを見る
+            self._current = Snapshot(version, data, time.perf_counter() - start)
+            self.last_error = None
+            return True
+        except Exception as e:   # 失敗しても前の版を返し続け、次の確認で再試行する
+            self.last_error = f"{type(e).__name__}: {e}"
+            return False
+        finally:
+            self.refreshing = False
+            self._ready.set()
+
+    def _run(self):
+        while True:
+            self.refresh_once()
+            self._wake.wait(self.interval)
+            self._wake.clear()
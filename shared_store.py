@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+from data_sources import periods_to_strings, strings_to_periods
+
+# ------------------------------------------------------------------
+# 共有データストア（セッション・サーバプロセス間でデータを 1 部だけ持つ）
+#   版ごとの DataFrame を非圧縮の Arrow IPC ファイルとして置き、memory-map で読む
+#   - 同じキー（版・テーブル・列）のファイルは 1 度だけ書き、以降はどのプロセスもそのファイルを map する
+#     （OS のページキャッシュを共有するので、プロセス数・セッション数が増えてもデータは 1 部）
+#   - 読み出した DataFrame の数値列・カテゴリのコードは map したバッファを直接参照する読み取り専用の配列
+# ------------------------------------------------------------------
+SHARED_DIR_ENV = "DASHBOARD_SHARED_DIR"
+PERIOD_COLUMNS_KEY = b"dashboard.period_columns"
+
+
+def default_root():
+    """共有メモリ上の tmpfs（/dev/shm）があればそこ、なければ一時ディレクトリ"""
+    base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(base, "dashboard_store")
+
+
+class SharedFrameStore:
+    def __init__(self, root=None):
+        self.root = root or os.environ.get(SHARED_DIR_ENV) or default_root()
+
+    @staticmethod
+    def key(version, name, columns=None):
+        """版・テーブル名・列からファイル名に使うキーを作る"""
+        return hashlib.blake2b(repr((version, name, columns)).encode(), digest_size=12).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key + ".arrow")
+
+    def __contains__(self, key):
+        return os.path.exists(self.path(key))
+
+    def put(self, key, df):
+        """df を書き込み（既にあれば書かない）、map した読み取り専用の DataFrame を返す"""
+        import pyarrow as pa
+
+        if key not in self:
+            os.makedirs(self.root, exist_ok=True)
+            df, period_columns = periods_to_strings(df)
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            metadata = dict(table.schema.metadata or {})
+            metadata[PERIOD_COLUMNS_KEY] = json.dumps(period_columns).encode()
+            table = table.replace_schema_metadata(metadata)
+            # 一時ファイルに書いてから置き換える（読み手は書きかけのファイルを見ない。同時に書いても結果は同じ）
+            tmp = f"{self.path(key)}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            os.replace(tmp, self.path(key))
+        return self.get(key)
+
+    def get(self, key):
+        """ファイルを memory-map して DataFrame にする（数値列はコピーしない）"""
+        import pyarrow as pa
+
+        table = pa.ipc.open_file(pa.memory_map(self.path(key), "r")).read_all()
+        period_columns = json.loads((table.schema.metadata or {}).get(PERIOD_COLUMNS_KEY, b"[]"))
+        # split_blocks: 列ごとに別ブロックにして、数値列を 1 つの配列にまとめ直す（= コピーする）のを避ける
+        return strings_to_periods(table.to_pandas(split_blocks=True), period_columns)
+
+    def get_or_put(self, key, build):
+        """キーがあれば読み、なければ build() の結果を書いてから読む"""
+        if key in self:
+            return self.get(key)
+        return self.put(key, build())
+
+    def prune(self, keep):
+        """keep（キーの集合）以外のファイルを消す。map 中のプロセスは閉じるまで読み続けられる"""
+        if not os.path.isdir(self.root):
+            return
+        for fname in os.listdir(self.root):
+            if fname.endswith(".arrow") and fname[: -len(".arrow")] not in keep:
+                try:
+                    os.remove(os.path.join(self.root, fname))
+                except OSError:
+                    pass
@@ -0,0 +1,102 @@
+import numpy as np
+
+# ------------------------------------------------------------------
+# サプライチェーンの整数インデックス化グラフ
+#   ノード: 港 → 倉庫 → 店舗 の順に連番（tier_offsets で各層の範囲を表す）
+#   エッジ: src / dst / value の NumPy 配列
+# ------------------------------------------------------------------
+PORT, WAREHOUSE, STORE = 0, 1, 2
+NODE_TYPE_NAMES = ["Port", "Warehouse", "Store"]
+OTHER_LABELS = ["その他（港）", "その他（倉庫）", "その他（店舗）"]
+
+# Sankey のリンク数がこれを超えたら、出荷元の SANKEY_MIN_SHARE 未満のフローをまとめる
+SANKEY_MAX_LINKS = 500
+SANKEY_MIN_SHARE = 0.02
+
+
+class SupplyGraph:
+    """
+    配列ベースの有向グラフ（読み取り専用として扱う）
+    labels      : ノード名 (object 配列)
+    node_type   : 0=港 / 1=倉庫 / 2=店舗 (int8)
+    tier_offsets: [港の先頭, 倉庫の先頭, 店舗の先頭, ノード数]（ノードは層の順に並べておく）
+    index       : ノード名 → ノード ID
+    src / dst / value : エッジ配列（inbound, outbound の順）
+    """
+
+    def __init__(self, labels, node_type, src, dst, value):
+        self.labels = np.asarray(labels, dtype=object)
+        self.node_type = np.asarray(node_type, dtype=np.int8)
+        self.tier_offsets = np.searchsorted(self.node_type, [PORT, WAREHOUSE, STORE, STORE + 1])
+        self.index = {label: i for i, label in enumerate(self.labels)}
+        self.src = np.asarray(src, dtype=np.int32)
+        self.dst = np.asarray(dst, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+
+    @classmethod
+    def from_flows(cls, ports, warehouses, stores, inbound_flows, outbound_flows):
+        """load_supply_chain_data の戻り値から作る（ノードにない名前を含むフローは除外）"""
+        labels = list(ports) + list(warehouses) + list(stores)
+        node_type = [PORT] * len(ports) + [WAREHOUSE] * len(warehouses) + [STORE] * len(stores)
+        index = {label: i for i, label in enumerate(labels)}
+        flows = [
+            (index[s], index[t], v)
+            for s, t, v in list(inbound_flows) + list(outbound_flows)
+            if s in index and t in index
+        ]
+        src, dst, value = (np.array(col) for col in zip(*flows)) if flows else ([], [], [])
+        return cls(labels, node_type, src, dst, value)
+
+    @property
+    def n_nodes(self):
+        return len(self.labels)
+
+    @property
+    def n_edges(self):
+        return len(self.src)
+
+    def tier(self, node_type):
+        """指定した層のノード ID 範囲"""
+        return np.arange(self.tier_offsets[node_type], self.tier_offsets[node_type + 1])
+
+    def out_volume(self):
+        return np.bincount(self.src, weights=self.value, minlength=self.n_nodes)
+
+    def in_volume(self):
+        return np.bincount(self.dst, weights=self.value, minlength=self.n_nodes)
+
+    def sankey(self, colors, min_share=None, other_color="#bbbbbb"):
+        """
+        Sankey 用の配列を返す
+        min_share=None のときはリンク数が SANKEY_MAX_LINKS を超えた場合だけ SANKEY_MIN_SHARE を使う
+        min_share > 0 のとき、出荷元ノードの総出荷量に対して min_share 未満の小口フローを
+        行き先の層ごとに「その他」ノードへまとめる（リンク数を抑えて大規模でも描画できるようにする）
+        戻り値: dict(labels, colors, source, target, value, min_share)
+        """
+        if min_share is None:
+            min_share = SANKEY_MIN_SHARE if self.n_edges > SANKEY_MAX_LINKS else 0.0
+        src, dst, value = self.src, self.dst, self.value
+        n_other = len(OTHER_LABELS)
+        if min_share > 0 and len(src):
+            small = value < self.out_volume()[src] * min_share
+            dst = np.where(small, self.n_nodes + self.node_type[dst].astype(np.int64), dst)
+            # 同じ (src, dst) をまとめる
+            key = src.astype(np.int64) * (self.n_nodes + n_other) + dst
+            key, inverse = np.unique(key, return_inverse=True)
+            value = np.bincount(inverse, weights=value)
+            src = (key // (self.n_nodes + n_other)).astype(np.int32)
+            dst = (key % (self.n_nodes + n_other)).astype(np.int32)
+
+        # 使われているノードだけに詰め直す
+        used, inverse = np.unique(np.concatenate([src, dst]), return_inverse=True)
+        all_labels = np.concatenate([self.labels, np.array(OTHER_LABELS, dtype=object)])
+        palette = np.array(list(colors), dtype=object)
+        all_colors = np.concatenate([palette[self.node_type], np.full(n_other, other_color, dtype=object)])
+        return dict(
+            labels=all_labels[used],
+            colors=all_colors[used],
+            source=inverse[: len(src)],
+            target=inverse[len(src):],
+            value=value,
+            min_share=min_share,
+        )
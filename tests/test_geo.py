@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from geo import GridIndex, haversine, haversine_matrix
+
+
+def brute_force_nearest(lat, lon, site_lat, site_lon):
+    matrix = haversine_matrix(lat, lon, site_lat, site_lon, dtype=np.float64)
+    best = matrix.argmin(axis=1)
+    return best, matrix[np.arange(len(lat)), best]
+
+
+@pytest.mark.parametrize("n_sites,cell_deg", [(1, None), (7, None), (500, None), (500, 0.05), (500, 5.0)])
+def test_grid_nearest_matches_brute_force(n_sites, cell_deg):
+    rng = np.random.default_rng(n_sites)
+    site_lat, site_lon = rng.uniform(30, 45, n_sites), rng.uniform(128, 145, n_sites)
+    # 格子の内側に加えて、格子の外側・遠く離れた問い合わせ点も含める
+    lat = np.concatenate([rng.uniform(30, 45, 2000), rng.uniform(-60, 80, 200)])
+    lon = np.concatenate([rng.uniform(128, 145, 2000), rng.uniform(-180, 180, 200)])
+
+    best, best_km = GridIndex(site_lat, site_lon, cell_deg).nearest(lat, lon)
+    expected, expected_km = brute_force_nearest(lat, lon, site_lat, site_lon)
+
+    np.testing.assert_allclose(best_km, expected_km, rtol=1e-9, atol=1e-6)
+    # 同じ距離の点が複数あるときはどちらでもよいので、選んだ点までの距離で確かめる
+    np.testing.assert_allclose(haversine(lat, lon, site_lat[best], site_lon[best]), expected_km, rtol=1e-9, atol=1e-6)
+
+
+def test_haversine_matrix_matches_pairwise():
+    rng = np.random.default_rng(0)
+    lat1, lon1 = rng.uniform(-80, 80, 30), rng.uniform(-180, 180, 30)
+    lat2, lon2 = rng.uniform(-80, 80, 20), rng.uniform(-180, 180, 20)
+    matrix = haversine_matrix(lat1, lon1, lat2, lon2, dtype=np.float64)
+    pairwise = haversine(lat1[:, None], lon1[:, None], lat2[None, :], lon2[None, :])
+    np.testing.assert_allclose(matrix, pairwise, rtol=1e-6, atol=1e-3)
+
+
+def test_grid_requires_points():
+    with pytest.raises(ValueError):
+        GridIndex([], [])
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from inventory_engine import InventoryState
+
+
+def make_inventory(n_warehouses=5, n_products=40, seed=0, forecast=True):
+    rng = np.random.default_rng(seed)
+    n = n_warehouses * n_products
+    monthly_demand = rng.integers(0, 50, n)
+    df = pd.DataFrame({
+        "Warehouse": pd.Categorical.from_codes(np.repeat(np.arange(n_warehouses), n_products),
+                                               [f"倉庫{i}" for i in range(n_warehouses)]),
+        "Product": pd.Categorical.from_codes(np.tile(np.arange(n_products), n_warehouses),
+                                             [f"部品{i}" for i in range(n_products)]),
+        "Stock": rng.integers(0, 200, n),
+        "UnitCost": rng.integers(100, 10000, n),
+        "SafetyStock": monthly_demand // 2,
+        "MonthlyDemand": monthly_demand,
+    })
+    if forecast:
+        df["ForecastDemand"] = (monthly_demand * rng.uniform(0.5, 1.5, n)).astype(np.float32)
+    return df
+
+
+def assert_same_state(state, expected):
+    assert state.total_value_sum == expected.total_value_sum
+    assert state.totals() == expected.totals()
+    np.testing.assert_array_equal(state.stock, expected.stock)
+    np.testing.assert_array_equal(state.total_value, expected.total_value)
+    np.testing.assert_array_equal(state.inventory_months, expected.inventory_months)
+    np.testing.assert_array_equal(state.alert_mask, expected.alert_mask)
+    np.testing.assert_array_equal(state.excess_mask, expected.excess_mask)
+    np.testing.assert_array_equal(state.alert_rows(), expected.alert_rows())
+    pd.testing.assert_frame_equal(state.snapshot(), expected.snapshot())
+
+
+@pytest.mark.parametrize("forecast", [True, False])
+def test_incremental_events_match_full_rebuild(forecast):
+    """入出庫イベントを差分で反映した結果が、最終在庫から作り直した状態と一致する"""
+    df = make_inventory(forecast=forecast)
+    state = InventoryState(df)
+    state.snapshot()   # キャッシュ済みの全行 DataFrame もイベントで作り直されること
+    rng = np.random.default_rng(1)
+    for _ in range(20):
+        rows = rng.integers(0, len(df), 30)        # 同じ行への複数イベントを含む
+        deltas = rng.integers(-150, 100, 30)       # 在庫を下回る出庫は 0 で止まる
+        state.apply_row_events(rows, deltas)
+
+    expected = InventoryState(df.assign(Stock=state.stock))
+    assert_same_state(state, expected)
+
+
+def test_apply_events_ignores_unknown_keys():
+    df = make_inventory()
+    state = InventoryState(df)
+    changed = state.apply_events(["倉庫0", "倉庫0", "未登録"], ["部品1", "部品1", "部品1"], [5, 7, 100])
+    assert changed == 1
+    assert state.stock[1] == df["Stock"][1] + 12
+    assert state.version == 1
+
+
+def test_alert_page_matches_sorted_frame():
+    df = make_inventory()
+    state = InventoryState(df)
+    page, total = state.alert_page("shortfall", offset=0, limit=10)
+    alerts = state.snapshot()[state.alert_mask].assign(Shortfall=lambda d: d["SafetyStock"] - d["Stock"])
+    alerts = alerts.sort_values("Shortfall", ascending=False, kind="stable")   # 不足数の多い順
+    assert total == len(alerts)
+    np.testing.assert_array_equal(page["Shortfall"].to_numpy(), alerts["Shortfall"].to_numpy()[:10])
+
+
+def test_frame_hides_forecast_without_history():
+    state = InventoryState(make_inventory(forecast=False))
+    assert not state.has_forecast
+    assert "ForecastDemand" not in state.snapshot().columns
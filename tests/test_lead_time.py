@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from lead_time import QuantileSketch
+
+QUANTILES = [0.0, 0.01, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_sketch_quantiles_within_relative_accuracy(relative_accuracy):
+    values = np.random.default_rng(0).lognormal(mean=1.5, sigma=0.8, size=50_000)
+    sketch = QuantileSketch(relative_accuracy)
+    sketch.add(values)
+    # スケッチは (件数 - 1) × q 番目の値を返す
+    exact = np.quantile(values, QUANTILES, method="lower")
+    got = sketch.quantiles(QUANTILES)
+    np.testing.assert_array_less(np.abs(got - exact), exact * relative_accuracy * (1 + 1e-9))
+
+
+def test_merged_sketches_match_single_sketch():
+    rng = np.random.default_rng(1)
+    batches = [rng.gamma(4.0, 2.0, n) for n in (10, 1000, 5000)] + [np.zeros(50)]
+    merged, single = QuantileSketch(), QuantileSketch()
+    for batch in batches:
+        part = QuantileSketch()
+        part.add(batch)
+        merged.merge(part)
+        single.add(batch)
+    assert merged.count == single.count == sum(len(b) for b in batches)
+    np.testing.assert_array_equal(merged.quantiles(QUANTILES), single.quantiles(QUANTILES))
+
+
+def test_zero_values_and_empty_sketch():
+    sketch = QuantileSketch()
+    assert np.isnan(sketch.quantiles([0.5])).all()
+    sketch.add([0, 0, 0, 10])
+    assert sketch.quantiles([0.5])[0] == 0.0
+    assert sketch.quantiles([1.0])[0] == pytest.approx(10, rel=0.01)
@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from refresh import LazyData, RefreshWorker
+
+
+class FakeSource:
+    def __init__(self):
+        self.version = 1
+        self.fail = False
+
+    def build(self, version):
+        if self.fail:
+            raise OSError("読み込み失敗")
+        return {"rows": [version] * version}
+
+
+def test_refresh_publishes_new_version_while_readers_keep_old():
+    source = FakeSource()
+    worker = RefreshWorker(probe=lambda: source.version, build=source.build, interval=3600, name="test-refresh")
+    old = worker.current(timeout=10)
+    assert old.version == 1
+
+    source.version = 2
+    assert worker.refresh_once()
+    new = worker.current()
+    assert new.version == 2 and new.data == {"rows": [2, 2]}
+    # 切替前に取得したスナップショットは前の版のまま変わらない
+    assert old.version == 1 and old.data == {"rows": [1]}
+
+    assert not worker.refresh_once()      # 版が変わらなければ作り直さない
+    assert worker.current() is new
+
+
+def test_refresh_failure_keeps_previous_snapshot():
+    source = FakeSource()
+    worker = RefreshWorker(probe=lambda: source.version, build=source.build, interval=3600, name="test-refresh")
+    snapshot = worker.current(timeout=10)
+
+    source.version, source.fail = 2, True
+    assert not worker.refresh_once()
+    assert worker.current() is snapshot
+    assert "OSError" in worker.last_error
+
+    source.fail = False
+    assert worker.refresh_once()
+    assert worker.current().version == 2 and worker.last_error is None
+
+
+def test_lazy_data_loads_each_value_once():
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def load():
+        calls.append(1)
+        return "sales"
+
+    data = LazyData({"sales": load}, {"store_keys": set()})
+    assert not data.loaded("sales") and data.loaded("store_keys")
+
+    def read():
+        barrier.wait()
+        assert data["sales"] == "sales"
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1 and data.loaded("sales")
+    assert data.get("missing") is None
+    with pytest.raises(KeyError):
+        data["missing"]
@@ -0,0 +1,15 @@
+import time
+
+import streamlit as st
+
+
+def show_data_status(worker, snapshot):
+    """サイドバーに表示中のデータの版と、バックグラウンド更新の状態を出す"""
+    built_at = time.strftime("%m/%d %H:%M:%S", time.localtime(snapshot.built_at))
+    st.sidebar.caption(f"🗂️ データ版 `{snapshot.label}`（{built_at} 更新・構築 {snapshot.build_seconds:.1f} 秒）")
+    if worker.refreshing:
+        st.sidebar.caption("🔄 新しい版を準備中です（切り替わるまで現在の版を表示します）")
+    if worker.last_error:
+        st.sidebar.warning(f"データの更新に失敗しました（前の版を表示中）: {worker.last_error}")
+    if st.sidebar.button("データの更新を確認", key="refresh_data"):
+        worker.trigger()
@@ -0,0 +1,102 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from perf import cache_miss, span
+
+# ------------------------------------------------------------------
+# Plotly 図のキャッシュ
+#   キー = (図の種類, 入力データの指紋, 図のパラメータ)
+#   LRU で古いものから破棄し、合計サイズが上限を超えないようにする
+# ------------------------------------------------------------------
+FINGERPRINT_SAMPLE_ROWS = 4096
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 128
+
+
+def frame_fingerprint(df):
+    """
+    DataFrame の軽量な指紋
+    形状・列・型に、等間隔に抜き出した行のハッシュと数値列の合計を加える
+    （全行をハッシュせずに、データの差し替えや更新を検知する）
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr((df.shape, list(df.columns), [str(t) for t in df.dtypes])).encode())
+    if len(df):
+        step = max(len(df) // FINGERPRINT_SAMPLE_ROWS, 1)
+        sample = df.iloc[::step]
+        h.update(pd.util.hash_pandas_object(sample, index=False).to_numpy().tobytes())
+        numeric = df.select_dtypes(include=[np.number, "bool"])
+        if numeric.shape[1]:
+            h.update(numeric.sum().to_numpy(dtype=np.float64).tobytes())
+    return h.hexdigest()
+
+
+class FigureCache:
+    """スレッドセーフな LRU の図キャッシュ（件数とおおよそのバイト数で上限を設ける）"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()   # key -> (fig, nbytes)
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key, build):
+        """key があればキャッシュ済みの図を返し、なければ build() で作って登録する"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        fig = build()
+        nbytes = len(fig.to_json())
+        if nbytes > self.max_bytes:
+            return fig
+
+        with self._lock:
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (fig, nbytes)
+            self.total_bytes += nbytes
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+        return fig
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries), "bytes": self.total_bytes,
+                "hits": self.hits, "misses": self.misses,
+            }
+
+
+@st.cache_resource
+def get_figure_cache():
+    """プロセス内で共有する図キャッシュ"""
+    return FigureCache()
+
+
+def cached_figure(name, df, build, **params):
+    """
+    df と params が前回と同じなら、作成済みの図を返す
+    例: cached_figure("inventory_treemap", df, lambda: px.treemap(df, ...), height=600)
+    """
+    with span(f"figure.{name}", cached=True):
+        key = (name, frame_fingerprint(df), tuple(sorted((k, repr(v)) for k, v in params.items())))
+        return get_figure_cache().get_or_build(key, cache_miss(f"figure.{name}.build")(build))
@@ -0,0 +1,54 @@
+import streamlit as st
+import pandas as pd
+
+# ------------------------------------------------------------------
+# サイドバーの絞り込み
+#   選択肢は FrameIndex のカテゴリから作り、結果は [(列名, 演算子, 値), ...] の filters で返す
+#   （未選択の項目は条件に含めない = 全件）
+# ------------------------------------------------------------------
+FILTER_LABELS = {
+    "Date": "期間",
+    "Channel": "チャネル（店舗）",
+    "Category": "カテゴリ",
+    "Warehouse": "倉庫",
+}
+
+
+def _format_date(value):
+    return pd.Timestamp(value).strftime("%Y-%m-%d")
+
+
+def show_sidebar_filters(index, range_columns=(), value_columns=()):
+    """
+    range_columns: 範囲で選ぶ列（日付など順序のある列）
+    value_columns: 値の集合で選ぶ列（複数選択）
+    """
+    filters = []
+    st.sidebar.subheader("絞り込み")
+    for col in range_columns:
+        options = index.categories(col).sort_values().tolist()
+        if len(options) < 2:
+            continue
+        # ウィジェットのキーに全範囲を含める（データの更新で範囲が変わったら作り直す）
+        # そのとき、全範囲を選んでいた場合は新しい全範囲に、絞り込んでいた場合はその範囲を引き継ぐ
+        bounds = (options[0], options[-1])
+        state = st.session_state.setdefault(f"filter_{col}_state", {"bounds": None, "selected": None})
+        if state["bounds"] != bounds:
+            selected = state["selected"]
+            narrowed = selected is not None and selected != state["bounds"] and set(selected) <= set(options)
+            state.update(bounds=bounds, default=selected if narrowed else bounds)
+        lo, hi = st.sidebar.select_slider(
+            FILTER_LABELS.get(col, col), options=options, value=state["default"],
+            format_func=_format_date if col == "Date" else str, key=f"filter_{col}_{bounds[0]}_{bounds[1]}",
+        )
+        state["selected"] = (lo, hi)
+        if (lo, hi) != bounds:
+            filters += [(col, ">=", lo), (col, "<=", hi)]
+    for col in value_columns:
+        selected = st.sidebar.multiselect(
+            FILTER_LABELS.get(col, col), index.categories(col).tolist(), key=f"filter_{col}",
+            placeholder="すべて",
+        )
+        if selected:
+            filters.append((col, "in", selected))
+    return filters
@@ -1,11 +1,31 @@
 import streamlit as st
-import plotly.express as px
 import pandas as pd
-import plotly.graph_objects as go
+import numpy as np
 
-def show_inventory_view(df_inventory):
+from data_loder import INVENTORY_INDEX_COLUMNS, frame_index, inventory_state, supply_graph, supply_graph_version
+from perf import span
+from views.figure_cache import cached_figure
+from views.paged_table import show_paged_table
+
+# このビューが使う列（UnitCost は入出庫イベントで資産額を更新するのに使う）
+# 安全在庫・需要予測・在庫月数・アラートは読み込み後に需要予測から求めるので読み込まない
+INVENTORY_COLUMNS = ["Warehouse", "Product", "Stock", "UnitCost", "MonthlyDemand", "TotalValue"]
+
+# グラフに送るデータ量の上限（SKU 数が増えてもブラウザが固まらないようにする）
+TREEMAP_TOP_N = 30            # 倉庫ごとに個別表示する部品数（残りは「その他」）
+SCATTER_MAX_POINTS = 20000    # これを超えたら散布図を密度表示に切り替える
+SCATTER_BINS = 60
+
+# 緊急手配リスト（並べ替え・絞り込みはサーバ側で行い、表示ページの行だけを送る）
+ALERT_SORT_OPTIONS = {"在庫数の少ない順": "stock", "不足数の多い順": "shortfall"}
+ALERT_TABLE_COLUMNS = ["Warehouse", "Product", "Stock", "SafetyStock", "Shortfall", "ForecastDemand", "InventoryMonths"]
+
+def show_inventory_view(df_inventory, version, filters=None, df_history=None):
     """
     在庫分析ダッシュボード（既存）
+    version: 表示中のスナップショットの版（キャッシュのキー）
+    filters: サイドバーの絞り込み [(列名, 演算子, 値), ...]
+    df_history: 需要履歴テーブル（None なら需要予測の列は表示しない）
     """
     st.title("🏭 部品在庫管理ダッシュボード")
     st.caption("物流センター長向け：供給責任の完遂と適正資産の維持")
@@ -15,16 +35,22 @@ def show_inventory_view(df_inventory):
     # ---------------------------------------------------------
     st.header("1. 現在のステータス（リスク管理）")
 
-    total_value = df_inventory["TotalValue"].sum()
-    alert_df = df_inventory[df_inventory["IsAlert"]]
-    alert_count = len(alert_df)
-    excess_df = df_inventory[df_inventory["InventoryMonths"] >= 3.0]
-    excess_count = len(excess_df)
-
-    col1, col2, col3 = st.columns(3)
-    col1.metric("在庫資産総額", f"¥{total_value:,.0f}")
-    col2.metric("🚨 欠品アラート", f"{alert_count} SKU", delta="- 供給停止リスク" if alert_count > 0 else "正常", delta_color="inverse")
-    col3.metric("⚠️ 滞留・過剰在庫", f"{excess_count} SKU", delta="キャッシュフロー圧迫", delta_color="off")
+    # 在庫状態エンジン（入出庫イベントを反映済み）から、件数・総額を差分更新済みの値で取得
+    # 絞り込み時は、インデックスで求めた行番号だけで集計する（状態エンジンは全行で共有）
+    with span("aggregate.inventory_state", cached=True):
+        state = inventory_state(df_inventory, version, df_history)
+    rows = None
+    if filters:
+        with span("filter.inventory", cached=True):
+            rows = frame_index(df_inventory, INVENTORY_INDEX_COLUMNS, version).select(filters)
+    df_inventory = state.snapshot() if rows is None else state.frame(rows)
+    total_value, alert_count, excess_count = state.totals(rows)
+
+    with span("render.kpi"):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("在庫資産総額", f"¥{total_value:,.0f}")
+        col2.metric("🚨 欠品アラート", f"{alert_count} SKU", delta="- 供給停止リスク" if alert_count > 0 else "正常", delta_color="inverse")
+        col3.metric("⚠️ 滞留・過剰在庫", f"{excess_count} SKU", delta="キャッシュフロー圧迫", delta_color="off")
 
     st.markdown("---")
 
@@ -34,10 +60,13 @@ def show_inventory_view(df_inventory):
     if alert_count > 0:
         st.subheader("🚨 緊急手配リスト")
         st.error("以下の部品は安全在庫を下回っています。至急手配してください。")
-        st.dataframe(
-            alert_df[["Warehouse", "Product", "Stock", "SafetyStock", "InventoryMonths"]].sort_values("Stock"),
-            use_container_width=True,
-            hide_index=True
+        product_query = st.text_input("部品名で検索", key="alerts_query").strip()
+        # 需要履歴がなく予測していない場合は、予測の列を出さない
+        columns = [c for c in ALERT_TABLE_COLUMNS if state.has_forecast or c != "ForecastDemand"]
+        show_paged_table(
+            "alerts",
+            lambda sort, offset, limit: state.alert_page(sort, offset, limit, rows, product_query),
+            ALERT_SORT_OPTIONS, columns=columns,
         )
     else:
         st.success("現在、欠品リスクのある部品はありません。")
@@ -50,20 +79,81 @@ def show_inventory_view(df_inventory):
     col_chart1, col_chart2 = st.columns(2)
     
     with col_chart1:
-        # Treemap
-        fig_wh = px.treemap(
-            df_inventory,
-            path=["Warehouse", "Product"], 
-            values="TotalValue",
-            title="在庫資産の構成比（倉庫 > 部品）",
-        )
-        fig_wh.update_traces(textinfo="label+value", texttemplate="%{label}<br>¥%{value:,.0f}")
-        st.plotly_chart(fig_wh, use_container_width=True)
+        # Treemap（入力が同じなら作成済みの図を再利用）
+        fig_wh = cached_figure("inventory_treemap", df_inventory, lambda: build_asset_treemap(df_inventory))
+        with span("render.inventory_treemap"):
+            st.plotly_chart(fig_wh, use_container_width=True)
         
     with col_chart2:
         # Scatter
+        fig_risk = cached_figure("inventory_risk_scatter", df_inventory, lambda: build_risk_scatter(df_inventory))
+        with span("render.inventory_risk_scatter"):
+            st.plotly_chart(fig_risk, use_container_width=True)
+
+
+def collapse_treemap_tail(df_inventory, top_n=TREEMAP_TOP_N):
+    """倉庫ごとに資産額の上位 top_n 部品だけを残し、残りを「その他（n 部品）」の 1 ノードにまとめる"""
+    df = df_inventory[["Warehouse", "Product", "TotalValue"]]
+    rank = df.groupby("Warehouse", observed=True)["TotalValue"].rank(method="first", ascending=False)
+    head = rank <= top_n
+    if head.all():
+        return df.astype({"Warehouse": str, "Product": str})   # plotly にはカテゴリ型でなく文字列で渡す
+    tail = (
+        df[~head.to_numpy()]
+        .groupby("Warehouse", observed=True)["TotalValue"]
+        .agg(["sum", "size"])
+        .reset_index()
+    )
+    tail = pd.DataFrame({
+        "Warehouse": tail["Warehouse"].astype(str),
+        "Product": "その他（" + tail["size"].astype(str) + " 部品）",
+        "TotalValue": tail["sum"],
+    })
+    top = df[head.to_numpy()].astype({"Warehouse": str, "Product": str})
+    return pd.concat([top, tail], ignore_index=True)
+
+
+def build_asset_treemap(df_inventory):
+    """在庫資産の構成比 Treemap（倉庫 > 部品）。部品数が多い倉庫は下位をまとめる"""
+    import plotly.express as px
+
+    fig_wh = px.treemap(
+        collapse_treemap_tail(df_inventory),
+        path=["Warehouse", "Product"], 
+        values="TotalValue",
+        title="在庫資産の構成比（倉庫 > 部品）",
+    )
+    fig_wh.update_traces(textinfo="label+value", texttemplate="%{label}<br>¥%{value:,.0f}")
+    return fig_wh
+
+
+def bin_risk_scatter(df_inventory, bins=SCATTER_BINS):
+    """
+    在庫月数 × 資産額 の 2 次元ヒストグラム（資産額は対数目盛のビン）
+    戻り値: (x のビン中心, y のビン中心, 件数の行列 [y, x])
+    """
+    x = df_inventory["InventoryMonths"].to_numpy(dtype=np.float64)
+    y = np.log10(np.maximum(df_inventory["TotalValue"].to_numpy(dtype=np.float64), 1.0))
+    counts, x_edges, y_edges = np.histogram2d(x, y, bins=bins)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = 10 ** ((y_edges[:-1] + y_edges[1:]) / 2)
+    return x_centers, y_centers, np.where(counts > 0, counts, np.nan).T
+
+
+def build_risk_scatter(df_inventory, max_points=SCATTER_MAX_POINTS):
+    """
+    在庫回転率 × 資産額の散布図
+    行数が max_points を超える場合は、正常在庫を密度（ヒートマップ）で表示し、
+    欠品アラートの点だけを個別に重ねる
+    """
+    import plotly.express as px
+    import plotly.graph_objects as go
+
+    if len(df_inventory) <= max_points:
         fig_risk = px.scatter(
-            df_inventory,
+            df_inventory[["InventoryMonths", "TotalValue", "MonthlyDemand", "IsAlert"]].assign(
+                Product=df_inventory["Product"].astype(str)   # plotly にはカテゴリ型でなく文字列で渡す
+            ),
             x="InventoryMonths",
             y="TotalValue",
             size="MonthlyDemand",
@@ -72,48 +162,53 @@ def show_inventory_view(df_inventory):
             title="在庫回転率 × 資産額マップ",
             color_discrete_map={True: "red", False: "navy"}
         )
-        fig_risk.add_vline(x=3.0, line_dash="dash", line_color="orange")
-        fig_risk.add_vline(x=0.5, line_dash="dash", line_color="red")
-        
-        st.plotly_chart(fig_risk, use_container_width=True)
-
-
-def show_logistics_sankey(ports, warehouses, stores, inbound_flows, outbound_flows):
+    else:
+        normal_df = df_inventory[~df_inventory["IsAlert"].to_numpy()]
+        alert_df = df_inventory[df_inventory["IsAlert"].to_numpy()]
+        x_centers, y_centers, counts = bin_risk_scatter(normal_df)
+        fig_risk = go.Figure(go.Heatmap(
+            x=x_centers, y=y_centers, z=counts, colorscale="Blues",
+            colorbar=dict(title="SKU数"), name="正常在庫（密度）",
+            hovertemplate="在庫月数 %{x:.1f}<br>資産額 ¥%{y:,.0f}<br>%{z:,.0f} SKU<extra></extra>",
+        ))
+        fig_risk.add_trace(go.Scattergl(
+            x=alert_df["InventoryMonths"], y=alert_df["TotalValue"], mode="markers",
+            marker=dict(color="red", size=5), name="欠品アラート",
+            text=alert_df["Warehouse"].astype(str) + " / " + alert_df["Product"].astype(str),
+            hovertemplate="%{text}<br>在庫月数 %{x:.1f}<br>資産額 ¥%{y:,.0f}<extra></extra>",
+        ))
+        fig_risk.update_layout(
+            title=f"在庫回転率 × 資産額マップ（{len(df_inventory):,} SKU・密度表示）",
+            xaxis_title="InventoryMonths", yaxis_title="TotalValue", yaxis_type="log",
+        )
+    fig_risk.add_vline(x=3.0, line_dash="dash", line_color="orange")
+    # 安全在庫は SKU ごとに違うので、在庫月数に換算した中央値を目安の線にする
+    demand_column = "ForecastDemand" if "ForecastDemand" in df_inventory.columns else "MonthlyDemand"
+    forecast = df_inventory[demand_column].to_numpy(dtype=np.float64)
+    safety_months = df_inventory["SafetyStock"].to_numpy(dtype=np.float64)[forecast > 0] / forecast[forecast > 0]
+    if len(safety_months):
+        fig_risk.add_vline(x=float(np.median(safety_months)), line_dash="dash", line_color="red",
+                           annotation_text="安全在庫（中央値）", annotation_position="top left")
+    return fig_risk
+
+
+def show_logistics_sankey(ports, warehouses, stores, inbound_flows, outbound_flows, version):
     """
     新規追加: 物流サプライチェーン（港->倉庫->店舗）のSankey Diagramを表示
     """
+    import plotly.graph_objects as go
+
     st.header("🚢 サプライチェーン可視化")
     st.markdown("輸入(Port) から 店舗(Store) までの商品の流れとボリュームを追跡します。")
 
     # --- Sankey Diagram用のデータ前処理 ---
     
-    # 1. 全ノードのリストを作成し、一意なID(index)を振る
-    all_labels = ports + warehouses + stores
-    label_to_index = {label: i for i, label in enumerate(all_labels)}
-    
-    # 2. ソース、ターゲット、値をリスト化
-    sources = []
-    targets = []
-    values = []
-    
-    # 色の設定
-    node_colors = []
-    for label in all_labels:
-        if label in ports:
-            node_colors.append("blue")
-        elif label in warehouses:
-            node_colors.append("orange")
-        else:
-            node_colors.append("green")
-
-    # フローデータの結合
-    all_flows = inbound_flows + outbound_flows
-
-    for src, tgt, val in all_flows:
-        if src in label_to_index and tgt in label_to_index:
-            sources.append(label_to_index[src])
-            targets.append(label_to_index[tgt])
-            values.append(val)
+    # 整数インデックス化したグラフ（データの版ごとに 1 回だけ作る）
+    supply_chain_data = (ports, warehouses, stores, inbound_flows, outbound_flows)
+    graph = supply_graph(supply_chain_data, version)
+
+    # 色の設定（港 / 倉庫 / 店舗）。リンクが多い場合は小口フローを「その他」にまとめる
+    sankey = graph.sankey(["blue", "orange", "green"])
 
     # --- 描画 ---
     fig = go.Figure(data=[go.Sankey(
@@ -121,14 +216,14 @@ def show_logistics_sankey(ports, warehouses, stores, inbound_flows, outbound_flo
             pad=20,
             thickness=20,
             line=dict(color="black", width=0.5),
-            label=all_labels,
-            color=node_colors,
+            label=sankey["labels"],
+            color=sankey["colors"],
             hovertemplate='%{label}<br>総量: %{value} unit<extra></extra>'
         ),
         link=dict(
-            source=sources,
-            target=targets,
-            value=values,
+            source=sankey["source"],
+            target=sankey["target"],
+            value=sankey["value"],
             color='rgba(200, 200, 200, 0.5)'
         )
     )])
@@ -145,4 +240,8 @@ def show_logistics_sankey(ports, warehouses, stores, inbound_flows, outbound_flo
     **💡 分析のヒント**
     - **ボトルネックの特定:** 線が集中している倉庫（例：関東DC）が停止した際の影響範囲を確認できます。
     - **依存度の可視化:** 各店舗がどの港・倉庫からの供給に依存しているかがわかります。
-    """)
\ No newline at end of file
+    """)
+
+    # 停止シミュレーション（影響範囲・ボトルネックの計算）
+    from views.suply_chain_view import show_disruption_whatif
+    show_disruption_whatif(graph, supply_graph_version(supply_chain_data, version))
\ No newline at end of file
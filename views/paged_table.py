@@ -0,0 +1,56 @@
+import streamlit as st
+
+from perf import span
+
+# ------------------------------------------------------------------
+# ページ分割テーブル
+#   並べ替え・絞り込みはサーバ側（fetch 関数）で行い、表示するページの行だけを st.dataframe に渡す
+#   fetch(sort, offset, limit) -> (ページの DataFrame, 絞り込み後の総件数)
+# ------------------------------------------------------------------
+PAGE_SIZES = [20, 50, 100, 500]
+
+
+def frame_fetcher(df, sort_columns):
+    """
+    DataFrame 用の fetch 関数を作る
+    sort_columns: {並び順の値: (列名, 昇順か)}。offset + limit 件までを部分選択（nsmallest / nlargest）で取り出す
+    """
+    def fetch(sort, offset, limit):
+        column, ascending = sort_columns[sort]
+        end = min(offset + limit, len(df))
+        top = df.nsmallest(end, column, keep="first") if ascending else df.nlargest(end, column, keep="first")
+        return top.iloc[offset:end], len(df)
+    return fetch
+
+
+def show_paged_table(key, fetch, sort_options, columns=None, page_size=PAGE_SIZES[0]):
+    """
+    ページ送り・並び順・表示件数の操作付きテーブル
+    key: ウィジェットのキーの接頭辞 / sort_options: {表示名: 並び順の値}
+    """
+    col_sort, col_size, col_page = st.columns([2, 1, 1])
+    sort_label = col_sort.selectbox("並び順", list(sort_options), key=f"{key}_sort")
+    size = col_size.selectbox("表示件数", PAGE_SIZES, index=PAGE_SIZES.index(page_size), key=f"{key}_size")
+
+    # ページを取り出してから総件数でページ番号を確定する（絞り込みで件数が減ったら最終ページに戻す）
+    page_key = f"{key}_page"
+    page = st.session_state.get(page_key, 1)
+    with span(f"aggregate.{key}_page"):
+        df_page, total = fetch(sort_options[sort_label], (page - 1) * size, size)
+        n_pages = max((total + size - 1) // size, 1)
+        if page > n_pages:
+            page = n_pages
+            df_page, total = fetch(sort_options[sort_label], (page - 1) * size, size)
+    st.session_state[page_key] = page
+    col_page.number_input("ページ", min_value=1, max_value=n_pages, step=1, key=page_key)
+    offset = (page - 1) * size
+
+    if columns is not None:
+        df_page = df_page[columns]
+    with span(f"render.{key}", rows=len(df_page)):
+        st.dataframe(df_page, use_container_width=True, hide_index=True)
+    if total:
+        st.caption(f"全 {total:,} 件中 {offset + 1:,}〜{offset + len(df_page):,} 件を表示（{page} / {n_pages:,} ページ）")
+    else:
+        st.caption("該当する行はありません")
+    return total
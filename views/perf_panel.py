@@ -0,0 +1,26 @@
+import streamlit as st
+import pandas as pd
+
+
+def show_perf_panel(run):
+    """
+    サイドバーの計測パネル：直前の再実行の区間ごとの処理時間
+    （DASHBOARD_PERF=1 のときだけ app.py から呼ばれる）
+    """
+    if run is None:
+        return
+    records = run.records()
+    total_ms = run.seconds * 1000
+    measured_ms = sum(r["ms"] or 0 for r in records if r["depth"] == 0)
+
+    with st.sidebar.expander(f"⏱️ パフォーマンス（{total_ms:,.0f} ms）", expanded=False):
+        if not records:
+            st.caption("計測区間はありません")
+            return
+        df = pd.DataFrame({
+            "区間": ["　" * r["depth"] + r["span"] for r in records],
+            "ms": [r["ms"] for r in records],
+            "キャッシュ": [r.get("cache", "") for r in records],
+        })
+        st.dataframe(df, use_container_width=True, hide_index=True)
+        st.caption(f"計測外: {max(total_ms - measured_ms, 0):,.0f} ms / run_id: {run.run_id}")
@@ -1,22 +1,46 @@
 import streamlit as st
-import plotly.express as px
 import pandas as pd
 
-def show_sales_view(df_sales):
+from data_loder import SALES_INDEX_COLUMNS, frame_index, partition_cube, sales_cube
+from perf import span
+from views.figure_cache import cached_figure
+
+# このビューが使う列（データソースからはこの列だけを読み込む）
+SALES_COLUMNS = ["Date", "Month", "Channel", "Category", "Sales", "Target", "Profit"]
+
+def show_sales_view(df_sales, version, filters=None, partitions=None):
     """
     売上分析ダッシュボード
     構成：
     1. 主要KPI（最新月）
     2. 店舗別積み上げ棒グラフ
     3. 商品別積み上げ棒グラフ
+    version: 表示中のスナップショットの版（キャッシュのキー）
+    filters: サイドバーの絞り込み [(列名, 演算子, 値), ...]
+    partitions: 月別パーティションの位置（Partition のリスト、月順）。あれば月ごとのキューブを使い回す
     """
     st.title("📊 売上分析ダッシュボード")
     st.caption("1. 主要KPI（最新月）")
 
-    # データ処理：日付型確認
-    df = df_sales.copy()
-    if "Date" in df.columns:
-        df["Date"] = pd.to_datetime(df["Date"])
+    # データ処理：月 × チャネル × カテゴリのキューブ（データの版ごとに 1 回だけ集計）
+    # 絞り込み：インデックスで行番号を求め、該当行だけでキューブを作る（条件ごとにキャッシュ）
+    rows = None
+    if filters:
+        with span("filter.sales", cached=True):
+            rows = frame_index(df_sales, SALES_INDEX_COLUMNS, version).select(filters)
+        if rows is not None and len(rows) == 0:
+            st.warning("絞り込み条件に該当する売上データがありません。")
+            return
+    with span("aggregate.sales_cube", cached=True):
+        cube = sales_cube(df_sales, version, filters, rows, partitions)
+    with span("aggregate.monthly"):
+        months = cube["Month"].unique().tolist()   # キューブは月順に並んでいる
+        if partitions and not filters:
+            # KPI に要るのは最新月と前月だけなので、その 2 パーティションのキューブだけを読む
+            kpi_cube = pd.concat([partition_cube(df_sales, p) for p in partitions[-2:]], ignore_index=True)
+        else:
+            kpi_cube = cube
+        monthly = kpi_cube.groupby("Month")[["Sales", "Target", "Profit"]].sum()
 
     # ---------------------------------------------------------
     # 1. 主要KPI（最新月のデータを表示）
@@ -24,45 +48,44 @@ def show_sales_view(df_sales):
     st.subheader("1. 今月のハイライト")
     
     # 最新月を取得
-    latest_date = df["Date"].max()
-    current_month_df = df[df["Date"] == latest_date]
-    
-    # 集計
-    total_sales = current_month_df["Sales"].sum()
-    total_target = current_month_df["Target"].sum()
-    total_profit = current_month_df["Profit"].sum()
-    
-    # 達成率計算
-    achievement_rate = (total_sales / total_target) * 100
-    
-    # 前月比を出したい場合（オプション）
-    prev_date = latest_date - pd.DateOffset(months=1)
-    prev_month_df = df[df["Date"] == prev_date]
-    prev_sales = prev_month_df["Sales"].sum() if not prev_month_df.empty else total_sales
-    mom_diff = total_sales - prev_sales
-
-    # KPIカードの表示（3カラム）
-    kpi1, kpi2, kpi3 = st.columns(3)
-
-    kpi1.metric(
-        label="今月の売上",
-        value=f"¥{total_sales:,.0f}",
-        delta=f"前月比 {mom_diff:,.0f}円"
-    )
-    
-    kpi2.metric(
-        label="目標達成率",
-        value=f"{achievement_rate:.1f}%",
-        delta=f"目標差 ¥{total_sales - total_target:,.0f}",
-        delta_color="normal" if achievement_rate >= 100 else "inverse" # 未達なら赤字
-    )
-    
-    kpi3.metric(
-        label="今月の粗利益",
-        value=f"¥{total_profit:,.0f}",
-        delta=f"利益率 {(total_profit/total_sales*100):.1f}%"
-    )
+    latest_month = months[-1]
     
+    with span("render.kpi"):
+        # 集計
+        total_sales = monthly.at[latest_month, "Sales"]
+        total_target = monthly.at[latest_month, "Target"]
+        total_profit = monthly.at[latest_month, "Profit"]
+
+        # 達成率計算
+        achievement_rate = (total_sales / total_target) * 100
+
+        # 前月比を出したい場合（オプション）
+        prev_month = (pd.Period(latest_month, freq="M") - 1).strftime("%Y-%m")
+        prev_sales = monthly.at[prev_month, "Sales"] if prev_month in monthly.index else total_sales
+        mom_diff = total_sales - prev_sales
+
+        # KPIカードの表示（3カラム）
+        kpi1, kpi2, kpi3 = st.columns(3)
+
+        kpi1.metric(
+            label="今月の売上",
+            value=f"¥{total_sales:,.0f}",
+            delta=f"前月比 {mom_diff:,.0f}円"
+        )
+
+        kpi2.metric(
+            label="目標達成率",
+            value=f"{achievement_rate:.1f}%",
+            delta=f"目標差 ¥{total_sales - total_target:,.0f}",
+            delta_color="normal" if achievement_rate >= 100 else "inverse" # 未達なら赤字
+        )
+
+        kpi3.metric(
+            label="今月の粗利益",
+            value=f"¥{total_profit:,.0f}",
+            delta=f"利益率 {(total_profit/total_sales*100):.1f}%"
+        )
+
     st.markdown("---") # 区切り線
 
     # ---------------------------------------------------------
@@ -72,19 +95,16 @@ def show_sales_view(df_sales):
     st.caption("どの店舗が全体の売上を支えているかを確認します。")
     
     # 月×チャネルで集計
-    df_channel = df.groupby(["Month", "Channel"])["Sales"].sum().reset_index()
+    with span("aggregate.sales_by_channel"):
+        df_channel = cube.groupby(["Month", "Channel"], observed=True)["Sales"].sum().reset_index()
     
-    fig_channel = px.bar(
-        df_channel,
-        x="Month",
-        y="Sales",
-        color="Channel",
-        title="月次売上推移（店舗別 積み上げ）",
-        text_auto='.2s', # 数値を短縮表示
-        category_orders={"Month": sorted(df["Month"].unique())} # 月順に並べる
+    fig_channel = cached_figure(
+        "sales_by_channel", df_channel,
+        lambda: build_stacked_bar(df_channel, "Channel", "月次売上推移（店舗別 積み上げ）", months),
+        months=months,
     )
-    fig_channel.update_layout(xaxis_title="月", yaxis_title="売上 (円)")
-    st.plotly_chart(fig_channel, use_container_width=True)
+    with span("render.sales_by_channel"):
+        st.plotly_chart(fig_channel, use_container_width=True)
 
     # ---------------------------------------------------------
     # 3. 売上推移：商品（カテゴリ）別 積み上げ棒グラフ
@@ -93,17 +113,31 @@ def show_sales_view(df_sales):
     st.caption("季節ごとの売れ筋商品の変化（トレンド）を確認します。")
     
     # 月×カテゴリで集計
-    df_category = df.groupby(["Month", "Category"])["Sales"].sum().reset_index()
+    with span("aggregate.sales_by_category"):
+        df_category = cube.groupby(["Month", "Category"], observed=True)["Sales"].sum().reset_index()
     
-    fig_category = px.bar(
-        df_category,
+    fig_category = cached_figure(
+        "sales_by_category", df_category,
+        lambda: build_stacked_bar(df_category, "Category", "月次売上推移（カテゴリ別 積み上げ）", months, pastel=True),
+        months=months,
+    )
+    with span("render.sales_by_category"):
+        st.plotly_chart(fig_category, use_container_width=True)
+
+
+def build_stacked_bar(df_month, color, title, months, pastel=False):
+    """月次売上の積み上げ棒グラフ（color 列で色分け）"""
+    import plotly.express as px
+
+    fig = px.bar(
+        df_month,
         x="Month",
         y="Sales",
-        color="Category",
-        title="月次売上推移（カテゴリ別 積み上げ）",
-        text_auto='.2s',
-        category_orders={"Month": sorted(df["Month"].unique())},
-        color_discrete_sequence=px.colors.qualitative.Pastel # 色味を変えて区別
+        color=color,
+        title=title,
+        text_auto='.2s', # 数値を短縮表示
+        category_orders={"Month": months}, # 月順に並べる
+        color_discrete_sequence=px.colors.qualitative.Pastel if pastel else None # 色味を変えて区別
     )
-    fig_category.update_layout(xaxis_title="月", yaxis_title="売上 (円)")
-    st.plotly_chart(fig_category, use_container_width=True)
\ No newline at end of file
+    fig.update_layout(xaxis_title="月", yaxis_title="売上 (円)")
+    return fig
@@ -1,10 +1,100 @@
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-import pandas as pd
 import numpy as np
 
-def show_supply_chain_view(ports, warehouses, stores, inbound_flows, outbound_flows):
+from data_loder import (
+    build_disruption_engine, load_lead_time_store, network_geo, product_catalog, store_landed_costs,
+    supply_graph, supply_graph_version,
+)
+from geo import REASSIGN_MIN_SAVING_KM, REASSIGN_MIN_SAVING_RATIO
+from landed_cost import COST_COMPONENTS
+from perf import span
+from supply_graph import STORE, WAREHOUSE
+from views.paged_table import frame_fetcher, show_paged_table
+
+# Sankey のノード色（港: 青 / 倉庫: オレンジ / 店舗: 緑）
+SANKEY_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c"]
+
+# ルート線の太さの段階（量が多いほど太く）。トレース数はこの段階数が上限になる
+ROUTE_WIDTH_LEVELS = np.array([1.0, 2.0, 3.0, 4.0, 5.0, 6.0])
+
+# 着地原価の店舗の選択肢（全店舗の物量加重平均）
+ALL_STORES = "全店舗（物量加重平均）"
+
+# 出荷元の見直し案の対象（表示名: 着荷側の層）
+REASSIGN_TARGETS = {"店舗 ← 最寄り倉庫": STORE, "倉庫 ← 最寄り港": WAREHOUSE}
+
+
+def build_route_traces(lanes):
+    """
+    レーン（NetworkGeo.lane_frame()）を線の太さの段階ごとに 1 本の Scattermapbox にまとめる
+    各ルートは [始点, 終点, 区切り(NaN)] の 3 点で表し、ホバー文字列は点ごとに持たせる
+    """
+    import plotly.graph_objects as go
+
+    if lanes.empty:
+        return []
+
+    width = lanes["Volume"].to_numpy() / 2000 + 1
+    level = np.abs(width[:, None] - ROUTE_WIDTH_LEVELS[None, :]).argmin(axis=1)
+    text = (lanes["Source"] + "→" + lanes["Target"] + ": " + lanes["Volume"].astype(int).astype(str)
+            + " unit / " + lanes["DistanceKm"].map("{:,.0f} km".format)).to_numpy()
+    coords = lanes[["SourceLat", "SourceLon", "TargetLat", "TargetLon"]].to_numpy(dtype=float)
+
+    traces = []
+    for i in np.unique(level):
+        m = level == i
+        n = int(m.sum())
+        lat = np.full((n, 3), np.nan)
+        lon = np.full((n, 3), np.nan)
+        hover = np.full((n, 3), None, dtype=object)
+        lat[:, 0], lat[:, 1] = coords[m, 0], coords[m, 2]
+        lon[:, 0], lon[:, 1] = coords[m, 1], coords[m, 3]
+        hover[:, 0] = hover[:, 1] = text[m]
+        traces.append(go.Scattermapbox(
+            mode="lines", lat=lat.ravel(), lon=lon.ravel(),
+            line=dict(width=ROUTE_WIDTH_LEVELS[i], color="gray"),
+            hoverinfo="text", text=hover.ravel(),
+            name=f"ルート（太さ {ROUTE_WIDTH_LEVELS[i]:g}）",
+        ))
+    return traces
+
+
+def show_disruption_whatif(graph, version):
+    """
+    停止シミュレーション：選んだ港・倉庫が止まった場合の店舗欠品と、ボトルネックを表示
+    エンジンはセッションごとに保持し、選択が変わった拠点の下流だけを再計算する
+    """
+    st.markdown("#### 🔌 停止シミュレーション（What-if）")
+    candidates = graph.labels[: graph.tier_offsets[STORE]].tolist()
+    stopped = st.multiselect("停止する拠点（港・倉庫）", candidates, key="disruption_stopped")
+
+    with span("aggregate.whatif", cached=True, stopped=len(stopped)):
+        state = st.session_state.get("disruption_engine")
+        if state is None or state[0] != version:
+            state = (version, build_disruption_engine(graph, version).copy())
+            st.session_state["disruption_engine"] = state
+        engine = state[1].apply(stopped)
+        df_loss = engine.store_loss()
+    col1, col2 = st.columns(2)
+    col1.metric("欠品量（店舗合計）", f"{df_loss['Lost'].sum():,.0f} unit")
+    col2.metric("影響を受ける店舗", f"{len(df_loss)} 店舗")
+    if stopped:
+        show_paged_table(
+            "whatif_loss",
+            frame_fetcher(df_loss, {"lost": ("Lost", False), "rate": ("LostRate", False)}),
+            {"欠品量の多い順": "lost", "欠品率の高い順": "rate"},
+        )
+
+    with st.expander("ボトルネック分析（単独停止時の影響・最小カット）"):
+        with span("aggregate.bottlenecks"):
+            df_ranking = engine.impact_ranking().head(20)
+            flow_value, df_cut = engine.bottlenecks()
+        st.dataframe(df_ranking, use_container_width=True, hide_index=True)
+        st.caption(f"港→店舗の最大流量: {flow_value:,.0f} unit（下表が供給量を制約している箇所）")
+        st.dataframe(df_cut, use_container_width=True, hide_index=True)
+
+
+def show_supply_chain_view(ports, warehouses, stores, inbound_flows, outbound_flows, version, df_inventory=None):
     """
     サプライチェーン全体の可視化ダッシュボード
     構成：
@@ -12,7 +102,11 @@ def show_supply_chain_view(ports, warehouses, stores, inbound_flows, outbound_fl
     2. 地理的ネットワーク (Map)
     3. 遅延リスク分析 (Lead Time)
     4. コスト構造分析 (Cost)
+    version: 表示中のスナップショットの版（キャッシュのキー）
     """
+    import plotly.express as px   # 描画時にだけ読み込む（起動を軽くする）
+    import plotly.graph_objects as go
+
     st.title("🚢 サプライチェーン・マネジメント (SCM)")
     st.markdown("調達(Port)から販売(Store)までの「モノ・時間・カネ」の流れを一元管理します。")
 
@@ -31,43 +125,38 @@ def show_supply_chain_view(ports, warehouses, stores, inbound_flows, outbound_fl
         st.subheader("物流ボリュームの全体像")
         st.caption("どこから・どこへ・どれだけの量が流れているか（線の太さ＝数量）")
         
-        # --- データ前処理 ---
-        all_labels = ports + warehouses + stores
-        label_to_index = {label: i for i, label in enumerate(all_labels)}
-        
-        sources, targets, values = [], [], []
-        node_colors = []
-        
-        # 色分け
-        for label in all_labels:
-            if label in ports: node_colors.append("#1f77b4")   # 青
-            elif label in warehouses: node_colors.append("#ff7f0e") # オレンジ
-            else: node_colors.append("#2ca02c")                 # 緑
-
-        # フロー結合
-        all_flows = inbound_flows + outbound_flows
-        for src, tgt, val in all_flows:
-            if src in label_to_index and tgt in label_to_index:
-                sources.append(label_to_index[src])
-                targets.append(label_to_index[tgt])
-                values.append(val)
+        # --- データ前処理（整数インデックス化したグラフを版ごとに 1 回だけ作る） ---
+        supply_chain_data = (ports, warehouses, stores, inbound_flows, outbound_flows)
+        with span("aggregate.supply_graph", cached=True):
+            graph = supply_graph(supply_chain_data, version)
+
+        # リンクが多い場合は小口フローを「その他」にまとめる
+        with span("aggregate.sankey", edges=graph.n_edges):
+            sankey = graph.sankey(SANKEY_COLORS)
+        if sankey["min_share"]:
+            st.caption(f"※ 出荷元の {sankey['min_share']:.0%} 未満のフローは「その他」にまとめて表示しています。")
 
         # 描画
-        fig_sankey = go.Figure(data=[go.Sankey(
-            node=dict(
-                pad=20, thickness=20,
-                line=dict(color="black", width=0.5),
-                label=all_labels,
-                color=node_colors,
-                hovertemplate='%{label}<br>総量: %{value} unit<extra></extra>'
-            ),
-            link=dict(
-                source=sources, target=targets, value=values,
-                color='rgba(200, 200, 200, 0.5)'
-            )
-        )])
-        fig_sankey.update_layout(height=600, margin=dict(t=20,b=20,l=20,r=20))
-        st.plotly_chart(fig_sankey, use_container_width=True)
+        with span("figure.sankey"):
+            fig_sankey = go.Figure(data=[go.Sankey(
+                node=dict(
+                    pad=20, thickness=20,
+                    line=dict(color="black", width=0.5),
+                    label=sankey["labels"],
+                    color=sankey["colors"],
+                    hovertemplate='%{label}<br>総量: %{value} unit<extra></extra>'
+                ),
+                link=dict(
+                    source=sankey["source"], target=sankey["target"], value=sankey["value"],
+                    color='rgba(200, 200, 200, 0.5)'
+                )
+            )])
+            fig_sankey.update_layout(height=600, margin=dict(t=20,b=20,l=20,r=20))
+        with span("render.sankey"):
+            st.plotly_chart(fig_sankey, use_container_width=True)
+
+        # 停止シミュレーション
+        show_disruption_whatif(graph, supply_graph_version(supply_chain_data, version))
 
     # =================================================================
     # Tab 2: 地図分析 (Geospatial Map) - 新規追加
@@ -75,49 +164,67 @@ def show_supply_chain_view(ports, warehouses, stores, inbound_flows, outbound_fl
     with tab2:
         st.subheader("物流ネットワークマップ")
         
-        # 簡易的なマスタデータ（実務ではDBから取得）
-        locations = {
-            "東京港": {"lat": 35.6267, "lon": 139.7758, "type": "Port"},
-            "横浜港": {"lat": 35.4468, "lon": 139.6489, "type": "Port"},
-            "神戸港": {"lat": 34.6850, "lon": 135.2656, "type": "Port"},
-            "博多港": {"lat": 33.6101, "lon": 130.3970, "type": "Port"},
-            "関東DC": {"lat": 35.8000, "lon": 139.7000, "type": "Warehouse"},
-            "中部ハブ": {"lat": 35.0500, "lon": 136.8500, "type": "Warehouse"},
-            "関西物流センター": {"lat": 34.7500, "lon": 135.4500, "type": "Warehouse"},
-            "九州デポ": {"lat": 33.5500, "lon": 130.4500, "type": "Warehouse"},
-            "新宿旗艦店": {"lat": 35.6909, "lon": 139.7002, "type": "Store"},
-            "梅田店": {"lat": 34.7025, "lon": 135.4959, "type": "Store"},
-            "博多駅前店": {"lat": 33.5902, "lon": 130.4207, "type": "Store"},
-            "渋谷店": {"lat": 35.6580, "lon": 139.7016, "type": "Store"},
-            "横浜店": {"lat": 35.4657, "lon": 139.6223, "type": "Store"},
-            "名古屋駅前店": {"lat": 35.1709, "lon": 136.8815, "type": "Store"},
-            "心斎橋店": {"lat": 34.6714, "lon": 135.5014, "type": "Store"},
-            "天神店": {"lat": 33.5916, "lon": 130.3989, "type": "Store"},
-        }
-
-        # マップ用データ作成
-        df_loc = pd.DataFrame.from_dict(locations, orient='index').reset_index()
-        df_loc.columns = ["Name", "lat", "lon", "type"]
-        
+        # 座標マスタ（data_loder.SITE_LOCATIONS）と各レーンの距離（データの版ごとに 1 回だけ計算）
+        with span("aggregate.network_geo", cached=True):
+            geo = network_geo(supply_chain_data, version)
+            lanes = geo.lane_frame()
+        df_loc = geo.site_frame()
+
         # ベースマップ
-        fig_map = px.scatter_mapbox(
-            df_loc, lat="lat", lon="lon", color="type", size=[10]*len(df_loc),
-            hover_name="Name", zoom=4, center={"lat": 36.0, "lon": 137.0},
-            mapbox_style="carto-positron", height=600
-        )
-        
-        # ルート線を描画
-        for src, tgt, val in all_flows:
-            if src in locations and tgt in locations:
-                fig_map.add_trace(go.Scattermapbox(
-                    mode="lines",
-                    lon=[locations[src]["lon"], locations[tgt]["lon"]],
-                    lat=[locations[src]["lat"], locations[tgt]["lat"]],
-                    line=dict(width=val/2000 + 1, color="gray"), # 量が多いほど太く
-                    hoverinfo="text", text=f"{src}→{tgt}: {val}"
-                ))
-        
-        st.plotly_chart(fig_map, use_container_width=True)
+        with span("figure.base_map"):
+            fig_map = px.scatter_mapbox(
+                df_loc, lat="lat", lon="lon", color="type", size=[10]*len(df_loc),
+                hover_name="Name", zoom=4, center={"lat": 36.0, "lon": 137.0},
+                mapbox_style="carto-positron", height=600
+            )
+
+        # ルート線を描画（線の太さごとに 1 トレースへまとめる）
+        with span("figure.route_traces", flows=len(lanes)):
+            fig_map.add_traces(build_route_traces(lanes))
+
+        with span("render.route_map"):
+            st.plotly_chart(fig_map, use_container_width=True)
+
+        unmapped = geo.unmapped_lanes()
+        if len(unmapped):
+            st.warning(f"座標が未登録の拠点を含むフロー {len(unmapped):,} 件は地図・距離の集計に含めていません。")
+            with st.expander("座標が未登録のフロー"):
+                show_paged_table("unmapped_lanes", frame_fetcher(unmapped, {"volume": ("Volume", False)}),
+                                 {"量の多い順": "volume"})
+
+        # --- 距離の指標（量で加重した平均距離と、量×距離の合計） ---
+        summary = geo.summary()
+        cols = st.columns(len(summary))
+        for col, row in zip(cols, summary.itertuples()):
+            col.metric(f"{row.Tier} 平均距離", "-" if np.isnan(row.AvgKm) else f"{row.AvgKm:,.0f} km",
+                       delta=f"量×距離 {row.VolumeKm:,.0f} unit·km", delta_color="off")
+
+        with st.expander("レーン別の距離・量×距離"):
+            show_paged_table(
+                "lane_distance",
+                frame_fetcher(lanes[["Source", "Target", "Volume", "DistanceKm", "VolumeKm"]], {
+                    "volume_km": ("VolumeKm", False), "distance": ("DistanceKm", False),
+                }),
+                {"量×距離の大きい順": "volume_km", "距離の長い順": "distance"},
+            )
+
+        # --- 出荷元の付け替え案（最寄りの出荷元と比べて遠いレーン） ---
+        st.markdown("#### 🔁 出荷元の見直し案（最寄り拠点への付け替え）")
+        target_label = st.radio("対象", list(REASSIGN_TARGETS), horizontal=True, key="reassign_target")
+        with span("aggregate.reassignments", cached=True):
+            proposals = geo.reassignments(REASSIGN_TARGETS[target_label])
+        if proposals.empty:
+            st.success("最寄りの出荷元から大きく外れたレーンはありません。")
+        else:
+            st.caption(
+                f"最寄りの出荷元より {REASSIGN_MIN_SAVING_KM:,.0f} km 以上・{REASSIGN_MIN_SAVING_RATIO:.0%} 以上遠いレーン"
+                f" {len(proposals):,} 件"
+            )
+            show_paged_table(
+                f"reassignments_{REASSIGN_TARGETS[target_label]}",
+                frame_fetcher(proposals, {"saving": ("SavedVolumeKm", False), "volume": ("Volume", False)}),
+                {"削減できる量×距離の大きい順": "saving", "物量の多い順": "volume"},
+            )
 
     # =================================================================
     # Tab 3: リードタイム分析 (Lead Time) - 新規追加
@@ -126,40 +233,86 @@ def show_supply_chain_view(ports, warehouses, stores, inbound_flows, outbound_fl
         st.subheader("配送リードタイムのばらつき")
         st.caption("平均日数だけでなく、遅延の振れ幅（リスク）を箱ひげ図で可視化")
         
-        # ダミーデータ生成
-        routes_list = ["東京港→関東DC", "横浜港→中部ハブ", "神戸港→関西物流", "関東DC→新宿店", "中部ハブ→名古屋店"]
-        lead_data = []
-        rng = np.random.default_rng(42)
-        
-        for r in routes_list:
-            # 港発はばらつき大(scale=3)、国内は安定(scale=0.5)
-            sigma = 3.0 if "港" in r else 0.5
-            mu = 14.0 if "港" in r else 2.0
-            
-            days = rng.normal(mu, sigma, 50)
-            for d in days:
-                lead_data.append({"Route": r, "Days": max(0.5, d)})
-                
-        df_lead = pd.DataFrame(lead_data)
-        
-        fig_box = px.box(df_lead, x="Route", y="Days", color="Route", points="all")
-        st.plotly_chart(fig_box, use_container_width=True)
+        # ルート別の集計（分位点スケッチ）から箱ひげ図を作る。生データはブラウザに送らない
+        with span("load.lead_time_store", cached=True):
+            lead_store = load_lead_time_store()
+        with span("aggregate.lead_time_summary"):
+            df_summary = lead_store.summary()
+
+        fig_box = go.Figure()
+        for i, row in df_summary.iterrows():
+            iqr = row["P75"] - row["P25"]
+            color = px.colors.qualitative.Plotly[i % len(px.colors.qualitative.Plotly)]
+            fig_box.add_trace(go.Box(
+                name=row["Route"], x=[row["Route"]],
+                q1=[row["P25"]], median=[row["P50"]], q3=[row["P75"]],
+                lowerfence=[max(row["Min"], row["P25"] - 1.5 * iqr)],
+                upperfence=[min(row["Max"], row["P75"] + 1.5 * iqr)],
+                mean=[row["Mean"]], sd=[row["Std"]],
+                marker_color=color,
+            ))
+        if st.checkbox(f"サンプル点を表示（ルートごとに最大 {lead_store.reservoir_size} 点）", value=True):
+            df_points = lead_store.samples()
+            fig_box.add_trace(go.Scatter(
+                x=df_points["Route"], y=df_points["Days"], mode="markers",
+                marker=dict(size=4, color="rgba(80, 80, 80, 0.5)"), name="サンプル", showlegend=False,
+            ))
+        fig_box.update_layout(xaxis_title="Route", yaxis_title="Days")
+        with span("render.lead_time_box"):
+            st.plotly_chart(fig_box, use_container_width=True)
+
+        # 遅延リスク（分位点）
+        st.dataframe(
+            df_summary[["Route", "Count", "Mean", "P50", "P90", "P99"]].round(1),
+            use_container_width=True, hide_index=True
+        )
 
     # =================================================================
     # Tab 4: コスト構造 (Waterfall) - 新規追加
     # =================================================================
     with tab4:
         st.subheader("着地原価 (Landed Cost) の内訳")
-        
-        # ウォーターフォール図用のデータ
+        if df_inventory is None:
+            st.info("部品データがないため着地原価を計算できません。")
+            return
+
+        # 全 SKU × 全経路（港→倉庫→店舗）を版ごとに 1 回だけ一括計算し、ここでは結果を引くだけ
+        with span("aggregate.landed_cost", cached=True):
+            catalog = product_catalog(df_inventory, version)
+            engine, store_costs = store_landed_costs(supply_chain_data, catalog, version)
+        col_sku, col_store = st.columns(2)
+        sku = col_sku.selectbox(
+            "部品", range(len(catalog)), format_func=lambda i: catalog["Product"].iloc[i], key="landed_cost_sku"
+        )
+        store = col_store.selectbox("店舗", [ALL_STORES] + engine.stores.tolist(), key="landed_cost_store")
+        with span("aggregate.landed_cost_breakdown"):
+            breakdown = engine.breakdown(sku, catalog, None if store == ALL_STORES else store)
+
+        values = breakdown.round().tolist()
         fig_water = go.Figure(go.Waterfall(
             name="Cost Breakdown", orientation="v",
-            measure=["relative", "relative", "relative", "relative", "relative", "total"],
-            x=["製造原価", "海上輸送費", "関税", "通関・港湾費", "国内配送費", "着地原価(Total)"],
+            measure=["relative"] * len(values) + ["total"],
+            x=COST_COMPONENTS + ["着地原価(Total)"],
             textposition="outside",
-            text=[5000, 500, 300, 100, 800, None],
-            y=[5000, 500, 300, 100, 800, 0],
+            text=[f"{v:,.0f}" for v in values] + [f"{sum(values):,.0f}"],
+            y=values + [0],
             connector={"line":{"color":"rgb(63, 63, 63)"}},
         ))
-        fig_water.update_layout(title="主力製品のコスト積み上げ分析", showlegend=False)
-        st.plotly_chart(fig_water, use_container_width=True)
\ No newline at end of file
+        fig_water.update_layout(
+            title=f"{catalog['Product'].iloc[sku]} のコスト積み上げ分析（{store}）", showlegend=False
+        )
+        with span("render.landed_cost"):
+            st.plotly_chart(fig_water, use_container_width=True)
+
+        st.markdown("#### 店舗別の着地原価ランキング")
+        with span("aggregate.landed_cost_ranking"):
+            df_ranking = engine.store_ranking(sku, store_costs, catalog)
+        show_paged_table(
+            "landed_cost_ranking",
+            frame_fetcher(df_ranking, {"cost": ("LandedCost", False), "markup": ("Markup", False),
+                                       "volume": ("Volume", False)}),
+            {"着地原価の高い順": "cost", "上乗せ率の高い順": "markup", "物量の多い順": "volume"},
+        )
+        st.caption(
+            f"{len(catalog):,} 部品 × {engine.n_paths:,} 経路の着地原価から、店舗に届く経路の物量で加重平均しています。"
+        )